@@ -0,0 +1,163 @@
+"""
+Structured access log.
+
+The middleware appends one tuple per request to an in-memory ring buffer and
+does no formatting or I/O on the request path. A flusher task running from the
+lifespan drains the buffer every ACCESS_LOG_FLUSH_INTERVAL seconds and writes
+the records as JSON lines, in one write per batch, to stdout or ACCESS_LOG_FILE.
+
+When the buffer is full the oldest records are dropped and counted, a slow
+log sink never holds up requests.
+"""
+
+import asyncio
+import json
+import sys
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from time import perf_counter, time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.api.core.metrics import request_seconds, requests_total
+from app.config import app_settings
+
+
+@dataclass(slots=True)
+class QueryStats:
+    """Database work done while serving one request"""
+
+    count: int = 0
+    seconds: float = 0.0
+    # Start of the statement in progress
+    started: float = 0.0
+
+
+_query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+# Registered on the Engine class, so it covers every engine of the process
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.started = perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += perf_counter() - stats.started
+
+
+FIELDS = ("ts", "method", "route", "status", "latency_us", "db_us", "queries")
+
+_records: deque[tuple] = deque(maxlen=app_settings.ACCESS_LOG_BUFFER_SIZE)
+dropped = 0
+
+
+class AccessLogMiddleware:
+    """
+    Plain ASGI middleware recording each HTTP request into the ring buffer
+    and the request metrics. The route is logged by its path template, e.g.
+    /shipment/{id}, so records group by endpoint and ids in urls stay out of
+    the log. Metrics are keyed by the route name.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = perf_counter()
+        stats = QueryStats()
+        token = _query_stats.set(stats)
+        status = 500
+        # Latency and database work up to the last byte of the response.
+        # Background tasks run after it within the same call, and are left out
+        sent = None
+
+        async def send_status(message: Message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                sent = (perf_counter(), stats.count, stats.seconds)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            _query_stats.reset(token)
+            end, queries, db_seconds = sent or (perf_counter(), stats.count, stats.seconds)
+            latency = end - start
+            route = scope.get("route")
+
+            name = route.name if route is not None else "unmatched"
+            request_seconds.observe(name, latency)
+            requests_total.inc(name, status)
+
+            global dropped
+            if len(_records) == _records.maxlen:
+                dropped += 1
+            _records.append(
+                (
+                    time(),
+                    scope["method"],
+                    route.path if route is not None else scope["path"],
+                    status,
+                    int(latency * 1_000_000),
+                    int(db_seconds * 1_000_000),
+                    queries,
+                )
+            )
+
+
+def buffered() -> int:
+    return len(_records)
+
+
+def drain_records() -> list[dict]:
+    """Take the buffered records, oldest first"""
+    records = []
+    while _records:
+        records.append(dict(zip(FIELDS, _records.popleft())))
+    return records
+
+
+def _write(lines: str):
+    if app_settings.ACCESS_LOG_FILE:
+        with open(app_settings.ACCESS_LOG_FILE, "a") as file:
+            file.write(lines)
+    else:
+        sys.stdout.write(lines)
+        sys.stdout.flush()
+
+
+async def flush():
+    """Write the buffered records as JSON lines"""
+    global dropped
+    records = drain_records()
+    if dropped:
+        records.append({"ts": time(), "dropped": dropped})
+        dropped = 0
+    if records:
+        lines = "".join(json.dumps(record) + "\n" for record in records)
+        await asyncio.to_thread(_write, lines)
+
+
+async def flush_periodically():
+    """Keep flushing the access log until cancelled"""
+    while True:
+        await asyncio.sleep(app_settings.ACCESS_LOG_FLUSH_INTERVAL)
+        try:
+            await flush()
+        except Exception as e:
+            print(f"[Access Log Flush Failed]: {e}")
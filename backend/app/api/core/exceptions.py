@@ -36,6 +36,20 @@ class DeliveryPartnerNotAvailableError(ShippinError):
 class NothingToUpdateError(ShippinError):
     """No data provided to update"""
 
+class InvalidCursorError(ShippinError):
+    """Pagination cursor is invalid"""
+
+class InvalidStatusUpdateError(ShippinError):
+    """Shipment can't be moved to the requested status"""
+
+class ReviewAlreadySubmittedError(ShippinError):
+    """Shipment has already been reviewed"""
+    status=status.HTTP_409_CONFLICT
+
+class TooManySubscribersError(ShippinError):
+    """Too many live tracking connections, try again later"""
+    status=status.HTTP_503_SERVICE_UNAVAILABLE
+
 def _get_exception_handler(status:int, detail:str):
     def handler(request:Request, exception:Exception)->Response:
         raise HTTPException(
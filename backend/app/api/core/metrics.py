@@ -0,0 +1,103 @@
+"""
+In-process metrics in the Prometheus text format, served at /metrics.
+
+Metrics are only updated from the event loop thread, so they are plain lists
+and dicts without locks. Recording a value is a bisect and two additions.
+"""
+
+from bisect import bisect_left
+from typing import Iterator
+
+# Seconds
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CALL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+_registry: list["Histogram | Counter"] = []
+
+
+class Histogram:
+    """Observations counted into buckets, one series per value of its label"""
+
+    def __init__(self, name: str, documentation: str, label: str, buckets: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = buckets
+        # Count per bucket, of values above the last bucket, then their sum
+        self._series: dict[str, list[float]] = {}
+        _registry.append(self)
+
+    def observe(self, label: str, value: float):
+        series = self._series.get(label)
+        if series is None:
+            series = self._series[label] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for label, series in self._series.items():
+            labels = f'{self.label}="{label}"'
+            count = 0
+            for bucket, observed in zip(self.buckets, series):
+                count += observed
+                yield f'{self.name}_bucket{{{labels},le="{bucket}"}} {count}'
+            count += series[-2]
+            yield f'{self.name}_bucket{{{labels},le="+Inf"}} {count}'
+            yield f"{self.name}_sum{{{labels}}} {series[-1]}"
+            yield f"{self.name}_count{{{labels}}} {count}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: dict[tuple, int] = {}
+        _registry.append(self)
+
+    def inc(self, *labels):
+        self._values[labels] = self._values.get(labels, 0) + 1
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for values, count in self._values.items():
+            labels = ",".join(f'{name}="{value}"' for name, value in zip(self.labels, values))
+            yield f"{self.name}{{{labels}}} {count}"
+
+
+def gauge(name: str, documentation: str, value: float) -> Iterator[str]:
+    """Gauge read when the metrics are scraped"""
+    yield f"# HELP {name} {documentation}"
+    yield f"# TYPE {name} gauge"
+    yield f"{name} {value}"
+
+
+def render() -> Iterator[str]:
+    for metric in _registry:
+        yield from metric.render()
+
+
+request_seconds = Histogram(
+    "shippin_request_duration_seconds", "HTTP request latency", "route", REQUEST_BUCKETS
+)
+requests_total = Counter(
+    "shippin_requests_total", "HTTP requests served", ("route", "status")
+)
+db_checkout_wait_seconds = Histogram(
+    "shippin_db_pool_checkout_wait_seconds",
+    "Wait for a database connection from the pool",
+    "pool",
+    CALL_BUCKETS,
+)
+db_checkout_held_seconds = Histogram(
+    "shippin_db_pool_checkout_held_seconds",
+    "Time a database connection is checked out of the pool",
+    "pool",
+    REQUEST_BUCKETS,
+)
+redis_command_seconds = Histogram(
+    "shippin_redis_command_duration_seconds", "Redis command latency", "command", CALL_BUCKETS
+)
@@ -1,9 +1,75 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from time import perf_counter
+
 from fastapi.security import OAuth2PasswordBearer
+from passlib.context import CryptContext
 from pydantic import BaseModel
 
+from app.config import security_settings
+
 oauth2_scheme_seller =OAuth2PasswordBearer(tokenUrl="/seller/login",scheme_name="Seller Authentication")
 oauth2_scheme_partner =OAuth2PasswordBearer(tokenUrl="/partner/login",scheme_name="Delivery Partner Authentication")
 
 class TokenData(BaseModel):
     access_token:str
-    token_type:str
\ No newline at end of file
+    token_type:str
+
+
+password_context = CryptContext(schemes="bcrypt", deprecated="auto")
+
+# bcrypt is CPU bound for tens of milliseconds per call. It runs on its own
+# bounded pool, so a burst of logins queues up there instead of blocking the
+# event loop for every other request on the worker.
+_hashing_pool = ThreadPoolExecutor(
+    max_workers=security_settings.PASSWORD_HASH_CONCURRENCY,
+    thread_name_prefix="password-hashing",
+)
+
+
+@dataclass
+class PasswordHashingStats:
+    """Load on the password hashing pool"""
+    waiting: int = 0
+    completed: int = 0
+    queue_seconds_total: float = 0.0
+    queue_seconds_max: float = 0.0
+
+
+password_hashing_stats = PasswordHashingStats()
+
+
+async def _run_hashing(function, *args):
+    submitted = perf_counter()
+
+    def job():
+        # Time spent waiting for a free worker, measured once one picks it up
+        return perf_counter() - submitted, function(*args)
+
+    password_hashing_stats.waiting += 1
+    try:
+        queued, result = await asyncio.get_running_loop().run_in_executor(
+            _hashing_pool, job
+        )
+    finally:
+        password_hashing_stats.waiting -= 1
+
+    password_hashing_stats.completed += 1
+    password_hashing_stats.queue_seconds_total += queued
+    password_hashing_stats.queue_seconds_max = max(
+        password_hashing_stats.queue_seconds_max, queued
+    )
+    return result
+
+
+async def hash_password(password: str) -> str:
+    return await _run_hashing(password_context.hash, password)
+
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    return await _run_hashing(password_context.verify, password, password_hash)
+
+
+def shutdown_hashing_pool():
+    _hashing_pool.shutdown(wait=False, cancel_futures=True)
@@ -1,23 +1,41 @@
+from secrets import compare_digest
 from typing import Annotated
 from uuid import UUID
 
-from fastapi import BackgroundTasks, Depends
+from fastapi import BackgroundTasks, Depends, Header
 
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
 
-from app.api.core.exceptions import ClientNotAuthorizedError, InvalidTokenError
+from app.api.core.exceptions import ClientNotAuthorizedError, EntityNotFoundError, InvalidTokenError
 from app.api.core.security import oauth2_scheme_partner, oauth2_scheme_seller
+from app.config import app_settings
 from app.database.models import DeliveryPartner, Seller
 from app.database.redis import is_jti_blacklisted
-from app.database.session import create_session
+from app.database.session import create_session, get_session_factory
 from app.services.delivery_partner import DeliveryPartnerService
+from app.services.partner_stats import PartnerStatsService
+from app.services.principal import Principal, get_principal
 from app.services.seller import SellerService
+from app.services.seller_stats import SellerStatsService
 from app.services.shipment import ShipmentService
 from app.services.shipment_event import ShipmentEventService
 from app.utils import decode_access_token
 
 # Async Database session dependency
 SessionDep = Annotated[AsyncSession, Depends(create_session)]
+# Session factory for work continuing after the response has started
+SessionFactoryDep = Annotated[sessionmaker, Depends(get_session_factory)]
+
+
+# Metrics scraper, authenticated by the configured token
+async def verify_metrics_token(authorization: Annotated[str | None, Header()] = None):
+    if not app_settings.METRICS_TOKEN:
+        raise EntityNotFoundError()
+    if authorization is None or not compare_digest(
+        authorization, f"Bearer {app_settings.METRICS_TOKEN}"
+    ):
+        raise ClientNotAuthorizedError()
 
 
 # Access token data dependency
@@ -41,12 +59,12 @@ async def get_partner_access_token(
     return await _get_access_token(token)
 
 
-# Logged in Seller
+# Logged in Seller, routes needing the full entity load it explicitly
 async def get_seller(
     token_data: Annotated[dict, Depends(get_seller_access_token)],
     session: SessionDep,
 ):
-    seller = await session.get(Seller, UUID(token_data["user"]["id"]))
+    seller = await get_principal(session, Seller, UUID(token_data["user"]["id"]))
 
     if seller is None:
         raise ClientNotAuthorizedError()
@@ -58,7 +76,9 @@ async def get_partner(
     token_data: Annotated[dict, Depends(get_partner_access_token)],
     session: SessionDep,
 ):
-    partner = await session.get(DeliveryPartner, UUID(token_data["user"]["id"]))
+    partner = await get_principal(
+        session, DeliveryPartner, UUID(token_data["user"]["id"])
+    )
 
     if partner is None:
         raise ClientNotAuthorizedError()
@@ -66,13 +86,27 @@ async def get_partner(
     return partner
 
 
+# Logged in seller or delivery partner, for routes serving both. Their ids
+# never collide, the token is looked up as a seller first
+async def get_seller_or_partner(
+    token_data: Annotated[dict, Depends(get_seller_access_token)],
+    session: SessionDep,
+) -> tuple[type[Seller | DeliveryPartner], Principal]:
+    id = UUID(token_data["user"]["id"])
+    for model in (Seller, DeliveryPartner):
+        principal = await get_principal(session, model, id)
+        if principal is not None:
+            return model, principal
+
+    raise ClientNotAuthorizedError()
+
 
 # Shipment service dep
 def get_shipment_service(session: SessionDep, tasks: BackgroundTasks):
     return ShipmentService(
         session,
         DeliveryPartnerService(session,tasks),
-        ShipmentEventService(session,tasks),
+        ShipmentEventService(session, tasks),
 
     )
 
@@ -82,14 +116,27 @@ def get_seller_service(session: SessionDep, tasks:BackgroundTasks):
     return SellerService(session,tasks)
 
 
+def get_seller_stats_service(session: SessionDep):
+    return SellerStatsService(session)
+
+
+def get_partner_stats_service(session: SessionDep):
+    return PartnerStatsService(session)
+
+
 def get_delivery_partner_service(session: SessionDep, tasks:BackgroundTasks):
     return DeliveryPartnerService(session,tasks)
 
 
-SellerDep = Annotated[Seller, Depends(get_seller)]
-DeliveryPartnerDep = Annotated[DeliveryPartner, Depends(get_partner)]
+SellerDep = Annotated[Principal, Depends(get_seller)]
+DeliveryPartnerDep = Annotated[Principal, Depends(get_partner)]
+SellerOrPartnerDep = Annotated[
+    tuple[type[Seller | DeliveryPartner], Principal], Depends(get_seller_or_partner)
+]
 ShipmentServiceDep = Annotated[ShipmentService, Depends(get_shipment_service)]
 SellerServiceDep = Annotated[SellerService, Depends(get_seller_service)]
+SellerStatsServiceDep = Annotated[SellerStatsService, Depends(get_seller_stats_service)]
 DeliveryPartnerServiceDep = Annotated[
     DeliveryPartnerService, Depends(get_delivery_partner_service)
 ]
+PartnerStatsServiceDep = Annotated[PartnerStatsService, Depends(get_partner_stats_service)]
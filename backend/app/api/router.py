@@ -1,7 +1,8 @@
-from .routers import seller, shipment, delivery_partner
+from .routers import seller, shipment, delivery_partner, metrics
 from fastapi import APIRouter
 
 master_router = APIRouter()
 master_router.include_router(seller.router)
 master_router.include_router(shipment.router)
-master_router.include_router(delivery_partner.router)
\ No newline at end of file
+master_router.include_router(delivery_partner.router)
+master_router.include_router(metrics.router)
\ No newline at end of file
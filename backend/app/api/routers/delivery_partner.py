@@ -1,6 +1,7 @@
 from typing import Annotated
+from uuid import UUID
 
-from fastapi import APIRouter, Depends, Form, Request
+from fastapi import APIRouter, Depends, Form, Query, Request, Response
 from fastapi.responses import RedirectResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.templating import Jinja2Templates
@@ -11,15 +12,20 @@ from app.api.core.security import TokenData
 from app.api.dependencies import (
     DeliveryPartnerDep,
     DeliveryPartnerServiceDep,
+    PartnerStatsServiceDep,
+    ShipmentServiceDep,
     get_partner_access_token,
 )
 from app.api.schemas.delivery_partner import (
     DeliveryPartnerCreate,
     DeliveryPartnerRead,
+    DeliveryPartnerStats,
     DeliveryPartnerUpdate,
 )
-from app.api.schemas.shipment import ShipmentRead
+from app.api.schemas.shipment import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, ShipmentRead
+from app.database.models import DeliveryPartner, Shipment, ShipmentStatus
 from app.database.redis import add_jti_to_blacklist
+from app.services.principal import invalidate_principal
 from app.utils import TEMPLATE_DIR
 from app.config import app_settings
 
@@ -62,7 +68,8 @@ async def update_delivery_partner(
     update = partner_update.model_dump(exclude_none=True)
     if not update:
         raise NothingToUpdateError()
-    return await service.update(partner.sqlmodel_update(update))
+    entity = await service.get(partner.id)
+    return await service.update(entity.sqlmodel_update(update))
 
 
 # Logout the delivery partner by blacklisting the token
@@ -70,7 +77,8 @@ async def update_delivery_partner(
 async def logout_delivery_partner(
     token_data: Annotated[dict, Depends(get_partner_access_token)],
 ):
-    await add_jti_to_blacklist(token_data["jti"])
+    await add_jti_to_blacklist(token_data["jti"], token_data["exp"])
+    await invalidate_principal(DeliveryPartner, UUID(token_data["user"]["id"]))
     return {"detail": "Successfully logged out"}
 
 @router.get("/forgot_password")
@@ -110,11 +118,31 @@ async def reset_delivery_partner_password(
 
 # Get logged in deliver partner profile
 @router.get("/me", response_model=DeliveryPartnerRead)
-async def get_partner_profile(partner: DeliveryPartnerDep):
-    return partner
+async def get_partner_profile(
+    partner: DeliveryPartnerDep, service: DeliveryPartnerServiceDep
+):
+    return await service.get(partner.id)
+
+# Ratings and delivery performance of the logged in partner
+@router.get("/stats", response_model=DeliveryPartnerStats)
+async def get_partner_stats(partner: DeliveryPartnerDep, service: PartnerStatsServiceDep):
+    return await service.get(partner.id)
 
 @router.get("/shipments", response_model=list[ShipmentRead])
 async def get_partner_shipments(
     partner: DeliveryPartnerDep,
+    service: ShipmentServiceDep,
+    response: Response,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    cursor: str | None = None,
+    status: ShipmentStatus | None = None,
 ):
-    return partner.shipments
\ No newline at end of file
+    shipments, next_cursor = await service.get_page(
+        Shipment.delivery_partner_id == partner.id,
+        *([Shipment.status == status] if status else []),
+        limit=limit,
+        cursor=cursor,
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return shipments
\ No newline at end of file
@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from app.api.core import access_log, metrics
+from app.api.core.security import password_hashing_stats
+from app.api.dependencies import verify_metrics_token
+from app.database.session import engine
+from app.services import stream
+from app.services.notification import get_dispatcher
+from app.worker import outbox
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    include_in_schema=False,
+    dependencies=[Depends(verify_metrics_token)],
+)
+async def get_metrics():
+    pool = engine.pool
+
+    lines = [
+        *metrics.render(),
+        *metrics.gauge(
+            "shippin_db_pool_checked_out", "Database connections in use", pool.checkedout()
+        ),
+        *metrics.gauge(
+            "shippin_db_pool_overflow", "Database connections beyond the pool size", pool.overflow()
+        ),
+        *metrics.gauge(
+            "shippin_outbox_pending",
+            "Notifications waiting in the outbox, as last counted by the drainer",
+            outbox.backlog,
+        ),
+        *metrics.gauge(
+            "shippin_email_tasks_queued",
+            "Emails queued as background tasks and not sent yet",
+            get_dispatcher().queued,
+        ),
+        *metrics.gauge(
+            "shippin_password_hash_waiting",
+            "Password hashes waiting for a hashing thread",
+            password_hashing_stats.waiting,
+        ),
+        *metrics.gauge(
+            "shippin_password_hash_queue_seconds_max",
+            "Longest wait for a hashing thread",
+            password_hashing_stats.queue_seconds_max,
+        ),
+        *metrics.gauge(
+            "shippin_stream_subscriptions",
+            "Open live tracking connections",
+            stream.subscriptions(),
+        ),
+        *metrics.gauge(
+            "shippin_access_log_buffered",
+            "Access log records waiting to be flushed",
+            access_log.buffered(),
+        ),
+    ]
+    return "\n".join(lines) + "\n"
@@ -1,18 +1,30 @@
-from typing import Annotated
+from datetime import datetime
+from typing import Annotated, Literal
+from uuid import UUID
 
-from fastapi import APIRouter, Depends, Form, Request
-from fastapi.responses import RedirectResponse
+from fastapi import APIRouter, Depends, Form, Query, Request, Response
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.templating import Jinja2Templates
 from pydantic import EmailStr
 
 from app.api.core.exceptions import InvalidTokenError
 from app.api.core.security import TokenData
-from app.api.dependencies import SellerDep, SellerServiceDep, get_seller_access_token
-from app.api.schemas.seller import SellerCreate, SellerRead
-from app.api.schemas.shipment import ShipmentRead
+from app.api.dependencies import (
+    SellerDep,
+    SellerServiceDep,
+    SellerStatsServiceDep,
+    SessionFactoryDep,
+    ShipmentServiceDep,
+    get_seller_access_token,
+)
+from app.api.schemas.seller import SellerCreate, SellerRead, SellerStats
+from app.api.schemas.shipment import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, ShipmentRead
 from app.config import app_settings
+from app.database.models import Seller, Shipment, ShipmentStatus
 from app.database.redis import add_jti_to_blacklist
+from app.services.export import EXPORT_FORMATS, export_shipments
+from app.services.principal import invalidate_principal
 from app.utils import TEMPLATE_DIR
 
 router = APIRouter(prefix="/seller", tags=["Seller"])
@@ -81,7 +93,8 @@ async def login_seller(
 async def logout_seller(
     token_data: Annotated[dict, Depends(get_seller_access_token)],
 ):
-    await add_jti_to_blacklist(token_data["jti"])
+    await add_jti_to_blacklist(token_data["jti"], token_data["exp"])
+    await invalidate_principal(Seller, UUID(token_data["user"]["id"]))
     return {"detail": "Successfully logged out"}
 
 # Get logged in seller profile
@@ -92,6 +105,59 @@ async def get_seller_profile(seller:SellerDep):
 @router.get("/shipments", response_model=list[ShipmentRead])
 async def get_seller_shipments(
     seller: SellerDep,
+    service: ShipmentServiceDep,
+    response: Response,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    cursor: str | None = None,
+    status: ShipmentStatus | None = None,
 ):
-    return seller.shipments
-    
\ No newline at end of file
+    shipments, next_cursor = await service.get_page(
+        Shipment.seller_id == seller.id,
+        *([Shipment.status == status] if status else []),
+        limit=limit,
+        cursor=cursor,
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return shipments
+
+# Dashboard counts of the seller's shipments, read from counters kept up to date
+@router.get("/stats", response_model=SellerStats)
+async def get_seller_stats(
+    seller: SellerDep,
+    service: SellerStatsServiceDep,
+    days: Annotated[int, Query(ge=1, le=365)] = 30,
+):
+    return await service.get(seller.id, days)
+
+# Stream all shipments of the seller, e.g. to reconcile them nightly
+@router.get("/shipments/export", response_class=StreamingResponse)
+async def export_seller_shipments(
+    request: Request,
+    seller: SellerDep,
+    session_factory: SessionFactoryDep,
+    format: Literal["csv", "ndjson"] = "csv",
+    since: Annotated[
+        datetime | None, Query(description="Only shipments with an event since then")
+    ] = None,
+):
+    gzip = "gzip" in request.headers.get("accept-encoding", "")
+    headers = {
+        "Content-Disposition": f'attachment; filename="shipments.{format}"',
+        "Vary": "Accept-Encoding",
+    }
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+
+    return StreamingResponse(
+        export_shipments(
+            session_factory,
+            Shipment.seller_id == seller.id,
+            *([Shipment.last_event_at >= since] if since else []),
+            format=format,
+            gzip=gzip,
+        ),
+        media_type=EXPORT_FORMATS[format],
+        headers=headers,
+    )
+
@@ -1,23 +1,55 @@
-from typing import Annotated
+from datetime import datetime
+from typing import Annotated, Literal
 from uuid import UUID
 
-from fastapi import APIRouter, Form, Request, status
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    File,
+    Form,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+    WebSocket,
+    status,
+)
+from fastapi.responses import StreamingResponse
 from fastapi.templating import Jinja2Templates
 
-from app.api.core.exceptions import NothingToUpdateError
+from app.api.core.exceptions import NothingToUpdateError, TooManySubscribersError
 from app.api.dependencies import (
     DeliveryPartnerDep,
     SellerDep,
-    SessionDep,
+    SellerOrPartnerDep,
+    SessionFactoryDep,
     ShipmentServiceDep,
 )
 from app.api.schemas.shipment import (
+    DEFAULT_PAGE_SIZE,
+    MAX_BATCH_SIZE,
+    MAX_PAGE_SIZE,
+    ShipmentBatchResult,
     ShipmentCancel,
     ShipmentCreate,
+    ShipmentImportRead,
+    ShipmentScan,
+    ShipmentScanResult,
+    ShipmentTagBatch,
+    ShipmentTagBatchResult,
     ShipmentUpdate,
     ShipmentRead,
 )
-from app.database.models import Shipment, TagName
+from app.database.models import Seller, Shipment, ShipmentStatus, TagName
+from app.services.shipment_import import get_import, start_import
+from app.services.stream import (
+    STREAM_MAX_SUBSCRIPTIONS,
+    sse_events,
+    subscriptions,
+    websocket_events,
+)
+from app.services.tracking import tracking_response
 from app.utils import TEMPLATE_DIR
 from app.config import app_settings
 
@@ -25,32 +57,54 @@ templates = Jinja2Templates(TEMPLATE_DIR)
 
 router = APIRouter(prefix="/shipment", tags=["Shipment"])
 
-# Get shipment details
+# Get shipment details, cached and conditional on its ETag
 @router.get("/", response_model=ShipmentRead)
 async def get_shipment(
+    request: Request,
     id: UUID,
     service: ShipmentServiceDep,
 ):
-    return await service.get(id)
+    async def render() -> bytes:
+        shipment = await service.get(id)
+        return ShipmentRead.model_validate(shipment, from_attributes=True).model_dump_json().encode()
 
-#Track shipment status page
+    return await tracking_response(request, id, "json", "application/json", render)
+
+#Track shipment status page, cached and conditional on its ETag
 @router.get("/track", include_in_schema=False)
 async def track_shipment(
     request: Request,
     id: UUID,
     service: ShipmentServiceDep,
 ):
-    shipment = await service.get(id)
-    context = shipment.model_dump() if shipment else {}
-    context["status"] = shipment.status
-    context["partner"] = shipment.delivery_partner.name
-    context["timeline"] = shipment.timeline
-    context["timeline"].reverse()
+    async def render() -> bytes:
+        shipment = await service.get(id)
+        context = shipment.model_dump()
+        context["status"] = shipment.status
+        context["partner"] = shipment.delivery_partner.name
+        context["timeline"] = shipment.timeline[::-1]
+        return templates.get_template("track.html").render(context).encode()
 
-    return templates.TemplateResponse(
-        request=request, name="track.html", context=context
+    return await tracking_response(request, id, "html", "text/html; charset=utf-8", render)
+
+# Live events of a shipment as Server-Sent Events
+@router.get("/stream", response_class=StreamingResponse)
+async def stream_shipment(id: UUID):
+    if subscriptions() >= STREAM_MAX_SUBSCRIPTIONS:
+        raise TooManySubscribersError()
+
+    return StreamingResponse(
+        sse_events(id),
+        media_type="text/event-stream",
+        # Proxies must pass events on as they come
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
+# Live events of many shipments over a WebSocket, for dashboards
+@router.websocket("/stream/ws")
+async def stream_shipments(websocket: WebSocket):
+    await websocket_events(websocket)
+
 # Submit a new shipment request
 @router.post(
     "/submit",
@@ -66,6 +120,43 @@ async def submit_shipment(
 ) -> Shipment:
     return await service.add(shipment, seller)
 
+# Submit many shipment requests at once
+@router.post(
+    "/submit/batch",
+    response_model=list[ShipmentBatchResult],
+    name="Create Shipment Batch",
+    description=f"Submit up to {MAX_BATCH_SIZE} **shipment** requests, the result of each is reported by its index",
+)
+async def submit_shipment_batch(
+    seller: SellerDep,
+    shipments: Annotated[list[ShipmentCreate], Body(min_length=1, max_length=MAX_BATCH_SIZE)],
+    service: ShipmentServiceDep,
+):
+    return await service.add_batch(shipments, seller)
+
+# Import shipments from a CSV or NDJSON file, in the background
+@router.post(
+    "/import",
+    status_code=status.HTTP_202_ACCEPTED,
+    name="Import Shipments",
+    description="Import **shipments** from a CSV file with a header row, or NDJSON. Rows have the fields of a shipment submission, and optionally the status, created_at and estimated_delivery of past shipments. Delivered and cancelled ones take no partner capacity. Progress is reported by the returned job id",
+)
+async def import_shipments(
+    seller: SellerDep,
+    file: Annotated[UploadFile, File()],
+    session_factory: SessionFactoryDep,
+    format: Literal["csv", "ndjson"] | None = None,
+):
+    if format is None:
+        format = "ndjson" if (file.filename or "").endswith((".ndjson", ".jsonl")) else "csv"
+
+    return {"id": await start_import(file, format, seller, session_factory)}
+
+# Progress of a shipment import
+@router.get("/import", response_model=ShipmentImportRead)
+async def get_shipment_import(id: UUID, seller: SellerDep):
+    return await get_import(id, seller)
+
 # Update shipment details
 @router.patch("/update", response_model=ShipmentRead)
 async def shipment_update(
@@ -80,6 +171,20 @@ async def shipment_update(
 
     return await service.update(id, shipmentUpdate, partner)
 
+# Apply many scans of the partner's shipments at once
+@router.post(
+    "/update/batch",
+    response_model=list[ShipmentScanResult],
+    name="Update Shipment Batch",
+    description=f"Apply up to {MAX_BATCH_SIZE} **shipment** scans, the result of each is reported by its index",
+)
+async def shipment_update_batch(
+    scans: Annotated[list[ShipmentScan], Body(min_length=1, max_length=MAX_BATCH_SIZE)],
+    service: ShipmentServiceDep,
+    partner: DeliveryPartnerDep,
+):
+    return await service.update_batch(scans, partner)
+
 # Add tag to shipment
 @router.get("/tag", response_model=ShipmentRead)
 async def add_tag_to_shipment(id: UUID, tag: TagName, service: ShipmentServiceDep):
@@ -90,11 +195,62 @@ async def add_tag_to_shipment(id: UUID, tag: TagName, service: ShipmentServiceDe
 async def remove_tag_from_shipment(id: UUID, tag: TagName, service: ShipmentServiceDep):
     return await service.remove_tag(id, tag)
 
-# Get shipments by tag
+# Add or remove a tag on many shipments
+@router.post(
+    "/tag/batch",
+    response_model=ShipmentTagBatchResult,
+    name="Tag Shipment Batch",
+    description=f"Add or remove a tag on up to {MAX_BATCH_SIZE} of the seller's **shipments** in one statement",
+)
+async def tag_shipment_batch(
+    batch: ShipmentTagBatch, service: ShipmentServiceDep, seller: SellerDep
+):
+    return {"updated": await service.tag_batch(batch.ids, batch.tag, seller, batch.remove)}
+
+# Filters of the shipments by tag, scoped to the caller's shipments
+def tagged_criteria(
+    owner: SellerOrPartnerDep,
+    status: ShipmentStatus | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+) -> list:
+    model, principal = owner
+    criteria = [
+        Shipment.seller_id == principal.id
+        if model is Seller
+        else Shipment.delivery_partner_id == principal.id
+    ]
+    if status:
+        criteria.append(Shipment.status == status)
+    if created_after:
+        criteria.append(Shipment.created_at >= created_after)
+    if created_before:
+        criteria.append(Shipment.created_at < created_before)
+    return criteria
+
+TaggedCriteriaDep = Annotated[list, Depends(tagged_criteria)]
+
+# Get shipments by tag, newest first, the next page's cursor is in X-Next-Cursor
 @router.get("/tagged", response_model=list[ShipmentRead])
-async def get_shipments_by_tag(tag_name: TagName, session: SessionDep):
-    tag = await tag_name.tag(session)
-    return tag.shipments
+async def get_shipments_by_tag(
+    tag_name: TagName,
+    criteria: TaggedCriteriaDep,
+    service: ShipmentServiceDep,
+    response: Response,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    cursor: str | None = None,
+):
+    shipments, next_cursor = await service.get_tagged_page(
+        tag_name, *criteria, limit=limit, cursor=cursor
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return shipments
+
+# Count shipments by tag
+@router.get("/tagged/counts", response_model=dict[TagName, int])
+async def count_shipments_by_tag(criteria: TaggedCriteriaDep, service: ShipmentServiceDep):
+    return await service.count_by_tag(*criteria)
 
 # Cancel shipment
 @router.post("/cancel", response_model=ShipmentRead)
@@ -16,4 +16,13 @@ class DeliveryPartnerUpdate(BaseModel):
     max_handling_capacity: int | None = Field(default=None)
 
 class DeliveryPartnerCreate(BaseDeliveryPartner):
-    password: str
\ No newline at end of file
+    password: str
+
+class DeliveryPartnerStats(BaseModel):
+    review_count: int
+    average_rating: float | None
+    delivered: int
+    delivered_on_time: int
+    on_time_rate: float | None
+    # From placed to delivered
+    mean_delivery_seconds: float | None
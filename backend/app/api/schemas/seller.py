@@ -1,7 +1,12 @@
 
 
+from datetime import date
+
 from pydantic import BaseModel, EmailStr, Field
 
+from app.database.models import ShipmentStatus
+
+
 class BaseSeller(BaseModel):
     name: str
     email: EmailStr
@@ -12,4 +17,19 @@ class SellerRead(BaseSeller):
 class SellerCreate(BaseSeller):
     password: str
     address: str | None =Field(default=None)
-    zipcode: int | None=Field(default=None)
\ No newline at end of file
+    zipcode: int | None=Field(default=None)
+
+
+class SellerDailyStats(BaseModel):
+    """Shipments that reached each status on the day"""
+    day: date
+    counts: dict[ShipmentStatus, int]
+
+class SellerStats(BaseModel):
+    # Shipments currently in each status
+    counts: dict[ShipmentStatus, int]
+    # Days with any activity in the period, oldest first
+    daily: list[SellerDailyStats]
+    delivered: int
+    delivered_on_time: int
+    on_time_rate: float | None
@@ -1,8 +1,22 @@
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import Annotated, Literal
 from uuid import UUID
-from pydantic import BaseModel, EmailStr,Field
+from pydantic import AfterValidator, BaseModel, EmailStr,Field
 from app.database.models import ShipmentEvent, ShipmentStatus, TagName
 
+MAX_BATCH_SIZE = 1000
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _naive_utc(value: datetime) -> datetime:
+        # Timestamps are stored and compared without a timezone, in UTC
+        if value.tzinfo is not None:
+                value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+# Datetime sent by a client, with or without an offset
+ClientDatetime = Annotated[datetime, AfterValidator(_naive_utc)]
 
 
 
@@ -18,6 +32,7 @@ class TagRead(BaseModel):
 
 class ShipmentRead(BaseShipment):
         id: UUID
+        status: ShipmentStatus
         timeline: list[ShipmentEvent]
         estimated_delivery: datetime
         tags: list[TagRead]
@@ -29,12 +44,68 @@ class ShipmentCreate(BaseShipment):
        customer_phone: str | None = Field(default=None)
 
 
+class ShipmentImportRow(ShipmentCreate):
+       """A shipment of an import, new or from the seller's history"""
+       status: ShipmentStatus = Field(default=ShipmentStatus.placed)
+       created_at: ClientDatetime | None = Field(default=None)
+       estimated_delivery: ClientDatetime | None = Field(default=None)
+
+
+class ShipmentBatchResult(BaseModel):
+        """Outcome of a single shipment in a batch submission"""
+        index: int
+        id: UUID | None = Field(default=None)
+        error: str | None = Field(default=None)
+
+
 class ShipmentUpdate(BaseModel):
         location: int | None = Field(default=None)
         status: ShipmentStatus | None = Field(default=None)
         verification_code: int | None = Field(default=None)
         description: str | None = Field(default=None)
-        estimated_delivery: datetime | None = Field(default=None)
+        estimated_delivery: ClientDatetime | None = Field(default=None)
+
+class ShipmentTagBatch(BaseModel):
+        """Tag to add to, or remove from, many shipments of the seller"""
+        ids: list[UUID] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+        tag: TagName
+        remove: bool = Field(default=False)
+
+
+class ShipmentTagBatchResult(BaseModel):
+        """Shipments that were tagged, or untagged"""
+        updated: int
+
+
+class ShipmentScan(BaseModel):
+        """Scan of a shipment by its delivery partner, e.g. at a hub"""
+        id: UUID
+        location: int
+        status: ShipmentStatus | None = Field(default=None)
+        verification_code: int | None = Field(default=None)
+        description: str | None = Field(default=None)
+
+
+class ShipmentScanResult(BaseModel):
+        """Outcome of a single scan in a batch, by its index"""
+        index: int
+        status: ShipmentStatus | None = Field(default=None)
+        error: str | None = Field(default=None)
+
+class ShipmentImportError(BaseModel):
+        """Row of an import that was rejected, numbered from 1"""
+        row: int
+        error: str
+
+
+class ShipmentImportRead(BaseModel):
+        """Progress of a shipment import"""
+        id: UUID
+        status: Literal["running", "completed", "failed"]
+        rows: int
+        imported: int
+        failed: int
+        errors: list[ShipmentImportError]
 
 class ShipmentCancel(BaseModel):
         id: UUID
@@ -26,6 +26,10 @@ class DatabaseSettings(BaseSettings):
 class SecuritySettings(BaseSettings):
     JWT_SECRET : str
     JWT_ALGORITHM: str
+    # Passwords hashed or verified at the same time per worker process
+    PASSWORD_HASH_CONCURRENCY: int = 2
+    # Seconds an authenticated principal is served from the in-process cache
+    PRINCIPAL_CACHE_TTL: int = 30
 
     model_config = _base_config
 
@@ -42,10 +46,21 @@ class NotificationsSettings(BaseSettings):
     VALIDATE_CERTS: bool = True
 
     RESEND_API_KEY: str
+    RESEND_API_URL: str = "https://api.resend.com"
 
     TWILIO_SID: str
     TWILIO_AUTH_TOKEN: str
     TWILIO_NUMBER: str
+    TWILIO_API_URL: str = "https://api.twilio.com"
+
+    # Email backend, "resend" or "smtp"
+    EMAIL_PROVIDER: str = "resend"
+    # Calls in flight per provider and worker process
+    RESEND_CONCURRENCY: int = 8
+    SMTP_CONCURRENCY: int = 4
+    TWILIO_CONCURRENCY: int = 8
+    # Pooled HTTP connections kept open to the providers
+    PROVIDER_MAX_CONNECTIONS: int = 32
 
     model_config = _base_config
 
@@ -55,6 +70,16 @@ class AppSettings(BaseSettings):
     APP_DOMAIN: str = "localhost:5173"
     BACKEND_APP_DOMAIN: str="localhost:8000"
 
+    # Access log records are written as JSON lines here, or to stdout if unset
+    ACCESS_LOG_FILE: str | None = None
+    # Records buffered between flushes, the oldest are dropped beyond it
+    ACCESS_LOG_BUFFER_SIZE: int = 10_000
+    ACCESS_LOG_FLUSH_INTERVAL: float = 1.0
+    # Bearer token of the metrics scrapers, /metrics is not served if unset
+    METRICS_TOKEN: str | None = None
+
+    model_config = _base_config
+
 database_settings = DatabaseSettings()
 security_settings = SecuritySettings()
 notifications_settings = NotificationsSettings()
@@ -1,12 +1,11 @@
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
 from uuid import UUID, uuid4
 
 from pydantic import EmailStr
-from sqlalchemy import Column
+from sqlalchemy import JSON, Column, Index
 from sqlalchemy.dialects import postgresql
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlmodel import Field, Relationship, SQLModel, select
+from sqlmodel import Field, Relationship, SQLModel
 
 
 
@@ -17,6 +16,15 @@ class ShipmentStatus(str, Enum):
     delivered = "delivered"
     cancelled = "cancelled"
 
+class NotificationChannel(str, Enum):
+    email = "email"
+    sms = "sms"
+
+class NotificationStatus(str, Enum):
+    pending = "pending"
+    sent = "sent"
+    failed = "failed"
+
 class TagName(str, Enum):
     EXPRESS = "express"
     STANDARD = "standard"
@@ -27,21 +35,19 @@ class TagName(str, Enum):
     TEMPERATURE_SENSITIVE = "temperature_sensitive"
     RETURN = "return"
 
-    async def tag(self,session:AsyncSession):
-        return await session.scalar(
-            select(Tag).where(Tag.name==self.value)
-        )
-
 
 
 class User(SQLModel):
     name: str
-    email: EmailStr
+    email: EmailStr = Field(index=True)
     email_verified: bool = Field(default=False)
     password_hash: str
 
 class ShipmentTag(SQLModel, table=True):
     __tablename__ = "shipment_tag"
+    __table_args__ = (
+        Index("ix_shipment_tag_tag_id_shipment_id", "tag_id", "shipment_id"),
+    )
 
     shipment_id: UUID = Field(foreign_key="shipment.id", primary_key=True)
     tag_id: UUID = Field(foreign_key="tag.id", primary_key=True)
@@ -56,12 +62,23 @@ class Tag(SQLModel, table=True):
     shipments: list["Shipment"] = Relationship(
         back_populates="tags",
         link_model=ShipmentTag,
-        sa_relationship_kwargs={"lazy":"immediate"}
+        sa_relationship_kwargs={"lazy":"noload"}
     )
 
 
 class Shipment(SQLModel, table=True):
     __tablename__ = "shipment"
+    __table_args__ = (
+        Index("ix_shipment_seller_id_created_at_id", "seller_id", "created_at", "id"),
+        Index(
+            "ix_shipment_delivery_partner_id_created_at_id",
+            "delivery_partner_id",
+            "created_at",
+            "id",
+        ),
+        Index("ix_shipment_seller_id_status", "seller_id", "status"),
+        Index("ix_shipment_delivery_partner_id_status", "delivery_partner_id", "status"),
+    )
 
     id: UUID = Field(default_factory=uuid4, primary_key=True)
     created_at: datetime = Field(
@@ -76,35 +93,41 @@ class Shipment(SQLModel, table=True):
     destination: int
     estimated_delivery: datetime
 
+    # State of the latest timeline event, kept in sync by ShipmentEventService
+    status: ShipmentStatus = Field(default=ShipmentStatus.placed)
+    last_event_at: datetime | None = Field(
+        default=None, sa_column=Column(postgresql.TIMESTAMP)
+    )
+    last_location: int | None = Field(default=None)
+
     timeline: list["ShipmentEvent"] = Relationship(
-        back_populates="shipment", sa_relationship_kwargs={"lazy": "selectin"}
+        back_populates="shipment", sa_relationship_kwargs={"lazy": "noload"}
     )
 
     seller_id: UUID = Field(foreign_key="seller.id")
     seller: "Seller" = Relationship(
-        back_populates="shipments", sa_relationship_kwargs={"lazy": "selectin"}
+        back_populates="shipments", sa_relationship_kwargs={"lazy": "noload"}
     )
 
     delivery_partner_id: UUID = Field(foreign_key="delivery_partner.id")
     delivery_partner: "DeliveryPartner" = Relationship(
-        back_populates="shipments", sa_relationship_kwargs={"lazy": "selectin"}
+        back_populates="shipments", sa_relationship_kwargs={"lazy": "noload"}
     )
 
-    review: "Review"= Relationship(back_populates="shipment",sa_relationship_kwargs={"lazy":"selectin"})
+    review: "Review"= Relationship(back_populates="shipment",sa_relationship_kwargs={"lazy":"noload"})
 
     tags: list[Tag] = Relationship(
         back_populates="shipments",
         link_model=ShipmentTag,
-        sa_relationship_kwargs={"lazy":"immediate"},
+        sa_relationship_kwargs={"lazy":"noload"},
     )
 
-    @property
-    def status(self):
-        return self.timeline[-1].status if len(self.timeline) > 0 else None
-
 
 class ShipmentEvent(SQLModel, table=True):
     __tablename__ = "shipment_event"
+    __table_args__ = (
+        Index("ix_shipment_event_shipment_id_status", "shipment_id", "status"),
+    )
 
     id: UUID = Field(default_factory=uuid4, primary_key=True)
     created_at: datetime = Field(
@@ -116,7 +139,7 @@ class ShipmentEvent(SQLModel, table=True):
 
     shipment_id: UUID = Field(foreign_key="shipment.id")
     shipment: Shipment = Relationship(
-        back_populates="timeline", sa_relationship_kwargs={"lazy": "selectin"}
+        back_populates="timeline", sa_relationship_kwargs={"lazy": "noload"}
     )
 
 
@@ -132,14 +155,14 @@ class Seller(User, table=True):
     zipcode: int | None = Field(default=None)
 
     shipments: list[Shipment] = Relationship(
-        back_populates="seller", sa_relationship_kwargs={"lazy": "selectin"}
+        back_populates="seller", sa_relationship_kwargs={"lazy": "noload"}
     )
 
 class ServiceableLocation(SQLModel, table=True):
     __tablename__="servicable_location"
 
     delivery_partner_id: UUID = Field(foreign_key="delivery_partner.id",primary_key=True)
-    zip_code: int = Field(foreign_key="location.zip_code",primary_key=True)
+    zip_code: int = Field(foreign_key="location.zip_code",primary_key=True, index=True)
 
 
 class DeliveryPartner(User, table=True):
@@ -159,26 +182,21 @@ class DeliveryPartner(User, table=True):
     serviceable_locations: list["Location"]= Relationship(
         back_populates="delivery_partners",
         link_model=ServiceableLocation,
-        sa_relationship_kwargs={"lazy":"selectin"}
+        sa_relationship_kwargs={"lazy":"noload"}
     )
     max_handling_capacity: int
+    # Shipments assigned to the partner that are not yet delivered or cancelled
+    active_shipment_count: int = Field(
+        default=0, sa_column_kwargs={"server_default": "0"}
+    )
 
     shipments: list[Shipment] = Relationship(
-        back_populates="delivery_partner", sa_relationship_kwargs={"lazy": "selectin"}
+        back_populates="delivery_partner", sa_relationship_kwargs={"lazy": "noload"}
     )
 
-    @property
-    def active_shipments(self):
-        return [
-            shipment
-            for shipment in self.shipments
-            if shipment.status != ShipmentStatus.delivered
-            or shipment.status != ShipmentStatus.cancelled
-        ]
-
     @property
     def current_handling_capacity(self):
-        return self.max_handling_capacity - len(self.active_shipments)
+        return self.max_handling_capacity - self.active_shipment_count
     
     @property
     def serviceable_zipcodes(self)->list[int]:
@@ -192,7 +210,7 @@ class Location(SQLModel, table=True):
     delivery_partners: list[DeliveryPartner] = Relationship(
         back_populates="serviceable_locations",
         link_model=ServiceableLocation,
-        sa_relationship_kwargs={"lazy":"selectin"}
+        sa_relationship_kwargs={"lazy":"noload"}
     )
 
 class Review(SQLModel, table=True):
@@ -211,11 +229,72 @@ class Review(SQLModel, table=True):
     rating: int = Field(ge=1,le=5)
     comment: str | None = Field(default=None)
 
-    shipment_id: UUID = Field(foreign_key="shipment.id")
+    shipment_id: UUID = Field(foreign_key="shipment.id", index=True)
     shipment: Shipment= Relationship(
         back_populates="review",
-        sa_relationship_kwargs={"lazy":"selectin"}
+        sa_relationship_kwargs={"lazy":"noload"}
+    )
+
+
+class NotificationOutbox(SQLModel, table=True):
+    """Notification staged with the change that caused it, sent by app.worker.outbox"""
+    __tablename__ = "notification_outbox"
+    __table_args__ = (
+        Index("ix_notification_outbox_status_next_attempt_at", "status", "next_attempt_at"),
     )
 
+    id: UUID = Field(default_factory=uuid4, primary_key=True)
+    created_at: datetime = Field(
+        sa_column=Column(postgresql.TIMESTAMP, default=datetime.now)
+    )
+
+    channel: NotificationChannel
+    # Email: recipients, subject, template_name and context. SMS: to and body
+    payload: dict = Field(
+        sa_column=Column(JSON().with_variant(postgresql.JSONB(), "postgresql"))
+    )
+
+    status: NotificationStatus = Field(default=NotificationStatus.pending)
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime = Field(
+        sa_column=Column(postgresql.TIMESTAMP, default=datetime.now)
+    )
+    sent_at: datetime | None = Field(
+        default=None, sa_column=Column(postgresql.TIMESTAMP)
+    )
+    last_error: str | None = Field(default=None)
+
+
+class SellerStatusCount(SQLModel, table=True):
+    """Shipments of a seller currently in each status, kept by SellerStatsService"""
+    __tablename__ = "seller_status_count"
+
+    seller_id: UUID = Field(foreign_key="seller.id", primary_key=True)
+    status: ShipmentStatus = Field(primary_key=True)
+    count: int = Field(default=0)
+
+
+class SellerDailyCount(SQLModel, table=True):
+    """Shipments of a seller that reached each status, per day"""
+    __tablename__ = "seller_daily_count"
+
+    seller_id: UUID = Field(foreign_key="seller.id", primary_key=True)
+    day: date = Field(primary_key=True)
+    status: ShipmentStatus = Field(primary_key=True)
+    count: int = Field(default=0)
+    # Delivered ones that arrived by their estimated delivery
+    on_time: int = Field(default=0)
+
 
+class PartnerStats(SQLModel, table=True):
+    """Rollups of a partner's reviews and deliveries, kept by PartnerStatsService"""
+    __tablename__ = "partner_stats"
 
+    partner_id: UUID = Field(foreign_key="delivery_partner.id", primary_key=True)
+    review_count: int = Field(default=0)
+    rating_total: int = Field(default=0)
+    delivered: int = Field(default=0)
+    # Delivered by their estimated delivery
+    delivered_on_time: int = Field(default=0)
+    # From placed to delivered, summed over the deliveries
+    delivery_seconds: float = Field(default=0)
@@ -1,30 +1,227 @@
+import asyncio
+from time import perf_counter
+from typing import Callable
 from uuid import UUID
 from redis.asyncio import Redis
+from redis.exceptions import RedisError
 
+from app.api.core.metrics import redis_command_seconds
 from app.config import database_settings
+from app.utils import BloomFilter
 
-_token_blacklist=Redis(
+
+class InstrumentedRedis(Redis):
+    """Client timing each command it sends"""
+
+    async def execute_command(self, *args, **options):
+        start = perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            redis_command_seconds.observe(args[0], perf_counter() - start)
+
+
+_token_blacklist=InstrumentedRedis(
     host=database_settings.REDIS_HOST,
     port=database_settings.REDIS_PORT,
     db=0,
 )
 
-_shipment_verification_codes=Redis(
+_shipment_verification_codes=InstrumentedRedis(
     host=database_settings.REDIS_HOST,
     port=database_settings.REDIS_PORT,
     db=1,
     decode_responses=True
 )
 
-async def add_jti_to_blacklist(jti: str):
-    await _token_blacklist.set(jti,"blacklisted")
+# Rendered tracking responses, see app.services.tracking
+_tracking_cache=InstrumentedRedis(
+    host=database_settings.REDIS_HOST,
+    port=database_settings.REDIS_PORT,
+    db=2,
+)
+
+# Progress of shipment imports, see app.services.shipment_import
+_import_jobs=InstrumentedRedis(
+    host=database_settings.REDIS_HOST,
+    port=database_settings.REDIS_PORT,
+    db=3,
+    decode_responses=True
+)
+
+# Messages shared between the workers, handlers are registered per channel
+_events=InstrumentedRedis(
+    host=database_settings.REDIS_HOST,
+    port=database_settings.REDIS_PORT,
+    decode_responses=True
+)
+
+_channel_handlers: dict[str, Callable[[str], None]] = {}
+
+# Wait before subscribing again after the connection drops
+_RESUBSCRIBE_DELAY = 1
+
+REVOCATION_CHANNEL = "token-revocations"
+# Revoked tokens the local filter is sized for before it is rebuilt
+BLACKLIST_FILTER_CAPACITY = 100_000
+BLACKLIST_FILTER_ERROR_RATE = 0.001
+
+# Local copy of the blacklist that answers "not revoked" without Redis.
+# It is only trusted once loaded while subscribed to the revocations.
+_revoked = BloomFilter(BLACKLIST_FILTER_CAPACITY, BLACKLIST_FILTER_ERROR_RATE)
+_revoked_rebuild: BloomFilter | None = None
+_revoked_synced = False
+
+async def add_jti_to_blacklist(jti: str, expires_at: int):
+    # The entry is useless once the token itself has expired
+    await _token_blacklist.set(jti,"blacklisted",exat=expires_at)
+    _on_revoked(jti)
+    await publish(REVOCATION_CHANNEL, jti)
 
 async def is_jti_blacklisted(jti: str)->bool:
+    if _revoked_synced and jti not in _revoked:
+        return False
     return await _token_blacklist.exists(jti)
 
+def _on_revoked(jti: str):
+    _revoked.add(jti)
+    if _revoked_rebuild is not None:
+        _revoked_rebuild.add(jti)
+    elif _revoked.count > BLACKLIST_FILTER_CAPACITY:
+        # Expired entries are gone from Redis, reloading sheds them
+        asyncio.create_task(sync_blacklist())
+
+async def sync_blacklist():
+    """Reload the local filter from the revoked tokens in Redis"""
+    global _revoked, _revoked_rebuild, _revoked_synced
+
+    if _revoked_rebuild is not None:
+        return
+    _revoked_rebuild = BloomFilter(BLACKLIST_FILTER_CAPACITY, BLACKLIST_FILTER_ERROR_RATE)
+    try:
+        async for jti in _token_blacklist.scan_iter(count=1000):
+            _revoked_rebuild.add(jti.decode())
+        _revoked, _revoked_synced = _revoked_rebuild, True
+    finally:
+        _revoked_rebuild = None
+
 async def add_shipment_verification_code(id: UUID,code: int):
     await _shipment_verification_codes.set(str(id),code)
     
 
+async def add_shipment_verification_codes(codes: dict[UUID, int]):
+    await _shipment_verification_codes.mset({str(id): code for id, code in codes.items()})
+
 async def get_shipment_verification_code(id: UUID):
-    return str(await _shipment_verification_codes.get(str(id)))
\ No newline at end of file
+    return str(await _shipment_verification_codes.get(str(id)))
+
+async def get_shipment_verification_codes(ids: list[UUID]) -> list[str | None]:
+    return await _shipment_verification_codes.mget([str(id) for id in ids])
+
+
+async def get_tracking_etag(id: UUID, kind: str) -> str | None:
+    etag = await _tracking_cache.hget(f"tracking:{id}", f"{kind}:etag")
+    return etag.decode() if etag is not None else None
+
+async def get_tracking(id: UUID, kind: str) -> tuple[str, bytes] | None:
+    etag, body = await _tracking_cache.hmget(f"tracking:{id}", f"{kind}:etag", f"{kind}:body")
+    if etag is None or body is None:
+        return None
+    return etag.decode(), body
+
+async def set_tracking(id: UUID, kind: str, etag: str, body: bytes, ttl: int):
+    async with _tracking_cache.pipeline(transaction=False) as pipeline:
+        pipeline.hset(f"tracking:{id}", mapping={f"{kind}:etag": etag, f"{kind}:body": body})
+        pipeline.expire(f"tracking:{id}", ttl)
+        await pipeline.execute()
+
+async def delete_tracking(*ids: UUID):
+    await _tracking_cache.delete(*(f"tracking:{id}" for id in ids))
+
+
+async def create_import_job(id: UUID, seller_id: UUID, ttl: int):
+    async with _import_jobs.pipeline(transaction=False) as pipeline:
+        pipeline.hset(
+            f"import:{id}",
+            mapping={"seller_id": str(seller_id), "status": "running", "rows": 0, "imported": 0, "failed": 0},
+        )
+        pipeline.expire(f"import:{id}", ttl)
+        await pipeline.execute()
+
+async def update_import_job(
+    id: UUID,
+    imported: int,
+    failed: int,
+    errors: list[str],
+    max_errors: int,
+    ttl: int,
+    status: str | None = None,
+):
+    async with _import_jobs.pipeline(transaction=False) as pipeline:
+        pipeline.hincrby(f"import:{id}", "rows", imported + failed)
+        pipeline.hincrby(f"import:{id}", "imported", imported)
+        pipeline.hincrby(f"import:{id}", "failed", failed)
+        if status:
+            pipeline.hset(f"import:{id}", "status", status)
+        if errors:
+            # Only the first errors are kept
+            pipeline.rpush(f"import:{id}:errors", *errors)
+            pipeline.ltrim(f"import:{id}:errors", 0, max_errors - 1)
+            pipeline.expire(f"import:{id}:errors", ttl)
+        await pipeline.execute()
+
+async def get_import_job(id: UUID) -> tuple[dict, list[str]] | None:
+    async with _import_jobs.pipeline(transaction=False) as pipeline:
+        pipeline.hgetall(f"import:{id}")
+        pipeline.lrange(f"import:{id}:errors", 0, -1)
+        job, errors = await pipeline.execute()
+    return (job, errors) if job else None
+
+
+def subscribe(channel: str, handler: Callable[[str], None]):
+    _channel_handlers[channel] = handler
+
+
+async def publish(channel: str, message: str):
+    await _events.publish(channel, message)
+
+
+async def publish_many(channel: str, messages: list[str]):
+    async with _events.pipeline(transaction=False) as pipeline:
+        for message in messages:
+            pipeline.publish(channel, message)
+        await pipeline.execute()
+
+
+async def listen():
+    """Dispatch messages of the subscribed channels until cancelled"""
+    global _revoked_synced
+
+    try:
+        while True:
+            try:
+                async with _events.pubsub() as pubsub:
+                    await pubsub.subscribe(*_channel_handlers)
+                    # Revocations published while not subscribed were missed
+                    await sync_blacklist()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            _dispatch(message["channel"], message["data"])
+            except RedisError as e:
+                _revoked_synced = False
+                print(f"[Redis Subscription Failed]: {e}")
+                await asyncio.sleep(_RESUBSCRIBE_DELAY)
+    finally:
+        # Nobody keeps the local blacklist current anymore
+        _revoked_synced = False
+
+
+def _dispatch(channel: str, data: str):
+    # A failing handler loses its message, not the subscription
+    try:
+        _channel_handlers[channel](data)
+    except Exception as e:
+        print(f"[Redis Message Handler Failed]: {channel}: {e}")
+
+
+subscribe(REVOCATION_CHANNEL, _on_revoked)
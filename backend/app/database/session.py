@@ -1,11 +1,45 @@
+from time import perf_counter
+
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlmodel import SQLModel
+from app.api.core.metrics import db_checkout_held_seconds, db_checkout_wait_seconds
 from app.config import database_settings
 
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Pool timing how long each checkout waits for a connection"""
+
+    def _do_get(self):
+        start = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_checkout_wait_seconds.observe("primary", perf_counter() - start)
+
+
 engine=create_async_engine(
     url=database_settings.POSTGRES_URL ,
-    echo=True
+    echo=True,
+    poolclass=InstrumentedPool,
+)
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    connection_record.info["checked_out_at"] = perf_counter()
+
+@event.listens_for(engine.sync_engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    checked_out_at = connection_record.info.pop("checked_out_at", None)
+    if checked_out_at is not None:
+        db_checkout_held_seconds.observe("primary", perf_counter() - checked_out_at)
+
+async_session= sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
+    expire_on_commit=False
 )
 
 async def create_db_tables():
@@ -14,11 +48,14 @@ async def create_db_tables():
         await conn.run_sync(SQLModel.metadata.create_all)
 
 async def create_session():
-    async_session= sessionmaker(
-        bind=engine,
-        class_=AsyncSession,
-        expire_on_commit=False
-    )
+    # Unit of work of a request, services stage their changes on the session
+    # and they are flushed and committed together once the endpoint succeeds.
+    # On an error the session closes without committing and rolls back.
     async with async_session() as session:
         yield session
+        await session.commit()
 
+def get_session_factory():
+    # Sessions outliving the request's unit of work, e.g. while a streamed
+    # response is sent after the request's own session has closed
+    return async_session
@@ -1,17 +1,21 @@
+import asyncio
 from contextlib import asynccontextmanager
-from time import perf_counter
 
-from fastapi import BackgroundTasks, FastAPI, Request, Response
+from fastapi import FastAPI
 from fastapi.routing import APIRoute
 from scalar_fastapi import get_scalar_api_reference
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.api.core.access_log import AccessLogMiddleware, flush, flush_periodically
 from app.api.core.exceptions import add_exception_handlers
+from app.api.core.security import shutdown_hashing_pool
+from app.database.redis import listen
 from app.database.session import create_db_tables
 
 from app.api.router import master_router
-from app.services.notification import NotificationService
-# from app.worker.tasks import add_log
+from app.services.notification import close_dispatcher, get_dispatcher
+from app.services.tag import load_tag_ids
+from app.worker.outbox import drain
 
 description = """
 Delivery Management System for sellers and delivery agents.
@@ -33,10 +37,25 @@ Features include:
 async def lifespan_handler(app: FastAPI):
     try:
         await create_db_tables()
-        
+        # Tag ids, fixed for the life of the process
+        await load_tag_ids()
     except Exception as e:
          print(f"⚠️ Database connection failed, skipping for test: {e}")
+    # Provider clients and email templates shared by every request
+    get_dispatcher()
+    # Cache invalidations and other messages published by the workers
+    listener = asyncio.create_task(listen())
+    # Sends the notifications committed by requests
+    drainer = asyncio.create_task(drain())
+    # Writes the access log buffered by the middleware
+    logger = asyncio.create_task(flush_periodically())
     yield
+    drainer.cancel()
+    listener.cancel()
+    logger.cancel()
+    await flush()
+    await close_dispatcher()
+    shutdown_hashing_pool()
     print("server ended")
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -64,6 +83,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_credentials=True,
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.include_router(master_router)
@@ -71,22 +91,8 @@ app.include_router(master_router)
 add_exception_handlers(app)
 
 
-@app.middleware("http")
-async def custom_middleware(request: Request,call_next):
-    start = perf_counter()
-    response: Response = await call_next(request)
-    end = perf_counter()
-    time_taken = round(end - start, 2)
-    # add_log.delay(
-    #     f"{request.method} {request.url} - {response.status_code} - {time_taken}s"
-    # )
-    tasks = BackgroundTasks()
-    notification = NotificationService(tasks)
-    notification.add_log(
-         f"{request.method} {request.url} - {response.status_code} - {time_taken}s"
-    )
-    response.background = tasks
-    return response
+# Outermost, so its latency covers the other middleware too
+app.add_middleware(AccessLogMiddleware)
 
 
 @app.get("/docs", include_in_schema=False)
@@ -1,4 +1,6 @@
 from uuid import UUID
+from sqlalchemy import inspect
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import SQLModel
 
@@ -10,18 +12,52 @@ class BaseService:
         # Model class to be used in service methods
         self.model = model
 
-    async def _get(self, id: UUID):
-        return await self.session.get(self.model, id)
+    async def _get(self, id: UUID, options: tuple = ()):
+        return await self.session.get(self.model, id, options=options)
     
     async def _add(self, entity: SQLModel):
+        # Staged only, the request's unit of work commits it
         self.session.add(entity)
-        await self.session.commit()
-        await self.session.refresh(entity)
         return entity
+
+    async def _flush(self, *entities: SQLModel):
+        """
+        Write the staged changes when a service needs database generated
+        values before the request commits. Only columns the server filled in
+        are reloaded, entities with none are not refreshed.
+        """
+        await self.session.flush()
+
+        for entity in entities:
+            state = inspect(entity)
+            generated = [
+                column.key
+                for column in state.mapper.column_attrs
+                if column.key in state.unloaded
+            ]
+            if generated:
+                await self.session.refresh(entity, attribute_names=generated)
     
     async def _update(self, entity: SQLModel):
         return await self._add(entity)
     
     async def _delete(self, entity: SQLModel):
         await self.session.delete(entity)
-        await self.session.commit()
\ No newline at end of file
+
+    async def _increment(self, model: type[SQLModel], rows: list[dict]):
+        """
+        Add the counters of the rows to those of the existing rows with the
+        same key, inserting the missing ones, in one statement
+        """
+        if not rows:
+            return
+        dialect = postgresql if self.session.bind.dialect.name == "postgresql" else sqlite
+        table = model.__table__
+        statement = dialect.insert(table).values(rows)
+        counters = [column.name for column in table.columns if not column.primary_key]
+        await self.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=table.primary_key.columns,
+                set_={name: table.c[name] + statement.excluded[name] for name in counters},
+            )
+        )
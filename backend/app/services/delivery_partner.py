@@ -1,10 +1,24 @@
-from sqlmodel import Sequence, select
+from uuid import UUID
+
+from sqlmodel import Sequence, case, exists, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.api.core.exceptions import DeliveryPartnerNotAvailableError
 from app.api.schemas.delivery_partner import DeliveryPartnerCreate
-from app.database.models import DeliveryPartner, Location, Shipment
+from app.database.models import (
+    DeliveryPartner,
+    Location,
+    ServiceableLocation,
+    Shipment,
+)
+from app.services.partner_stats import on_time_rank
+from app.services.principal import invalidate_principal
+from app.services.profiles import PARTNER_PROFILE
 from app.services.user import UserService
 
+# Partners waited on when every partner with capacity is locked by a
+# concurrent reservation, and the one waited on fills up meanwhile
+RESERVATION_ATTEMPTS = 3
+
 
 class DeliveryPartnerService(UserService):
     def __init__(self, session: AsyncSession, tasks):
@@ -16,14 +30,19 @@ class DeliveryPartnerService(UserService):
             "partner",
         )
 
-        for zipcode in delivery_partner.serviceable_zipcodes:
-            location = await self.session.get(Location, zipcode)
-            partner.serviceable_locations.append(
-                location if location else Location(zip_code=zipcode)
-            )
+        # The staged partner is written with its locations when the request commits
+        with self.session.no_autoflush:
+            for zipcode in delivery_partner.serviceable_zipcodes:
+                location = await self.session.get(Location, zipcode)
+                partner.serviceable_locations.append(
+                    location if location else Location(zip_code=zipcode)
+                )
 
         return await self._update(partner)
 
+    async def get(self, id: UUID) -> DeliveryPartner | None:
+        return await self._get(id, PARTNER_PROFILE)
+
     async def get_partners_by_zipcode(self, zipcode: str) -> Sequence[DeliveryPartner]:
         return (
             await self.session.scalars(
@@ -33,18 +52,164 @@ class DeliveryPartnerService(UserService):
             )
         ).all()
 
-    async def assign_shipment(self, shipment: Shipment):
-        eligible_partners = await self.get_partners_by_zipcode(shipment.destination)
+    def _available_partners(self, zipcode: int):
+        return (
+            select(DeliveryPartner.id)
+            .join(
+                ServiceableLocation,
+                ServiceableLocation.delivery_partner_id == DeliveryPartner.id,
+            )
+            .where(
+                ServiceableLocation.zip_code == int(zipcode),
+                DeliveryPartner.active_shipment_count
+                < DeliveryPartner.max_handling_capacity,
+            )
+        )
 
-        for partner in eligible_partners:
-            if partner.current_handling_capacity > 0:
-                partner.shipments.append(shipment)
+    async def get_available_partner(self, zipcode: int) -> DeliveryPartner | None:
+        return await self.session.scalar(
+            select(DeliveryPartner)
+            .where(DeliveryPartner.id.in_(self._available_partners(zipcode)))
+            .order_by(on_time_rank(DeliveryPartner.id).desc())
+            .limit(1)
+        )
+
+    async def get_serving_partner(self, zipcode: int) -> DeliveryPartner | None:
+        # Delivered and cancelled shipments hold no capacity, any partner of
+        # the zipcode can be credited with them
+        return await self.session.scalar(
+            select(DeliveryPartner)
+            .join(
+                ServiceableLocation,
+                ServiceableLocation.delivery_partner_id == DeliveryPartner.id,
+            )
+            .where(ServiceableLocation.zip_code == int(zipcode))
+            .order_by(on_time_rank(DeliveryPartner.id).desc())
+            .limit(1)
+        )
+
+    async def reserve_capacity(self, zipcode: int) -> DeliveryPartner | None:
+        # Partners locked by concurrent reservations are skipped first, so
+        # reservations spread over the partners of the zipcode. When all of
+        # them are locked the best one is waited on instead, a lock is held
+        # until the request holding it commits. The capacity check is repeated
+        # in the update itself so the counter never goes past the partner's
+        # max handling capacity. Partners delivering on time more often are
+        # tried first
+        best = (
+            self._available_partners(zipcode)
+            .order_by(on_time_rank(DeliveryPartner.id).desc())
+            .limit(1)
+        )
+
+        partner = await self._reserve(
+            best.with_for_update(of=DeliveryPartner, skip_locked=True).scalar_subquery()
+        )
+        for _ in range(RESERVATION_ATTEMPTS):
+            if partner is not None:
                 return partner
 
-        raise DeliveryPartnerNotAvailableError()
+            # The partner waited on may have been filled by the request that
+            # held it, try the next best one unless none has capacity left
+            if not await self.session.scalar(
+                select(exists(self._available_partners(zipcode)))
+            ):
+                return None
+            partner = await self._reserve(best.scalar_subquery())
+
+        return partner
+
+    async def _reserve(self, candidate) -> DeliveryPartner | None:
+        return await self.session.scalar(
+            update(DeliveryPartner)
+            .where(
+                DeliveryPartner.id == candidate,
+                DeliveryPartner.active_shipment_count
+                < DeliveryPartner.max_handling_capacity,
+            )
+            .values(active_shipment_count=DeliveryPartner.active_shipment_count + 1)
+            .returning(DeliveryPartner)
+            .execution_options(populate_existing=True)
+        )
+
+    async def reserve_capacity_bulk(
+        self, zipcode: int, count: int
+    ) -> list[tuple[DeliveryPartner, int]]:
+        # Lock every partner with capacity left for the zipcode, skipping the
+        # ones held by concurrent reservations, and take as many slots as
+        # needed from the partners delivering on time more often first. What
+        # is left is then taken from the skipped ones, waiting on their locks
+        reservations = []
+        for skip_locked in (True, False):
+            if count == 0:
+                break
+
+            candidates = (
+                select(
+                    DeliveryPartner.id,
+                    DeliveryPartner.max_handling_capacity
+                    - DeliveryPartner.active_shipment_count,
+                )
+                .where(DeliveryPartner.id.in_(self._available_partners(zipcode)))
+                .order_by(on_time_rank(DeliveryPartner.id).desc())
+            )
+            if skip_locked:
+                candidates = candidates.with_for_update(of=DeliveryPartner, skip_locked=True)
+
+            for partner_id, free in await self.session.execute(candidates):
+                if count == 0:
+                    break
+
+                slots = min(free, count)
+                partner = await self.session.scalar(
+                    update(DeliveryPartner)
+                    .where(
+                        DeliveryPartner.id == partner_id,
+                        DeliveryPartner.active_shipment_count + slots
+                        <= DeliveryPartner.max_handling_capacity,
+                    )
+                    .values(
+                        active_shipment_count=DeliveryPartner.active_shipment_count + slots
+                    )
+                    .returning(DeliveryPartner)
+                    .execution_options(populate_existing=True)
+                )
+                if partner is not None:
+                    reservations.append((partner, slots))
+                    count -= slots
+
+        return reservations
+
+    async def release_capacity(self, partner_id: UUID, count: int = 1) -> None:
+        await self.session.execute(
+            update(DeliveryPartner)
+            .where(
+                DeliveryPartner.id == partner_id,
+                DeliveryPartner.active_shipment_count > 0,
+            )
+            .values(
+                active_shipment_count=case(
+                    (
+                        DeliveryPartner.active_shipment_count > count,
+                        DeliveryPartner.active_shipment_count - count,
+                    ),
+                    else_=0,
+                )
+            )
+        )
+
+    async def assign_shipment(self, shipment: Shipment):
+        partner = await self.reserve_capacity(shipment.destination)
+
+        if partner is None:
+            raise DeliveryPartnerNotAvailableError()
+
+        return partner
 
     async def update(self, partner: DeliveryPartner) -> DeliveryPartner:
-        return await self._update(partner)
+        partner = await self._update(partner)
+        self.tasks.add_task(invalidate_principal, DeliveryPartner, partner.id)
+        return partner
 
     async def login(self, email: str, password: str) -> str:
         return await self._generate_token(email, password)
@@ -1,37 +1,126 @@
 from fastapi import BackgroundTasks
 # from fastapi_mail import ConnectionConfig, FastMail, MessageSchema, MessageType
+import httpx
 from pydantic import EmailStr
 
 from app.config import notifications_settings
+from app.services.providers import ResendProvider, SmtpProvider, TwilioProvider
 from app.utils import TEMPLATE_DIR
 
-from twilio.rest import Client
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 
-import resend
+EMAIL_FROM = "Shippin Support <noreply@shippin.me>" # CHANGE THIS to your verified domain later
 
 
-class NotificationService:
-    def __init__(self, tasks: BackgroundTasks):
-        self.tasks = tasks
-        # self.fastmail = FastMail(
-        #     ConnectionConfig(
-        #         **notifications_settings.model_dump(
-        #             exclude=["TWILIO_SID", "TWILIO_AUTH_TOKEN", "TWILIO_NUMBER"]
-        #         ),
-        #         TEMPLATE_FOLDER=TEMPLATE_DIR,
-        #     )
-        # )
+class NotificationDispatcher:
+    """
+    Process wide state for sending notifications, the provider clients and
+    compiled email templates. Built once at startup, see get_dispatcher.
+    """
+
+    def __init__(self):
         self.template_env = Environment(
             loader=FileSystemLoader(TEMPLATE_DIR),
-            autoescape=select_autoescape(['html', 'xml'])
+            autoescape=select_autoescape(['html', 'xml']),
+            auto_reload=False,
         )
+        # Compiled now so no request pays for parsing a template
+        for name in self.template_env.list_templates(
+            filter_func=lambda name: name.startswith("mail_")
+        ):
+            self.template_env.get_template(name)
+
+        # Shared by the HTTP providers, connections are kept alive between calls
+        self.http_client = httpx.AsyncClient(
+            timeout=10,
+            limits=httpx.Limits(
+                max_connections=notifications_settings.PROVIDER_MAX_CONNECTIONS,
+                max_keepalive_connections=notifications_settings.PROVIDER_MAX_CONNECTIONS,
+            ),
+        )
+        self.email_provider = (
+            SmtpProvider()
+            if notifications_settings.EMAIL_PROVIDER == "smtp"
+            else ResendProvider(self.http_client)
+        )
+        self.sms_provider = TwilioProvider(self.http_client)
+        # Emails queued as background tasks and not sent yet
+        self.queued = 0
+
+    def render(self, template_name: str, context: dict) -> str:
+        return self.template_env.get_template(template_name).render(**context)
+
+    async def send_email(self, recipients: list[str], subject: str, html: str = None, text: str = None):
+        """Sends a single email, run after the response via BackgroundTasks"""
+        try:
+            email_data = {
+                "from": EMAIL_FROM,
+                "to": recipients,
+                "subject": subject,
+            }
+
+            if html:
+                email_data["html"] = html
+            if text:
+                email_data["text"] = text
 
-        resend.api_key = notifications_settings.RESEND_API_KEY
+            await self.email_provider.send_emails([email_data])
+            print(f"[Email Sent]: {subject}")
 
-        self.twilio_client = Client(
-            notifications_settings.TWILIO_SID, notifications_settings.TWILIO_AUTH_TOKEN
+        except Exception as e:
+            print(f"[Email Failed]: {e}")
+        finally:
+            self.queued -= 1
+
+    async def deliver_emails(self, emails: list[dict], template_name: str):
+        """
+        Renders and sends emails sharing a template, in as few provider calls
+        as the provider allows. Failures are raised to the caller.
+        """
+        await self.email_provider.send_emails(
+            [
+                {
+                    "from": EMAIL_FROM,
+                    "to": [str(r) for r in email["recipients"]],
+                    "subject": email["subject"],
+                    "html": self.render(template_name, email["context"]),
+                }
+                for email in emails
+            ]
         )
+        print(f"[Batch Email Sent]: {len(emails)} emails")
+
+    async def deliver_sms(self, to: str, body: str):
+        """Sends an SMS, failures are raised to the caller"""
+        await self.sms_provider.send_sms(to, body)
+
+    async def close(self):
+        await self.http_client.aclose()
+
+
+_dispatcher: NotificationDispatcher | None = None
+
+
+def get_dispatcher() -> NotificationDispatcher:
+    """The process wide dispatcher, created by the lifespan or on first use"""
+    global _dispatcher
+
+    if _dispatcher is None:
+        _dispatcher = NotificationDispatcher()
+    return _dispatcher
+
+
+async def close_dispatcher():
+    if _dispatcher is not None:
+        await _dispatcher.close()
+
+
+class NotificationService:
+    """Request scoped facade queuing notifications on the shared dispatcher"""
+
+    def __init__(self, tasks: BackgroundTasks):
+        self.tasks = tasks
+        self.dispatcher = get_dispatcher()
 
     # def send_email(
     #     self,
@@ -49,29 +138,6 @@ class NotificationService:
     #         ),
     #     )
 
-    def _send_resend_task(self, recipients: list[str], subject: str, html: str = None, text: str = None):
-        """
-        Internal helper to perform the synchronous Resend API call.
-        This runs in a thread pool via BackgroundTasks.
-        """
-        try:
-            email_data = {
-                "from": "Shippin Support <noreply@shippin.me>", # CHANGE THIS to your verified domain later
-                "to": recipients,
-                "subject": subject,
-            }
-            
-            if html:
-                email_data["html"] = html
-            if text:
-                email_data["text"] = text
-
-            r = resend.Emails.send(email_data)
-            print(f"[Email Sent]: ID {r.get('id')}")
-            
-        except Exception as e:
-            print(f"[Email Failed]: {e}")
-
     def send_templated_email(
         self,
         recipients: list[EmailStr],
@@ -79,47 +145,17 @@ class NotificationService:
         context: dict,
         template_name: str,
     ):
-        # self.tasks.add_task(
-        #     self.fastmail.send_message,
-        #     message=MessageSchema(
-        #         recipients=recipients,
-        #         subject=subject,
-        #         template_body=context,
-        #         subtype=MessageType.html,
-        #     ),
-        #     template_name=template_name,
-        # )
         try:
-            template = self.template_env.get_template(template_name)
-            html_content = template.render(**context)
-            
+            html_content = self.dispatcher.render(template_name, context)
+
             recipient_strs = [str(r) for r in recipients]
 
-            # 2. Add the sending task to background
+            self.dispatcher.queued += 1
             self.tasks.add_task(
-                self._send_resend_task,
+                self.dispatcher.send_email,
                 recipients=recipient_strs,
                 subject=subject,
                 html=html_content
             )
         except Exception as e:
             print(f"Error rendering template: {e}")
-
-    def send_sms(self, to: str, body: str):
-        
-        self.tasks.add_task(
-            self.twilio_client.messages.create_async, 
-            from_=notifications_settings.TWILIO_NUMBER,
-            to=to,
-            body=body,
-        )
-    
-    def add_log(self, message: str):
-        """
-        Schedules a log message to be printed to the console.
-        Render (or any cloud host) will capture this in its log stream.
-        """
-        self.tasks.add_task(
-            print,                   # 1. The function to run
-            f"[APP_LOG]: {message}"   # 2. The argument for that function
-        )
\ No newline at end of file
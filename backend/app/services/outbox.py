@@ -0,0 +1,85 @@
+from fastapi.encoders import jsonable_encoder
+from pydantic import EmailStr
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import NotificationChannel, NotificationOutbox
+from app.services.base import BaseService
+
+
+class NotificationOutboxService(BaseService):
+    """
+    Stages notifications in the outbox, they commit along with the request
+    and are sent afterwards by the outbox drainer.
+    """
+
+    def __init__(self, session: AsyncSession):
+        super().__init__(NotificationOutbox, session)
+
+    async def send_templated_email(
+        self,
+        recipients: list[EmailStr],
+        subject: str,
+        context: dict,
+        template_name: str,
+    ):
+        await self._add(
+            NotificationOutbox(
+                channel=NotificationChannel.email,
+                payload=self._email(recipients, subject, context, template_name),
+            )
+        )
+
+    async def send_templated_emails(self, emails: list[dict], template_name: str):
+        """
+        Stages many emails rendered from the same template in one insert.
+        Each email is a dict with recipients, subject and context keys.
+        """
+        if emails:
+            await self.session.execute(
+                insert(NotificationOutbox),
+                [
+                    NotificationOutbox(
+                        channel=NotificationChannel.email,
+                        payload=self._email(**email, template_name=template_name),
+                    ).model_dump(exclude_none=True)
+                    for email in emails
+                ],
+            )
+
+    async def send_sms(self, to: str, body: str):
+        await self._add(
+            NotificationOutbox(
+                channel=NotificationChannel.sms,
+                payload={"to": to, "body": body},
+            )
+        )
+
+    async def send_sms_messages(self, messages: list[dict]):
+        """Stages many SMS in one insert, each a dict with to and body keys"""
+        if messages:
+            await self.session.execute(
+                insert(NotificationOutbox),
+                [
+                    NotificationOutbox(
+                        channel=NotificationChannel.sms, payload=message
+                    ).model_dump(exclude_none=True)
+                    for message in messages
+                ],
+            )
+
+    def _email(
+        self,
+        recipients: list[EmailStr],
+        subject: str,
+        context: dict,
+        template_name: str,
+    ) -> dict:
+        return jsonable_encoder(
+            {
+                "recipients": recipients,
+                "subject": subject,
+                "context": context,
+                "template_name": template_name,
+            }
+        )
@@ -0,0 +1,84 @@
+"""
+Rollups of each delivery partner's reviews and deliveries. They are updated in
+the transaction of the review or delivery, so GET /partner/stats and partner
+assignment read one row per partner instead of aggregating shipments.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import Float, cast, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from app.database.models import PartnerStats
+from app.services.base import BaseService
+
+# Partner, when the shipment was placed, delivered, and its estimated delivery
+Delivery = tuple[UUID, datetime, datetime, datetime]
+
+
+def on_time_rank(partner_id):
+    """
+    Ranking signal for assigning shipments, the partner's share of on-time
+    deliveries. Smoothed so that partners without deliveries rank at 0.5,
+    between good and poor ones, instead of never being picked.
+    """
+    return func.coalesce(
+        select((cast(PartnerStats.delivered_on_time, Float) + 1) / (PartnerStats.delivered + 2))
+        .where(PartnerStats.partner_id == partner_id)
+        .scalar_subquery(),
+        0.5,
+    )
+
+
+class PartnerStatsService(BaseService):
+    def __init__(self, session: AsyncSession):
+        super().__init__(PartnerStats, session)
+
+    async def record_review(self, partner_id: UUID, rating: int):
+        await self._increment(
+            PartnerStats,
+            [{"partner_id": partner_id, "review_count": 1, "rating_total": rating}],
+        )
+
+    async def record_deliveries(self, deliveries: list[Delivery]):
+        """Count delivered shipments, in one statement"""
+        partners = defaultdict(lambda: [0, 0, 0.0])
+        for partner_id, placed_at, delivered_at, estimated_delivery in deliveries:
+            counts = partners[partner_id]
+            counts[0] += 1
+            counts[1] += delivered_at <= estimated_delivery
+            counts[2] += (delivered_at - placed_at).total_seconds()
+
+        # Rows in key order, concurrent transactions lock them in the same order
+        await self._increment(
+            PartnerStats,
+            [
+                {
+                    "partner_id": partner_id,
+                    "delivered": delivered,
+                    "delivered_on_time": on_time,
+                    "delivery_seconds": seconds,
+                }
+                for partner_id, (delivered, on_time, seconds) in sorted(partners.items())
+            ],
+        )
+
+    async def get(self, partner_id: UUID) -> dict:
+        stats = await self._get(partner_id) or PartnerStats(partner_id=partner_id)
+        return {
+            "review_count": stats.review_count,
+            "average_rating": stats.rating_total / stats.review_count
+            if stats.review_count
+            else None,
+            "delivered": stats.delivered,
+            "delivered_on_time": stats.delivered_on_time,
+            "on_time_rate": stats.delivered_on_time / stats.delivered
+            if stats.delivered
+            else None,
+            "mean_delivery_seconds": stats.delivery_seconds / stats.delivered
+            if stats.delivered
+            else None,
+        }
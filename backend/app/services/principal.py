@@ -0,0 +1,74 @@
+from dataclasses import dataclass
+from time import monotonic
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from app.config import security_settings
+from app.database.models import DeliveryPartner, Seller
+from app.database.redis import publish, subscribe
+
+PRINCIPAL_CHANNEL = "principal-invalidation"
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Authenticated seller or delivery partner, as needed by most routes"""
+    id: UUID
+    name: str
+    email: str
+    email_verified: bool
+    zipcode: int | None = None
+
+
+# Columns of each user model kept in the principal
+_PROJECTIONS = {
+    Seller: (Seller.id, Seller.name, Seller.email, Seller.email_verified, Seller.zipcode),
+    DeliveryPartner: (
+        DeliveryPartner.id,
+        DeliveryPartner.name,
+        DeliveryPartner.email,
+        DeliveryPartner.email_verified,
+    ),
+}
+
+# (table name, id) -> (expiry, principal)
+_cache: dict[tuple[str, UUID], tuple[float, Principal]] = {}
+
+
+async def get_principal(
+    session: AsyncSession, model: type[Seller | DeliveryPartner], id: UUID
+) -> Principal | None:
+    key = (model.__tablename__, id)
+    cached = _cache.get(key)
+    if cached and cached[0] > monotonic():
+        return cached[1]
+
+    row = (
+        await session.execute(select(*_PROJECTIONS[model]).where(model.id == id))
+    ).first()
+    if row is None:
+        return None
+
+    principal = Principal(**row._mapping)
+    _cache[key] = (monotonic() + security_settings.PRINCIPAL_CACHE_TTL, principal)
+    return principal
+
+
+async def invalidate_principal(model: type[Seller | DeliveryPartner], id: UUID):
+    """Drop the cached principal here and on every other worker"""
+    _evict(f"{model.__tablename__}:{id}")
+    await publish(PRINCIPAL_CHANNEL, f"{model.__tablename__}:{id}")
+
+
+def clear_principals():
+    _cache.clear()
+
+
+def _evict(message: str):
+    table, id = message.split(":", 1)
+    _cache.pop((table, UUID(id)), None)
+
+
+subscribe(PRINCIPAL_CHANNEL, _evict)
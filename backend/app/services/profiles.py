@@ -0,0 +1,22 @@
+from sqlalchemy.orm import joinedload, selectinload
+
+from app.database.models import DeliveryPartner, Shipment
+
+# Relationships are not loaded by default, services pick one of these
+# loader profiles for the data an endpoint actually returns
+
+# Partner along with the zipcodes it serves
+PARTNER_PROFILE = (selectinload(DeliveryPartner.serviceable_locations),)
+
+# Shipment as listed, with its timeline and tags
+SHIPMENT_SUMMARY = (
+    selectinload(Shipment.timeline),
+    selectinload(Shipment.tags),
+)
+
+# Shipment with the parties involved, for tracking, updates and notifications
+SHIPMENT_DETAIL = (
+    *SHIPMENT_SUMMARY,
+    joinedload(Shipment.seller),
+    joinedload(Shipment.delivery_partner),
+)
@@ -0,0 +1,124 @@
+import asyncio
+from email.message import EmailMessage
+
+import aiosmtplib
+import httpx
+
+from app.config import notifications_settings
+
+RESEND_BATCH_LIMIT = 100
+# Retries of a call the provider rejected for going over its rate limit
+RATE_LIMIT_RETRIES = 3
+RATE_LIMIT_BACKOFF = 0.5
+
+
+class ProviderError(Exception):
+    """A notification provider refused or failed a request"""
+
+
+class HttpProvider:
+    """
+    Provider reached over the shared, keep-alive HTTP client, with a cap on
+    its calls in flight and backoff when it answers 429 Too Many Requests.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, base_url: str, concurrency: int):
+        self.client = client
+        self.base_url = base_url.rstrip("/")
+        self._limit = asyncio.Semaphore(concurrency)
+
+    async def _post(self, path: str, **kwargs) -> httpx.Response:
+        async with self._limit:
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                response = await self.client.post(self.base_url + path, **kwargs)
+                if response.status_code != 429 or attempt == RATE_LIMIT_RETRIES:
+                    break
+                await asyncio.sleep(self._retry_after(response, attempt))
+
+        if response.is_error:
+            raise ProviderError(
+                f"{self.__class__.__name__} {response.status_code}: {response.text}"
+            )
+        return response
+
+    def _retry_after(self, response: httpx.Response, attempt: int) -> float:
+        try:
+            return float(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            return RATE_LIMIT_BACKOFF * 2**attempt
+
+
+class ResendProvider(HttpProvider):
+    def __init__(self, client: httpx.AsyncClient):
+        super().__init__(
+            client,
+            notifications_settings.RESEND_API_URL,
+            notifications_settings.RESEND_CONCURRENCY,
+        )
+        self.headers = {"Authorization": f"Bearer {notifications_settings.RESEND_API_KEY}"}
+
+    async def send_emails(self, emails: list[dict]):
+        """Each email is a dict with from, to, subject and html or text keys"""
+        await asyncio.gather(
+            *(
+                self._post(
+                    "/emails/batch",
+                    json=emails[start : start + RESEND_BATCH_LIMIT],
+                    headers=self.headers,
+                )
+                for start in range(0, len(emails), RESEND_BATCH_LIMIT)
+            )
+        )
+
+
+class SmtpProvider:
+    def __init__(self):
+        self._limit = asyncio.Semaphore(notifications_settings.SMTP_CONCURRENCY)
+
+    async def send_emails(self, emails: list[dict]):
+        """Each email is a dict with from, to, subject and html or text keys"""
+        async with self._limit:
+            # One connection for the whole batch
+            async with aiosmtplib.SMTP(
+                hostname=notifications_settings.MAIL_SERVER,
+                port=notifications_settings.MAIL_PORT,
+                use_tls=notifications_settings.MAIL_SSL_TLS,
+                start_tls=notifications_settings.MAIL_STARTTLS,
+                validate_certs=notifications_settings.VALIDATE_CERTS,
+                username=notifications_settings.MAIL_USERNAME
+                if notifications_settings.USE_CREDENTIALS
+                else None,
+                password=notifications_settings.MAIL_PASSWORD
+                if notifications_settings.USE_CREDENTIALS
+                else None,
+            ) as smtp:
+                for email in emails:
+                    await smtp.send_message(self._message(email))
+
+    def _message(self, email: dict) -> EmailMessage:
+        message = EmailMessage()
+        message["From"] = email["from"]
+        message["To"] = ", ".join(email["to"])
+        message["Subject"] = email["subject"]
+        if email.get("html"):
+            message.set_content(email["html"], subtype="html")
+        else:
+            message.set_content(email.get("text", ""))
+        return message
+
+
+class TwilioProvider(HttpProvider):
+    def __init__(self, client: httpx.AsyncClient):
+        super().__init__(
+            client,
+            notifications_settings.TWILIO_API_URL,
+            notifications_settings.TWILIO_CONCURRENCY,
+        )
+        self.auth = (notifications_settings.TWILIO_SID, notifications_settings.TWILIO_AUTH_TOKEN)
+
+    async def send_sms(self, to: str, body: str):
+        await self._post(
+            f"/2010-04-01/Accounts/{notifications_settings.TWILIO_SID}/Messages.json",
+            data={"From": notifications_settings.TWILIO_NUMBER, "To": to, "Body": body},
+            auth=self.auth,
+        )
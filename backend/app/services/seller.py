@@ -1,12 +1,9 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from passlib.context import CryptContext
 
 from app.api.schemas.seller import SellerCreate
 from app.database.models import Seller
 from app.services.user import UserService
 
-password_context = CryptContext(schemes="bcrypt", deprecated="auto")
-
 
 class SellerService(UserService):
     def __init__(self, session: AsyncSession, tasks):
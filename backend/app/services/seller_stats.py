@@ -0,0 +1,105 @@
+"""
+Dashboard counters of each seller. They are updated in the transaction of the
+change that moves a shipment, so GET /seller/stats reads a handful of rows
+instead of counting the seller's shipments.
+"""
+
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from app.database.models import SellerDailyCount, SellerStatusCount, ShipmentStatus
+from app.services.base import BaseService
+
+# Seller, status before (None for a new shipment), status after, when (None
+# to leave it out of the daily counts), and the shipment's estimated delivery
+Transition = tuple[UUID, ShipmentStatus | None, ShipmentStatus, datetime | None, datetime]
+
+
+class SellerStatsService(BaseService):
+    def __init__(self, session: AsyncSession):
+        super().__init__(SellerStatusCount, session)
+
+    async def record(self, transitions: list[Transition]):
+        """Count shipments moving between statuses, in at most two statements"""
+        current = Counter()
+        daily = defaultdict(lambda: [0, 0])
+        for seller_id, before, after, at, estimated_delivery in transitions:
+            if before == after:
+                continue
+            if before is not None:
+                current[seller_id, before] -= 1
+            current[seller_id, after] += 1
+            if at is None:
+                continue
+
+            counts = daily[seller_id, at.date(), after]
+            counts[0] += 1
+            counts[1] += after == ShipmentStatus.delivered and at <= estimated_delivery
+
+        # Rows in key order, concurrent transactions lock them in the same order
+        await self._increment(
+            SellerStatusCount,
+            [
+                {"seller_id": seller_id, "status": status, "count": count}
+                for (seller_id, status), count in sorted(current.items())
+                if count
+            ],
+        )
+        await self._increment(
+            SellerDailyCount,
+            [
+                {
+                    "seller_id": seller_id,
+                    "day": day,
+                    "status": status,
+                    "count": count,
+                    "on_time": on_time,
+                }
+                for (seller_id, day, status), (count, on_time) in sorted(daily.items())
+            ],
+        )
+
+    async def get(self, seller_id: UUID, days: int) -> dict:
+        """Shipments per status now, and those reaching each status on the last days"""
+        counts = dict.fromkeys(ShipmentStatus, 0)
+        counts.update(
+            (
+                await self.session.execute(
+                    select(SellerStatusCount.status, SellerStatusCount.count).where(
+                        SellerStatusCount.seller_id == seller_id
+                    )
+                )
+            ).all()
+        )
+
+        daily = {}
+        delivered = on_time = 0
+        for day, status, count, delivered_on_time in await self.session.execute(
+            select(
+                SellerDailyCount.day,
+                SellerDailyCount.status,
+                SellerDailyCount.count,
+                SellerDailyCount.on_time,
+            )
+            .where(
+                SellerDailyCount.seller_id == seller_id,
+                SellerDailyCount.day > date.today() - timedelta(days=days),
+            )
+            .order_by(SellerDailyCount.day)
+        ):
+            daily.setdefault(day, dict.fromkeys(ShipmentStatus, 0))[status] = count
+            if status == ShipmentStatus.delivered:
+                delivered += count
+                on_time += delivered_on_time
+
+        return {
+            "counts": counts,
+            "daily": [{"day": day, "counts": reached} for day, reached in daily.items()],
+            "delivered": delivered,
+            "delivered_on_time": on_time,
+            "on_time_rate": on_time / delivered if delivered else None,
+        }
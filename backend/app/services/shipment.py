@@ -1,17 +1,36 @@
+from collections import defaultdict
 from datetime import datetime, timedelta
-from uuid import UUID
+from itertools import zip_longest
+from uuid import UUID, uuid4
 
+from sqlalchemy import delete, exists, insert, literal, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import Sequence, func, select
 
-from app.api.core.exceptions import ClientNotAuthorizedError, EntityNotFoundError, InvalidTokenError
-from app.api.schemas.shipment import ShipmentCreate, ShipmentUpdate
-from app.database.models import DeliveryPartner, Review, Seller, Shipment, ShipmentStatus, TagName
-from app.database.redis import get_shipment_verification_code
+from app.api.core.exceptions import ClientNotAuthorizedError, DeliveryPartnerNotAvailableError, EntityNotFoundError, InvalidCursorError, InvalidStatusUpdateError, InvalidTokenError, ReviewAlreadySubmittedError
+from app.api.schemas.shipment import ShipmentCreate, ShipmentScan, ShipmentUpdate
+from app.database.models import DeliveryPartner, Review, Shipment, ShipmentStatus, ShipmentTag, Tag, TagName
+from app.database.redis import get_shipment_verification_code, get_shipment_verification_codes
 from app.services.base import BaseService
 from app.services.delivery_partner import DeliveryPartnerService
+from app.services.principal import Principal
+from app.services.profiles import SHIPMENT_DETAIL, SHIPMENT_SUMMARY
 # from app.services.notification import NotificationService
 from app.services.shipment_event import ShipmentEventService
-from app.utils import decode_url_safe_token
+from app.services.tag import get_tag_id
+from app.services.tracking import invalidate_tracking
+from app.utils import decode_cursor, decode_url_safe_token, encode_cursor
+
+
+def _can_move(current: ShipmentStatus, requested: ShipmentStatus | None) -> bool:
+    """
+    Whether a partner's update may apply to a shipment in the current status.
+    Delivered and cancelled shipments are finished, their partner's capacity
+    was released already, and only the seller cancels a shipment.
+    """
+    return current not in (ShipmentStatus.delivered, ShipmentStatus.cancelled) and (
+        requested not in (ShipmentStatus.placed, ShipmentStatus.cancelled)
+    )
 
 
 class ShipmentService(BaseService):
@@ -27,13 +46,81 @@ class ShipmentService(BaseService):
         # self.notification=notification
 
     async def get(self, id: UUID) -> Shipment | None:
-        shipment = await self._get(id)
+        shipment = await self._get(id, SHIPMENT_DETAIL)
 
         if not shipment:
             raise EntityNotFoundError()
         return shipment
 
-    async def add(self, shipment_create: ShipmentCreate, seller: Seller) -> Shipment:
+    async def get_page(
+        self,
+        *criteria,
+        limit: int,
+        cursor: str | None = None,
+    ) -> tuple[Sequence[Shipment], str | None]:
+        """
+        Newest first page of shipments matching the criteria, keyed on
+        (created_at, id). Returns the page and the cursor of the next one.
+        """
+        return await self._page(select(Shipment).where(*criteria), limit, cursor)
+
+    async def get_tagged_page(
+        self,
+        tag_name: TagName,
+        *criteria,
+        limit: int,
+        cursor: str | None = None,
+    ) -> tuple[Sequence[Shipment], str | None]:
+        """
+        Page of the shipments matching the criteria that carry the tag, as
+        get_page. Both sides of the join are indexed, the planner walks the
+        criteria's index for a common tag and the tag's shipments for a
+        rare one, so neither pages through every shipment carrying the tag.
+        """
+        tag_id = await get_tag_id(self.session, tag_name)
+        query = (
+            select(Shipment)
+            .join(ShipmentTag, ShipmentTag.shipment_id == Shipment.id)
+            .where(ShipmentTag.tag_id == tag_id, *criteria)
+        )
+        return await self._page(query, limit, cursor)
+
+    async def _page(
+        self, query, limit: int, cursor: str | None
+    ) -> tuple[Sequence[Shipment], str | None]:
+        if cursor:
+            key = decode_cursor(cursor)
+            if key is None:
+                raise InvalidCursorError()
+            query = query.where(tuple_(Shipment.created_at, Shipment.id) < key)
+
+        shipments = (
+            await self.session.scalars(
+                query.order_by(Shipment.created_at.desc(), Shipment.id.desc())
+                .limit(limit + 1)
+                .options(*SHIPMENT_SUMMARY)
+            )
+        ).all()
+
+        if len(shipments) <= limit:
+            return shipments, None
+
+        last = shipments[limit - 1]
+        return shipments[:limit], encode_cursor(last.created_at, last.id)
+
+    async def count_by_tag(self, *criteria) -> dict[TagName, int]:
+        """Shipments matching the criteria carrying each tag, in one query"""
+        counts = await self.session.execute(
+            select(Tag.name, func.count())
+            .select_from(Shipment)
+            .join(ShipmentTag, ShipmentTag.shipment_id == Shipment.id)
+            .join(Tag, Tag.id == ShipmentTag.tag_id)
+            .where(*criteria)
+            .group_by(Tag.name)
+        )
+        return {name: 0 for name in TagName} | dict(counts.all())
+
+    async def add(self, shipment_create: ShipmentCreate, seller: Principal) -> Shipment:
         new_shipment = Shipment(
             **shipment_create.model_dump(),
             estimated_delivery=datetime.now() + timedelta(days=3),
@@ -43,27 +130,97 @@ class ShipmentService(BaseService):
         new_shipment.delivery_partner_id = partner.id
         shipment = await self._add(new_shipment)
 
-        event = await self.event_service.add(
-            shipment=shipment,
-            location=seller.zipcode if seller.zipcode else 000000,
-            status=ShipmentStatus.placed,
-            description=f"Shipment assigned to {partner.name}",
-        )
+        event = await self.event_service.add_placed(shipment, seller, partner)
 
         shipment.timeline.append(event)
         return shipment
 
+    async def add_batch(
+        self,
+        shipments_create: list[ShipmentCreate],
+        seller: Principal,
+        notify: bool = True,
+    ) -> list[dict]:
+        results = [{"index": index} for index in range(len(shipments_create))]
+        # Plain rows, building a model per shipment costs more than the insert
+        rows = [shipment_create.model_dump() for shipment_create in shipments_create]
+
+        # Reserve partner capacity once per destination for all of its
+        # shipments. Delivered and cancelled ones of an import reserve none.
+        by_destination = defaultdict(list)
+        finished = defaultdict(list)
+        for index, row in enumerate(rows):
+            if row.get("status") in (ShipmentStatus.delivered, ShipmentStatus.cancelled):
+                finished[row["destination"]].append(index)
+            else:
+                by_destination[row["destination"]].append(index)
+
+        assigned: list[tuple[int, DeliveryPartner | None]] = []
+        for destination, indices in by_destination.items():
+            reservations = await self.partner_service.reserve_capacity_bulk(
+                destination, len(indices)
+            )
+            slots = [partner for partner, count in reservations for _ in range(count)]
+            assigned.extend(zip_longest(indices, slots))
+        for destination, indices in finished.items():
+            partner = await self.partner_service.get_serving_partner(destination)
+            assigned.extend((index, partner) for index in indices)
+
+        new_shipments: list[dict] = []
+        partners: dict[UUID, DeliveryPartner] = {}
+        placed_at = datetime.now()
+
+        for index, partner in sorted(assigned, key=lambda item: item[0]):
+            if partner is None:
+                results[index]["error"] = DeliveryPartnerNotAvailableError.__doc__
+                continue
+
+            # Imported rows may carry their history, new ones start placed now
+            row = rows[index]
+            created_at = row.pop("created_at", None) or placed_at
+            estimated_delivery = row.pop("estimated_delivery", None) or (
+                created_at + timedelta(days=3)
+            )
+            status = row.pop("status", ShipmentStatus.placed)
+            shipment = {
+                **row,
+                "id": uuid4(),
+                "created_at": created_at,
+                "estimated_delivery": estimated_delivery,
+                "status": status,
+                "last_event_at": created_at,
+                "last_location": row["destination"]
+                if status == ShipmentStatus.delivered
+                else seller.zipcode if seller.zipcode else 0,
+                "seller_id": seller.id,
+                "delivery_partner_id": partner.id,
+            }
+            partners[partner.id] = partner
+            new_shipments.append(shipment)
+            results[index]["id"] = shipment["id"]
+
+        if new_shipments:
+            await self.session.execute(insert(Shipment), new_shipments)
+            await self.event_service.add_placed_batch(
+                new_shipments, seller, partners, notify=notify
+            )
+
+        return results
+
     async def update(
         self,
         id: UUID,
         shipment_update: ShipmentUpdate,
-        partner: DeliveryPartner,
+        partner: Principal,
     ) -> Shipment:
         shipment = await self.get(id)
 
         if shipment.delivery_partner_id != partner.id:
             raise ClientNotAuthorizedError()
 
+        if not _can_move(shipment.status, shipment_update.status):
+            raise InvalidStatusUpdateError()
+
         if shipment_update.status == ShipmentStatus.delivered:
             code = await get_shipment_verification_code(shipment.id)
             if int(code) != shipment_update.verification_code:
@@ -79,23 +236,100 @@ class ShipmentService(BaseService):
         if shipment_update.estimated_delivery:
             shipment.estimated_delivery = shipment_update.estimated_delivery
 
+        if shipment_update.status == ShipmentStatus.delivered:
+            await self._release_partner(shipment)
+
         if len(update_data) > 1 or not shipment_update.estimated_delivery:
+            # The estimate is not part of the event, it is set on the shipment
             await self.event_service.add(
                 shipment=shipment,
-                **update_data,
+                **{k: v for k, v in update_data.items() if k != "estimated_delivery"},
             )
+        else:
+            # No event, which would have dropped the cached tracking pages
+            self.event_service.tasks.add_task(invalidate_tracking, shipment.id)
 
         shipment.sqlmodel_update(update_data)
 
         return await self._update(shipment)
 
-    async def cancel(self, id: UUID, reason: str | None, seller: Seller) -> Shipment:
+    async def update_batch(self, scans: list[ShipmentScan], partner: Principal) -> list[dict]:
+        """
+        Apply many scans of the partner's shipments in a fixed number of
+        statements, the result of each is reported by its index
+        """
+        results = [{"index": index} for index in range(len(scans))]
+
+        shipments = {
+            row.id: row
+            for row in await self.session.execute(
+                select(
+                    Shipment.id,
+                    Shipment.status,
+                    Shipment.seller_id,
+                    Shipment.delivery_partner_id,
+                    Shipment.created_at,
+                    Shipment.estimated_delivery,
+                    Shipment.customer_email,
+                    Shipment.customer_phone,
+                ).where(Shipment.id.in_({scan.id for scan in scans}))
+            )
+        }
+
+        delivering = [scan.id for scan in scans if scan.status == ShipmentStatus.delivered]
+        codes = (
+            dict(zip(delivering, await get_shipment_verification_codes(delivering)))
+            if delivering
+            else {}
+        )
+
+        # Status of each shipment as the scans before apply
+        statuses = {id: shipment.status for id, shipment in shipments.items()}
+        accepted = []
+        delivered = 0
+
+        for index, scan in enumerate(scans):
+            shipment = shipments.get(scan.id)
+            status = scan.status if scan.status else statuses.get(scan.id)
+
+            if shipment is None:
+                error = EntityNotFoundError
+            elif shipment.delivery_partner_id != partner.id:
+                error = ClientNotAuthorizedError
+            elif not _can_move(statuses[scan.id], scan.status):
+                error = InvalidStatusUpdateError
+            elif status == ShipmentStatus.delivered and codes[scan.id] != str(
+                scan.verification_code
+            ):
+                error = ClientNotAuthorizedError
+            else:
+                error = None
+
+            if error is not None:
+                results[index]["error"] = error.__doc__
+                continue
+
+            statuses[scan.id] = status
+            delivered += status == ShipmentStatus.delivered
+            accepted.append((shipment, scan.location, status, scan.description))
+            results[index]["status"] = status
+
+        if accepted:
+            await self.event_service.add_scans(accepted, partner)
+        if delivered:
+            await self.partner_service.release_capacity(partner.id, delivered)
+
+        return results
+
+    async def cancel(self, id: UUID, reason: str | None, seller: Principal) -> Shipment:
         # Validate seller
         shipment = await self.get(id)
 
         if shipment.seller_id != seller.id:
             raise ClientNotAuthorizedError()
 
+        await self._release_partner(shipment)
+
         event = await self.event_service.add(
             shipment=shipment, status=ShipmentStatus.cancelled, description=reason
         )
@@ -103,23 +337,61 @@ class ShipmentService(BaseService):
         shipment.timeline.append(event)
         return shipment
 
+    async def _release_partner(self, shipment: Shipment) -> None:
+        # Free the partner's capacity once, when the shipment is finished
+        if shipment.status not in (ShipmentStatus.delivered, ShipmentStatus.cancelled):
+            await self.partner_service.release_capacity(shipment.delivery_partner_id)
+
     async def delete(self, id: UUID) -> None:
         await self._delete(await self.get(id))
 
-    async def add_tag(self, id:UUID, tag_name:TagName)->None:
-        shipment = await self.get(id)
-        shipment.tags.append(await tag_name.tag(self.session))
-        return await self._update(shipment)
-    
-    async def remove_tag(self, id:UUID, tag_name:TagName)->None:
+    async def add_tag(self, id: UUID, tag_name: TagName) -> Shipment:
+        await self._set_tag(tag_name, False, Shipment.id == id)
+        # Read after the change, raises when there is no such shipment
         shipment = await self.get(id)
-        try:
-            shipment.tags.remove(await tag_name.tag(self.session))
-        except ValueError:
-            raise EntityNotFoundError
-        return await self._update(shipment)
+        self.event_service.tasks.add_task(invalidate_tracking, id)
+        return shipment
 
+    async def remove_tag(self, id: UUID, tag_name: TagName) -> Shipment:
+        if not await self._set_tag(tag_name, True, Shipment.id == id):
+            raise EntityNotFoundError()
+        self.event_service.tasks.add_task(invalidate_tracking, id)
+        return await self.get(id)
+
+    async def tag_batch(
+        self, ids: list[UUID], tag_name: TagName, seller: Principal, remove: bool = False
+    ) -> int:
+        """Add or remove a tag on many shipments of the seller, returns how many changed"""
+        changed = await self._set_tag(
+            tag_name, remove, Shipment.id.in_(ids), Shipment.seller_id == seller.id
+        )
+        self.event_service.tasks.add_task(invalidate_tracking, *ids)
+        return changed
+
+    async def _set_tag(self, tag_name: TagName, remove: bool, *criteria) -> int:
+        # A single statement whatever the number of shipments carrying the tag,
+        # neither the tag nor the shipments are loaded
+        tag_id = await get_tag_id(self.session, tag_name)
+        shipments = select(Shipment.id).where(*criteria)
+
+        if remove:
+            statement = (
+                delete(ShipmentTag)
+                .where(ShipmentTag.tag_id == tag_id, ShipmentTag.shipment_id.in_(shipments))
+                .execution_options(synchronize_session=False)
+            )
+        else:
+            statement = insert(ShipmentTag).from_select(
+                ["shipment_id", "tag_id"],
+                shipments.add_columns(literal(tag_id, ShipmentTag.tag_id.type)).where(
+                    ~exists().where(
+                        ShipmentTag.shipment_id == Shipment.id, ShipmentTag.tag_id == tag_id
+                    )
+                ),
+            )
 
+        result = await self.session.execute(statement)
+        return result.rowcount
 
     async def add_review(self, token: str, rating: int, comment: str) -> None:
 
@@ -129,13 +401,25 @@ class ShipmentService(BaseService):
             raise InvalidTokenError()
         shipment= await self._get(UUID(token_data["id"]))
 
+        # A review link can be submitted again, the shipment row is locked so
+        # concurrent submissions see each other's review
+        await self.session.execute(
+            select(Shipment.id).where(Shipment.id == shipment.id).with_for_update()
+        )
+        if await self.session.scalar(
+            select(exists().where(Review.shipment_id == shipment.id))
+        ):
+            raise ReviewAlreadySubmittedError()
+
         new_review = Review(
             rating=rating,
             comment=comment if comment else None,
             shipment_id=shipment.id,
         )
 
-        self.session.add(new_review)
-        await self.session.commit()
+        await self._add(new_review)
+        await self.event_service.partner_stats.record_review(
+            shipment.delivery_partner_id, rating
+        )
 
 
@@ -1,19 +1,40 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
 from random import randint
+from uuid import UUID, uuid4
+
+from fastapi import BackgroundTasks
+from sqlalchemy import Row, insert, update
 
 from app.config import app_settings
-from app.database.models import Shipment, ShipmentEvent, ShipmentStatus
-from app.database.redis import add_shipment_verification_code
+from app.database.models import (
+    DeliveryPartner,
+    Shipment,
+    ShipmentEvent,
+    ShipmentStatus,
+)
+from app.database.redis import add_shipment_verification_code, add_shipment_verification_codes
 from app.services.base import BaseService
-from app.services.notification import NotificationService
+from app.services.outbox import NotificationOutboxService
+from app.services.partner_stats import PartnerStatsService
+from app.services.principal import Principal
+from app.services.seller_stats import SellerStatsService
+from app.services.stream import publish_shipment_event, publish_shipment_events
+from app.services.tracking import invalidate_tracking
 from app.utils import generate_url_safe_token
 # from app.worker.tasks import send_sms, send_templated_email
 
 
 
 class ShipmentEventService(BaseService):
-    def __init__(self, session, tasks):
+    def __init__(self, session, tasks: BackgroundTasks):
         super().__init__(ShipmentEvent, session)
-        self.notification=NotificationService(tasks)
+        self.tasks = tasks
+        # Notifications commit with the event and are sent by the outbox drainer
+        self.notification=NotificationOutboxService(session)
+        # Dashboard counters and partner rollups move with the shipments
+        self.stats = SellerStatsService(session)
+        self.partner_stats = PartnerStatsService(session)
         
 
     async def add(
@@ -23,12 +44,249 @@ class ShipmentEventService(BaseService):
         status: ShipmentStatus = None,
         description: str = None,
     ) -> ShipmentEvent:
-        if not location or not status:
-            last_event = await self.get_latest_event(shipment)
-            location = location if location else last_event.location
-            status = status if status else last_event.status
+        # Missing details carry over from the latest event
+        location = location if location is not None else shipment.last_location
+        status = status if status else shipment.status
+
+        previous = shipment.status
+        new_event = self._new_event(shipment, location, status, description)
+        await self.stats.record(
+            [
+                (
+                    shipment.seller_id,
+                    previous,
+                    status,
+                    new_event.created_at,
+                    shipment.estimated_delivery,
+                )
+            ]
+        )
+        if status == ShipmentStatus.delivered and previous != status:
+            await self.partner_stats.record_deliveries(
+                [
+                    (
+                        shipment.delivery_partner_id,
+                        shipment.created_at,
+                        new_event.created_at,
+                        shipment.estimated_delivery,
+                    )
+                ]
+            )
+
+        await self._notify(shipment, status)
+        # Cached tracking pages show the latest event, live streams get it
+        # once committed
+        self.tasks.add_task(invalidate_tracking, shipment.id)
+        self.tasks.add_task(publish_shipment_event, new_event)
+
+        return await self._add(new_event)
+
+    async def add_placed(
+        self,
+        shipment: Shipment,
+        seller: Principal,
+        partner: DeliveryPartner,
+    ) -> ShipmentEvent:
+        """Initial placed event of a new shipment, its parties are passed in"""
+        new_event = self._new_event(
+            shipment,
+            seller.zipcode if seller.zipcode else 0,
+            ShipmentStatus.placed,
+            f"Shipment assigned to {partner.name}",
+        )
+        await self.stats.record(
+            [
+                (
+                    shipment.seller_id,
+                    None,
+                    ShipmentStatus.placed,
+                    new_event.created_at,
+                    shipment.estimated_delivery,
+                )
+            ]
+        )
+
+        await self.notification.send_templated_email(
+            **self._placed_email(shipment.id, shipment.customer_email, seller, partner),
+            template_name="mail_placed.html",
+        )
+
+        return await self._add(new_event)
+
+    async def add_placed_batch(
+        self,
+        shipments: list[dict],
+        seller: Principal,
+        partners: dict[UUID, DeliveryPartner],
+        notify: bool = True,
+    ):
+        """
+        Insert the first event of many new shipments at once, each given as
+        the row inserted by ShipmentService.add_batch. Imported shipments
+        past placed start in their imported status.
+        """
+        # Plain rows, building a model per event costs more than the insert
+        await self.session.execute(
+            insert(ShipmentEvent),
+            [
+                {
+                    "id": uuid4(),
+                    "created_at": shipment["last_event_at"],
+                    "location": shipment["last_location"],
+                    "status": shipment["status"],
+                    "description": f"Shipment assigned to {partners[shipment['delivery_partner_id']].name}"
+                    if shipment["status"] == ShipmentStatus.placed
+                    else f"Imported as {shipment['status'].value}",
+                    "shipment_id": shipment["id"],
+                }
+                for shipment in shipments
+            ],
+        )
+        # Imported shipments past placed did not reach their status on the
+        # day they were created, they are only added to the current counts
+        await self.stats.record(
+            [
+                (
+                    shipment["seller_id"],
+                    None,
+                    shipment["status"],
+                    shipment["last_event_at"]
+                    if shipment["status"] == ShipmentStatus.placed
+                    else None,
+                    shipment["estimated_delivery"],
+                )
+                for shipment in shipments
+            ]
+        )
+
+        if not notify:
+            return
+        await self.notification.send_templated_emails(
+            [
+                self._placed_email(
+                    shipment["id"],
+                    shipment["customer_email"],
+                    seller,
+                    partners[shipment["delivery_partner_id"]],
+                )
+                for shipment in shipments
+            ],
+            template_name="mail_placed.html",
+        )
+
+    async def add_scans(
+        self,
+        scans: list[tuple[Row, int, ShipmentStatus, str | None]],
+        partner: Principal,
+    ) -> list[ShipmentEvent]:
+        """
+        Record many validated scans at once, each a shipment row with its id,
+        status, seller_id, created_at, estimated_delivery, customer_email and
+        customer_phone, then the scanned location, status and description. A
+        shipment scanned more than once ends up in the state of its last scan.
+        """
+        now = datetime.now()
+        events = [
+            ShipmentEvent(
+                # Distinct times keep the scans of a shipment in order
+                created_at=now + timedelta(microseconds=index),
+                location=location,
+                status=status,
+                description=description
+                if description
+                else self._generate_description(status, location),
+                shipment_id=shipment.id,
+            )
+            for index, (shipment, location, status, description) in enumerate(scans)
+        ]
+        await self.session.execute(
+            insert(ShipmentEvent), [event.model_dump(exclude_none=True) for event in events]
+        )
 
+        transitions = []
+        deliveries = []
+        # Scans moving a shipment to another status, only those notify
+        changes = []
+        statuses = {}
+        for (shipment, _, status, _), event in zip(scans, events):
+            previous = statuses.get(shipment.id, shipment.status)
+            if previous != status:
+                changes.append((shipment, status))
+            transitions.append(
+                (
+                    shipment.seller_id,
+                    previous,
+                    status,
+                    event.created_at,
+                    shipment.estimated_delivery,
+                )
+            )
+            if status == ShipmentStatus.delivered and previous != status:
+                deliveries.append(
+                    (
+                        partner.id,
+                        shipment.created_at,
+                        event.created_at,
+                        shipment.estimated_delivery,
+                    )
+                )
+            statuses[shipment.id] = status
+        await self.stats.record(transitions)
+        await self.partner_stats.record_deliveries(deliveries)
+
+        latest = {event.shipment_id: event for event in events}
+        await self.session.execute(
+            update(Shipment),
+            [
+                {
+                    "id": id,
+                    "status": event.status,
+                    "last_location": event.location,
+                    "last_event_at": event.created_at,
+                }
+                for id, event in latest.items()
+            ],
+        )
+
+        codes = {}
+        messages = []
+        emails = defaultdict(list)
+        for shipment, status in changes:
+            if status == ShipmentStatus.in_transit:
+                continue
+
+            code = None
+            if status == ShipmentStatus.out_for_delivery:
+                code = codes[shipment.id] = randint(100_000, 999_999)
+                if shipment.customer_phone:
+                    messages.append(
+                        {"to": shipment.customer_phone, "body": self._code_message(code)}
+                    )
+
+            template_name, email = self._email(
+                shipment.id, shipment.customer_email, status, partner.name, None, code
+            )
+            emails[template_name].append(email)
+
+        if codes:
+            await add_shipment_verification_codes(codes)
+        await self.notification.send_sms_messages(messages)
+        for template_name, templated in emails.items():
+            await self.notification.send_templated_emails(templated, template_name)
+
+        self.tasks.add_task(invalidate_tracking, *latest)
+        self.tasks.add_task(publish_shipment_events, events)
+        return events
+
+    def _new_event(
+        self,
+        shipment: Shipment,
+        location: int,
+        status: ShipmentStatus,
+        description: str | None,
+    ) -> ShipmentEvent:
         new_event = ShipmentEvent(
+            created_at=datetime.now(),
             location=location,
             status=status,
             description=description
@@ -37,14 +295,22 @@ class ShipmentEventService(BaseService):
             shipment_id=shipment.id,
         )
 
-        await self._notify(shipment, status)
+        shipment.status = new_event.status
+        shipment.last_location = new_event.location
+        shipment.last_event_at = new_event.created_at
 
-        return await self._add(new_event)
+        return new_event
 
-    async def get_latest_event(self, shipment: Shipment):
-        timeline = shipment.timeline
-        timeline.sort(key=lambda x: x.created_at)
-        return timeline[-1]
+    def _placed_email(
+        self,
+        shipment_id: UUID,
+        customer_email: str,
+        seller: Principal,
+        partner: DeliveryPartner,
+    ) -> dict:
+        return self._email(
+            shipment_id, customer_email, ShipmentStatus.placed, partner.name, seller.name
+        )[1]
 
     def _generate_description(self, status: ShipmentStatus, location: int) -> str:
         match status:
@@ -63,59 +329,76 @@ class ShipmentEventService(BaseService):
         if status == ShipmentStatus.in_transit:
             return
 
-        subject: str
-        context = {}
-        template_name: str
+        code = None
+        if status == ShipmentStatus.out_for_delivery:
+            code = randint(100_000, 999_999)
+            await add_shipment_verification_code(shipment.id, code)
+
+            if shipment.customer_phone:
+                await self.notification.send_sms(
+                    to=shipment.customer_phone, body=self._code_message(code)
+                )
 
+        template_name, email = self._email(
+            shipment.id,
+            shipment.customer_email,
+            status,
+            shipment.delivery_partner.name if shipment.delivery_partner else None,
+            shipment.seller.name if shipment.seller else None,
+            code,
+        )
+        await self.notification.send_templated_email(**email, template_name=template_name)
+
+    def _email(
+        self,
+        shipment_id: UUID,
+        customer_email: str,
+        status: ShipmentStatus,
+        partner_name: str | None,
+        seller_name: str | None,
+        code: int | None = None,
+    ) -> tuple[str, dict]:
+        """Template and email telling the customer about the new status"""
         match status:
             case ShipmentStatus.placed:
                 subject = "Shipment order received!"
                 context = {
-                    "id": shipment.id,
-                    "seller": shipment.seller.name,
-                    "partner": shipment.delivery_partner.name,
-                    "domain":app_settings.BACKEND_APP_DOMAIN
+                    "id": shipment_id,
+                    "seller": seller_name,
+                    "partner": partner_name,
+                    "domain": app_settings.BACKEND_APP_DOMAIN,
                 }
                 template_name = "mail_placed.html"
 
             case ShipmentStatus.out_for_delivery:
                 subject = "Your order is out for delivery!"
                 context = {
-                    "partner": shipment.delivery_partner.name,
+                    "partner": partner_name,
+                    "verification_code": code,
                 }
                 template_name = "mail_out_for_delivery.html"
 
-                code = randint(100_000, 999_999)
-
-                await add_shipment_verification_code(shipment.id, code)
-
-                if shipment.customer_phone:
-                    self.notification.send_sms(
-                        to=shipment.customer_phone,
-                        body=f"Your order is arriving soon. Please provide the OTP {code} to the delivery executive to receive your package."
-                    )
-                
-                context["verification_code"]=code
-
             case ShipmentStatus.delivered:
                 subject = "Your order has been delivered!"
-                token = generate_url_safe_token({"id":str(shipment.id)})
+                token = generate_url_safe_token({"id": str(shipment_id)})
                 context = {
-                    "partner": shipment.delivery_partner.name,
-                    "review_url":f"http://{app_settings.BACKEND_APP_DOMAIN}/shipment/review?token={token}"
+                    "partner": partner_name,
+                    "review_url": f"http://{app_settings.BACKEND_APP_DOMAIN}/shipment/review?token={token}",
                 }
                 template_name = "mail_delivered.html"
 
             case ShipmentStatus.cancelled:
                 subject = "Shipment order cancelled"
                 context = {
-                    "seller": shipment.seller.name,
+                    "seller": seller_name,
                 }
                 template_name = "mail_cancelled.html"
 
-        self.notification.send_templated_email(
-            recipients=[shipment.customer_email],
-            subject=subject,
-            context=context,
-            template_name=template_name,
-        )
+        return template_name, {
+            "recipients": [customer_email],
+            "subject": subject,
+            "context": context,
+        }
+
+    def _code_message(self, code: int) -> str:
+        return f"Your order is arriving soon. Please provide the OTP {code} to the delivery executive to receive your package."
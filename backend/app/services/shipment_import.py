@@ -0,0 +1,186 @@
+"""
+Bulk imports of shipments from CSV or NDJSON uploads.
+
+An upload is saved to a temporary file and imported by a task of the worker
+that received it. The file is read and validated IMPORT_CHUNK_SIZE rows at a
+time off the event loop, and each chunk is assigned to partners and inserted
+in its own transaction, like a batch submission. Progress and the errors of
+rejected rows are kept in Redis under the job id, any worker can report them.
+
+Rows may carry the status, created_at and estimated_delivery of shipments
+from the seller's history. Delivered and cancelled ones reserve no partner
+capacity.
+"""
+
+import asyncio
+import csv
+import json
+import os
+import tempfile
+from itertools import islice
+from typing import Iterator
+from uuid import UUID, uuid4
+
+from fastapi import BackgroundTasks, UploadFile
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy.orm import sessionmaker
+
+from app.api.core.exceptions import EntityNotFoundError
+from app.api.schemas.shipment import ShipmentImportRow
+from app.database.redis import create_import_job, get_import_job, update_import_job
+from app.services.delivery_partner import DeliveryPartnerService
+from app.services.principal import Principal
+from app.services.shipment import ShipmentService
+from app.services.shipment_event import ShipmentEventService
+
+# Rows validated and inserted per transaction
+IMPORT_CHUNK_SIZE = 5000
+# Errors kept per job, the first rejected rows
+IMPORT_MAX_ERRORS = 1000
+# Seconds a job's progress is kept
+IMPORT_JOB_TTL = 24 * 60 * 60
+
+_shipments = TypeAdapter(list[ShipmentImportRow])
+
+# Running imports, referenced until they finish
+_jobs: set[asyncio.Task] = set()
+
+
+async def start_import(
+    upload: UploadFile,
+    format: str,
+    seller: Principal,
+    session_factory: sessionmaker,
+) -> UUID:
+    """Save the upload and import it in the background, returns the job id"""
+    id = uuid4()
+    # Disk writes run in a thread, off the event loop
+    file = await asyncio.to_thread(
+        tempfile.NamedTemporaryFile, suffix=f".{format}", delete=False
+    )
+    try:
+        while chunk := await upload.read(1 << 20):
+            await asyncio.to_thread(file.write, chunk)
+    finally:
+        await asyncio.to_thread(file.close)
+
+    await create_import_job(id, seller.id, IMPORT_JOB_TTL)
+    job = asyncio.create_task(_import(id, file.name, format, seller, session_factory))
+    _jobs.add(job)
+    job.add_done_callback(_jobs.discard)
+    return id
+
+
+async def get_import(id: UUID, seller: Principal) -> dict:
+    found = await get_import_job(id)
+    if found is None or found[0]["seller_id"] != str(seller.id):
+        raise EntityNotFoundError()
+
+    job, errors = found
+    return {
+        "id": id,
+        "status": job["status"],
+        "rows": int(job["rows"]),
+        "imported": int(job["imported"]),
+        "failed": int(job["failed"]),
+        "errors": [json.loads(error) for error in errors],
+    }
+
+
+async def _import(
+    id: UUID, path: str, format: str, seller: Principal, session_factory: sessionmaker
+):
+    try:
+        with open(path, newline="", encoding="utf-8-sig") as file:
+            rows = _read(file, format)
+            while chunk := await asyncio.to_thread(_validate, rows):
+                numbers, shipments, errors = chunk
+                imported = 0
+                if shipments:
+                    results = await _insert(shipments, seller, session_factory)
+                    for result in results:
+                        if result.get("error"):
+                            errors.append((numbers[result["index"]], result["error"]))
+                        else:
+                            imported += 1
+
+                await update_import_job(
+                    id,
+                    imported,
+                    len(errors),
+                    [json.dumps({"row": row, "error": error}) for row, error in errors],
+                    IMPORT_MAX_ERRORS,
+                    IMPORT_JOB_TTL,
+                )
+        await update_import_job(id, 0, 0, [], IMPORT_MAX_ERRORS, IMPORT_JOB_TTL, "completed")
+    except asyncio.CancelledError:
+        await update_import_job(id, 0, 0, [], IMPORT_MAX_ERRORS, IMPORT_JOB_TTL, "failed")
+        raise
+    except Exception as e:
+        print(f"[Shipment Import Failed]: {e}")
+        await update_import_job(id, 0, 0, [], IMPORT_MAX_ERRORS, IMPORT_JOB_TTL, "failed")
+    finally:
+        os.unlink(path)
+
+
+async def _insert(
+    shipments: list[ShipmentImportRow], seller: Principal, session_factory: sessionmaker
+) -> list[dict]:
+    async with session_factory() as session:
+        tasks = BackgroundTasks()
+        service = ShipmentService(
+            session,
+            DeliveryPartnerService(session, tasks),
+            ShipmentEventService(session, tasks),
+        )
+        # Imported shipments were announced to their customers already
+        results = await service.add_batch(shipments, seller, notify=False)
+        await session.commit()
+    return results
+
+
+def _read(file, format: str) -> Iterator[tuple[int, dict | str]]:
+    """Rows numbered from 1, as dicts, or an error message for unreadable ones"""
+    if format == "csv":
+        for number, row in enumerate(csv.DictReader(file), 1):
+            # Empty cells take the field's default
+            yield number, {key: value for key, value in row.items() if value != ""}
+        return
+
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, "Invalid JSON"
+            continue
+        yield number, row if isinstance(row, dict) else "Row must be a JSON object"
+
+
+def _validate(
+    rows: Iterator[tuple[int, dict | str]],
+) -> tuple[list[int], list[ShipmentImportRow], list[tuple[int, str]]] | None:
+    """
+    Next chunk of rows, validated together. Returns the row numbers of the
+    valid shipments, the shipments and the errors of the invalid rows.
+    """
+    chunk = list(islice(rows, IMPORT_CHUNK_SIZE))
+    if not chunk:
+        return None
+
+    errors = [(number, row) for number, row in chunk if isinstance(row, str)]
+    readable = [(number, row) for number, row in chunk if not isinstance(row, str)]
+
+    try:
+        shipments = _shipments.validate_python([row for _, row in readable])
+    except ValidationError as e:
+        invalid = {}
+        for error in e.errors():
+            index, *field = error["loc"]
+            invalid.setdefault(index, f"{'.'.join(map(str, field))}: {error['msg']}")
+        errors.extend((readable[index][0], message) for index, message in invalid.items())
+        readable = [row for index, row in enumerate(readable) if index not in invalid]
+        shipments = _shipments.validate_python([row for _, row in readable])
+
+    return [number for number, _ in readable], shipments, errors
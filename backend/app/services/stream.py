@@ -0,0 +1,197 @@
+"""
+Live shipment events for the SSE and WebSocket tracking streams.
+
+Committed events are published on one Redis channel, every worker receives
+them through its listener and hands each to the local subscriptions following
+that shipment. A connection holds no database session, only a small queue.
+"""
+
+import asyncio
+from collections import deque
+from typing import AsyncIterator
+from uuid import UUID
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from app.api.core.exceptions import TooManySubscribersError
+from app.database.models import ShipmentEvent
+from app.database.redis import publish, publish_many, subscribe
+
+SHIPMENT_EVENTS_CHANNEL = "shipment-events"
+# Events kept per connection for a slow client, the oldest are dropped first
+STREAM_QUEUE_SIZE = 16
+# Seconds between heartbeats on an idle connection, a client that went away
+# is noticed when one fails to send
+STREAM_HEARTBEAT = 15
+# Open subscriptions per worker
+STREAM_MAX_SUBSCRIPTIONS = 50_000
+# Shipments a single connection may follow
+STREAM_MAX_SHIPMENTS = 500
+
+# Shipment id -> subscriptions following it
+_followers: dict[str, set["Subscription"]] = {}
+_subscriptions = 0
+
+
+class Subscription:
+    """Events of the shipments followed by one connection"""
+
+    __slots__ = ("events", "shipments", "_waiter")
+
+    def __init__(self):
+        global _subscriptions
+        if _subscriptions >= STREAM_MAX_SUBSCRIPTIONS:
+            raise TooManySubscribersError()
+        _subscriptions += 1
+        self.events: deque[str] = deque(maxlen=STREAM_QUEUE_SIZE)
+        self.shipments: set[str] = set()
+        # Set while the connection waits for an event
+        self._waiter: asyncio.Future | None = None
+
+    def follow(self, id: UUID):
+        key = str(id)
+        self.shipments.add(key)
+        _followers.setdefault(key, set()).add(self)
+
+    def unfollow(self, id: UUID):
+        key = str(id)
+        self.shipments.discard(key)
+        self._leave(key)
+
+    def close(self):
+        global _subscriptions
+        for key in self.shipments:
+            self._leave(key)
+        self.shipments.clear()
+        _subscriptions -= 1
+
+    def _leave(self, key: str):
+        followers = _followers.get(key)
+        if followers is not None:
+            followers.discard(self)
+            if not followers:
+                del _followers[key]
+
+    async def next(self) -> str | None:
+        """Next event as JSON, or None when a heartbeat is due"""
+        if not self.events:
+            # A bare future and timer, idle connections are kept small
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                async with asyncio.timeout(STREAM_HEARTBEAT):
+                    await self._waiter
+            except TimeoutError:
+                return None
+            finally:
+                self._waiter = None
+        return self.events.popleft()
+
+    def _put(self, event: str):
+        self.events.append(event)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def subscriptions() -> int:
+    return _subscriptions
+
+
+async def sse_events(id: UUID) -> AsyncIterator[str]:
+    """Server-Sent Events of a shipment, until the client goes away"""
+    with Subscription() as subscription:
+        subscription.follow(id)
+        while True:
+            event = await subscription.next()
+            yield ": heartbeat\n\n" if event is None else f"event: shipment\ndata: {event}\n\n"
+
+
+async def websocket_events(websocket: WebSocket):
+    """
+    Events of the shipments a client follows over a WebSocket. The client
+    sends {"follow": [ids]} and {"unfollow": [ids]}, and receives
+    {"type": "event", "event": {...}} for each new event of those shipments.
+    """
+    if subscriptions() >= STREAM_MAX_SUBSCRIPTIONS:
+        # Try again later
+        await websocket.close(code=1013)
+        return
+    await websocket.accept()
+
+    with Subscription() as subscription:
+
+        async def receive():
+            while True:
+                try:
+                    message = await websocket.receive_json()
+                    follow = [UUID(id) for id in message.get("follow", ())]
+                    unfollow = [UUID(id) for id in message.get("unfollow", ())]
+                except (ValueError, TypeError, AttributeError):
+                    await websocket.send_json({"type": "error", "detail": "Invalid message"})
+                    continue
+
+                for id in unfollow:
+                    subscription.unfollow(id)
+                if len(subscription.shipments | {str(id) for id in follow}) > STREAM_MAX_SHIPMENTS:
+                    await websocket.send_json(
+                        {
+                            "type": "error",
+                            "detail": f"Up to {STREAM_MAX_SHIPMENTS} shipments can be followed",
+                        }
+                    )
+                    continue
+                for id in follow:
+                    subscription.follow(id)
+
+        async def send():
+            while True:
+                event = await subscription.next()
+                try:
+                    await websocket.send_text(
+                        '{"type": "heartbeat"}'
+                        if event is None
+                        else f'{{"type": "event", "event": {event}}}'
+                    )
+                except (WebSocketDisconnect, RuntimeError, OSError):
+                    # The client went away
+                    return
+
+        tasks = [asyncio.create_task(receive()), asyncio.create_task(send())]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                # A disconnect ends the stream, anything else is an error
+                if not isinstance(task.exception(), WebSocketDisconnect):
+                    task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+async def publish_shipment_event(event: ShipmentEvent):
+    """Send a committed event to the streams of every worker"""
+    await publish(SHIPMENT_EVENTS_CHANNEL, _message(event))
+
+
+async def publish_shipment_events(events: list[ShipmentEvent]):
+    """Send many committed events in one round trip"""
+    await publish_many(SHIPMENT_EVENTS_CHANNEL, [_message(event) for event in events])
+
+
+def _message(event: ShipmentEvent) -> str:
+    return f"{event.shipment_id}|{event.model_dump_json()}"
+
+
+def _dispatch(message: str):
+    # Only the id is parsed, the event is passed on as published
+    key, event = message.split("|", 1)
+    for subscription in _followers.get(key, ()):
+        subscription._put(event)
+
+
+subscribe(SHIPMENT_EVENTS_CHANNEL, _dispatch)
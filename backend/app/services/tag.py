@@ -0,0 +1,34 @@
+"""
+Ids of the tags, one row per TagName. They never change once created, so they
+are read when the app starts and kept for the life of the process, tagging a
+shipment then needs no lookup of the tag.
+"""
+
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from app.api.core.exceptions import EntityNotFoundError
+from app.database.models import Tag, TagName
+from app.database.session import async_session
+
+_tag_ids: dict[TagName, UUID] = {}
+
+
+async def load_tag_ids():
+    """Warm the cache, at startup"""
+    async with async_session() as session:
+        for id, name in await session.execute(select(Tag.id, Tag.name)):
+            _tag_ids[name] = id
+
+
+async def get_tag_id(session: AsyncSession, name: TagName) -> UUID:
+    id = _tag_ids.get(name)
+    if id is None:
+        # Created after startup
+        id = await session.scalar(select(Tag.id).where(Tag.name == name))
+        if id is None:
+            raise EntityNotFoundError()
+        _tag_ids[name] = id
+    return id
@@ -0,0 +1,104 @@
+"""
+Public tracking responses, cached in Redis per shipment and representation.
+
+Responses carry an ETag, a digest of the body. A request sending a matching
+If-None-Match gets a 304 after a single Redis lookup, without Postgres. The
+cache entry of a shipment is deleted once a change to it is committed, see
+invalidate_tracking.
+"""
+
+import asyncio
+from hashlib import blake2b
+from typing import Awaitable, Callable
+from uuid import UUID
+
+from fastapi import Request, Response
+
+from app.database.redis import delete_tracking, get_tracking, get_tracking_etag, set_tracking
+
+# Seconds a rendered response is kept, bounds how long a render racing a
+# committed change can be served
+TRACKING_CACHE_TTL = 300
+
+# Renders in progress per (shipment id, representation), the concurrent misses
+# of one shipment wait for the same render instead of all loading it
+_rendering: dict[tuple[UUID, str], asyncio.Future] = {}
+
+
+async def tracking_response(
+    request: Request,
+    id: UUID,
+    kind: str,
+    media_type: str,
+    render: Callable[[], Awaitable[bytes]],
+) -> Response:
+    """
+    Cached response of the kind, e.g. "json" or "html", of a shipment's
+    tracking. On a miss the body is made by render.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        etag = await get_tracking_etag(id, kind)
+        if etag is not None and _matches(if_none_match, etag):
+            return _not_modified(etag)
+
+    cached = await get_tracking(id, kind)
+    if cached is None:
+        cached = await _render_once(id, kind, render)
+    etag, body = cached
+
+    if if_none_match and _matches(if_none_match, etag):
+        return _not_modified(etag)
+    return Response(body, media_type=media_type, headers=_headers(etag))
+
+
+async def invalidate_tracking(*ids: UUID):
+    """Drop the cached responses of shipments, after their change is committed"""
+    await delete_tracking(*ids)
+
+
+async def _render_once(
+    id: UUID, kind: str, render: Callable[[], Awaitable[bytes]]
+) -> tuple[str, bytes]:
+    key = (id, kind)
+    while (rendering := _rendering.get(key)) is not None:
+        try:
+            return await asyncio.shield(rendering)
+        except asyncio.CancelledError:
+            # The request rendering it went away, take the render over
+            if not rendering.cancelled():
+                raise
+
+    rendering = _rendering[key] = asyncio.get_running_loop().create_future()
+    try:
+        body = await render()
+        etag = f'"{blake2b(body, digest_size=16).hexdigest()}"'
+        await set_tracking(id, kind, etag, body, TRACKING_CACHE_TTL)
+    except asyncio.CancelledError:
+        rendering.cancel()
+        raise
+    except Exception as e:
+        rendering.set_exception(e)
+        # Marks it retrieved when nobody else was waiting
+        rendering.exception()
+        raise
+    else:
+        rendering.set_result((etag, body))
+        return etag, body
+    finally:
+        del _rendering[key]
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def _headers(etag: str) -> dict:
+    # Clients may keep it, but revalidate before every use
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=_headers(etag))
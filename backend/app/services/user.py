@@ -1,15 +1,16 @@
 from datetime import timedelta
 from uuid import UUID
 from fastapi import BackgroundTasks
-from passlib.context import CryptContext
 from pydantic import EmailStr
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.core.exceptions import BadCredentialsError, ClientNotVerifiedError, InvalidTokenError
+from app.api.core.security import hash_password, verify_password
 from app.database.models import User
 from app.services.base import BaseService
 from app.services.notification import NotificationService
+from app.services.principal import invalidate_principal
 from app.utils import (
     decode_url_safe_token,
     generate_access_token,
@@ -18,18 +19,16 @@ from app.utils import (
 from app.config import app_settings
 # from app.worker.tasks import send_templated_email
 
-password_context = CryptContext(schemes="bcrypt", deprecated="auto")
-
-
 class UserService(BaseService):
     def __init__(self, model: User, session: AsyncSession, tasks:BackgroundTasks):
         super().__init__(model, session)
+        self.tasks = tasks
         self.notification=NotificationService(tasks)
 
     async def _add_user(self, data: dict, router_prefix: str):
         user = self.model(
             **data,
-            password_hash=password_context.hash(data["password"]),
+            password_hash=await hash_password(data["password"]),
         )
 
         user = await self._add(user)
@@ -62,6 +61,8 @@ class UserService(BaseService):
         user = await self._get(UUID(token_data["id"]))
         user.email_verified = True
         await self._update(user)
+        # Background tasks run once the request has committed
+        self.tasks.add_task(invalidate_principal, self.model, user.id)
 
         pass
 
@@ -75,7 +76,7 @@ class UserService(BaseService):
 
         if (
             user is None
-            or password_context.verify(password, user.password_hash) is False
+            or await verify_password(password, user.password_hash) is False
         ):
             raise BadCredentialsError()
 
@@ -112,7 +113,7 @@ class UserService(BaseService):
             return False
 
         user = await self._get(UUID(token_data["id"]))
-        user.password_hash = password_context.hash(password)
+        user.password_hash = await hash_password(password)
 
         await self._update(user)
         return True
@@ -1,10 +1,13 @@
 from httpx import ASGITransport, AsyncClient
+import pytest
 import pytest_asyncio
+from sqlalchemy import event
 from sqlmodel import SQLModel
-from app.database.session import create_session
+from app.database.session import create_session, get_session_factory
 from app.main import app
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from app.database.models import DeliveryPartner, Location
 from app.tests import example
 
 engine = create_async_engine(url="sqlite+aiosqlite:///:memory:")
@@ -13,6 +16,7 @@ test_session = sessionmaker(bind=engine,class_=AsyncSession,expire_on_commit=Fal
 async def create_session_override():
     async with test_session() as session:
         yield session
+        await session.commit()
 
 @pytest_asyncio.fixture(scope="session")
 async def client():
@@ -22,6 +26,11 @@ async def client():
     ) as client:
         yield client
 
+@pytest_asyncio.fixture
+async def session():
+    async with test_session() as session:
+        yield session
+
 @pytest_asyncio.fixture(scope="session")
 async def seller_token(client: AsyncClient):
     response = await client.post(
@@ -37,11 +46,54 @@ async def seller_token(client: AsyncClient):
     return response.json()["access_token"]
     
 
+@pytest_asyncio.fixture(scope="session")
+async def partner_token(client: AsyncClient):
+    response = await client.post(
+        "/partner/login",
+        data={
+            "grant_type":"password",
+            "username":example.DELIVERY_PARTNER["email"],
+            "password":example.DELIVERY_PARTNER["password"],
+        }
+    )
+
+    assert "access_token" in response.json()
+    return response.json()["access_token"]
+
+@pytest.fixture
+def queries():
+    """SQL statements executed against the test database during a test"""
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+@pytest.fixture
+def make_partner():
+    """Builds a delivery partner serving a location, to be added to a session"""
+
+    def make(name: str, capacity: int, location: Location) -> DeliveryPartner:
+        return DeliveryPartner(
+            name=name,
+            email=f"{name.lower()}@xmailg.one",
+            password_hash="-",
+            email_verified=True,
+            max_handling_capacity=capacity,
+            serviceable_locations=[location],
+        )
+
+    return make
+
 @pytest_asyncio.fixture(scope="session",autouse=True)
 async def setup_and_teardown():
     print("Starting Tests...\n")
 
     app.dependency_overrides[create_session]= create_session_override
+    app.dependency_overrides[get_session_factory]= lambda: test_session
 
     async with engine.begin() as conn:
         from app.database.models import Shipment,Seller,DeliveryPartner # noqa: F401
@@ -1,7 +1,7 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database.models import DeliveryPartner, Location, Seller
-from app.services.user import password_context
+from app.api.core.security import password_context
 
 SELLER = {
     "name": "RainForest",
@@ -0,0 +1,179 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import BackgroundTasks
+from httpx import AsyncClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlmodel import SQLModel
+
+from app.api.core.exceptions import DeliveryPartnerNotAvailableError
+from app.api.schemas.shipment import ShipmentCreate
+from app.database.models import (
+    DeliveryPartner,
+    Location,
+    PartnerStats,
+    Seller,
+    Shipment,
+    ShipmentStatus,
+)
+from app.database.redis import add_shipment_verification_code
+from app.database.session import async_session
+from app.services.delivery_partner import DeliveryPartnerService
+from app.services.shipment import ShipmentService
+from app.services.shipment_event import ShipmentEventService
+from app.tests import example
+from app.utils import generate_url_safe_token
+
+
+@pytest.mark.asyncio
+async def test_reserve_and_release_capacity(session: AsyncSession, make_partner):
+    partner = make_partner("Courier", 1, Location(zip_code=22001))
+    session.add(partner)
+    await session.commit()
+
+    service = DeliveryPartnerService(session, None)
+    assert (await service.get_available_partner(22001)).id == partner.id
+
+    reserved = await service.reserve_capacity(22001)
+    await session.commit()
+    assert reserved.id == partner.id and reserved.active_shipment_count == 1
+
+    assert await service.get_available_partner(22001) is None
+    assert await service.reserve_capacity(22001) is None
+
+    await service.release_capacity(partner.id)
+    await session.commit()
+    assert (await service.get_available_partner(22001)).id == partner.id
+
+
+@pytest.mark.asyncio
+async def test_concurrent_submits_never_exceed_capacity(tmp_path, make_partner):
+    # SQLite serializes writers and ignores FOR UPDATE, so this checks the
+    # counter never overshoots but not the skipping of, or waiting on, rows
+    # locked by concurrent reservations on PostgreSQL
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'stress.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    seller = Seller(
+        name="Burst", email="burst@xmailg.one", password_hash="-", zipcode=33001
+    )
+    location = Location(zip_code=33001)
+    async with async_session(bind=engine) as session:
+        session.add_all(
+            [seller, make_partner("Swift", 3, location), make_partner("Rapid", 4, location)]
+        )
+        await session.commit()
+
+    async def submit():
+        async with async_session(bind=engine) as session:
+            tasks = BackgroundTasks()
+            service = ShipmentService(
+                session,
+                DeliveryPartnerService(session, tasks),
+                ShipmentEventService(session, tasks),
+            )
+            await service.add(
+                ShipmentCreate(**{**example.SHIPMENT, "destination": 33001}),
+                seller,
+            )
+            await session.commit()
+
+    results = await asyncio.gather(*(submit() for _ in range(20)), return_exceptions=True)
+
+    assert sum(result is None for result in results) == 7
+    assert all(
+        isinstance(result, DeliveryPartnerNotAvailableError)
+        for result in results
+        if result is not None
+    )
+
+    async with async_session(bind=engine) as session:
+        partners = (await session.scalars(select(DeliveryPartner))).all()
+        assert all(p.active_shipment_count == p.max_handling_capacity for p in partners)
+        assert await session.scalar(select(func.count(Shipment.id))) == 7
+
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_partners_ranked_by_on_time_deliveries(session: AsyncSession, make_partner):
+    location = Location(zip_code=22002)
+    late, punctual, new = (
+        make_partner("Late", 2, location),
+        make_partner("Punctual", 2, location),
+        make_partner("Fresh", 2, location),
+    )
+    session.add_all([late, punctual, new])
+    await session.flush()
+    session.add_all(
+        [
+            PartnerStats(partner_id=late.id, delivered=10, delivered_on_time=1),
+            PartnerStats(partner_id=punctual.id, delivered=10, delivered_on_time=9),
+        ]
+    )
+    await session.commit()
+
+    service = DeliveryPartnerService(session, None)
+    assert (await service.get_available_partner(22002)).id == punctual.id
+
+    reservations = await service.reserve_capacity_bulk(22002, 6)
+    # Partners without deliveries yet rank between good and poor ones
+    assert [partner.id for partner, _ in reservations] == [punctual.id, new.id, late.id]
+    await session.rollback()
+
+
+@pytest.mark.asyncio
+async def test_partner_stats(client: AsyncClient, partner_token: str, session: AsyncSession):
+    headers = {"Authorization": f"Bearer {partner_token}"}
+    partner = await session.scalar(
+        select(DeliveryPartner).where(DeliveryPartner.email == example.DELIVERY_PARTNER["email"])
+    )
+    seller = await session.scalar(select(Seller).where(Seller.email == example.SELLER["email"]))
+    placed_at = datetime.now() - timedelta(hours=6)
+    shipment = Shipment(
+        **example.SHIPMENT,
+        created_at=placed_at,
+        estimated_delivery=datetime.now() + timedelta(days=1),
+        status=ShipmentStatus.out_for_delivery,
+        seller_id=seller.id,
+        delivery_partner_id=partner.id,
+    )
+    session.add(shipment)
+    await session.commit()
+    await add_shipment_verification_code(shipment.id, 123456)
+
+    before = (await client.get("/partner/stats", headers=headers)).json()
+
+    response = await client.post(
+        "/shipment/update/batch",
+        json=[
+            {"id": str(shipment.id), "location": 11004, "status": "delivered", "verification_code": 123456}
+        ],
+        headers=headers,
+    )
+    assert response.json()[0]["status"] == "delivered"
+    for status_code in (200, 409):
+        # The second submission of the link is not counted again
+        response = await client.post(
+            "/shipment/review",
+            params={"token": generate_url_safe_token({"id": str(shipment.id)})},
+            data={"rating": 4, "comment": "Quick"},
+        )
+        assert response.status_code == status_code
+
+    response = await client.get("/partner/stats", headers=headers)
+    assert response.status_code == 200
+    after = response.json()
+    assert after["review_count"] == before["review_count"] + 1
+    assert after["delivered"] == before["delivered"] + 1
+    assert after["delivered_on_time"] == before["delivered_on_time"] + 1
+    assert after["average_rating"] is not None
+    # About six hours from placed to delivered
+    delivery_seconds = (
+        after["mean_delivery_seconds"] * after["delivered"]
+        - (before["mean_delivery_seconds"] or 0) * before["delivered"]
+    )
+    assert 6 * 3600 <= delivery_seconds < 6 * 3600 + 60
@@ -0,0 +1,100 @@
+from datetime import datetime
+
+from httpx import AsyncClient
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from app.database.models import DeliveryPartner, Seller, Shipment
+from app.services.principal import clear_principals
+from app.tests import example
+
+# Every relationship is loaded through an explicit profile, so the number of
+# queries an endpoint makes does not depend on how much data is related to it
+
+
+@pytest.fixture(autouse=True)
+def cold_principals():
+    # Counts below include loading the principal on the first request
+    clear_principals()
+
+
+async def _add_shipment(session: AsyncSession):
+    """A shipment of the example seller and partner, so listings are not empty"""
+    seller = await session.scalar(select(Seller).where(Seller.email == example.SELLER["email"]))
+    partner = await session.scalar(
+        select(DeliveryPartner).where(DeliveryPartner.email == example.DELIVERY_PARTNER["email"])
+    )
+    session.add(
+        Shipment(
+            **example.SHIPMENT,
+            estimated_delivery=datetime.now(),
+            seller_id=seller.id,
+            delivery_partner_id=partner.id,
+        )
+    )
+    await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_shipment_endpoints_query_count(client: AsyncClient, seller_token: str, queries: list):
+    headers = {"Authorization": f"Bearer {seller_token}"}
+
+    queries.clear()
+    response = await client.post(
+        "/shipment/submit",
+        json={**example.SHIPMENT, "destination": 11005},
+        headers=headers,
+    )
+    assert response.status_code == 201
+    # seller, capacity reservation, the seller's two counters, then the
+    # shipment, event and outbox inserts
+    assert len(queries) == 7
+
+    queries.clear()
+    response = await client.get("/shipment/", params={"id": response.json()["id"]})
+    assert response.status_code == 200
+    assert len(response.json()["timeline"]) == 1
+    # shipment with seller and partner, timeline, tags
+    assert len(queries) == 3
+
+
+@pytest.mark.asyncio
+async def test_seller_endpoints_query_count(
+    client: AsyncClient, seller_token: str, session: AsyncSession, queries: list
+):
+    headers = {"Authorization": f"Bearer {seller_token}"}
+    await _add_shipment(session)
+
+    queries.clear()
+    response = await client.get("/seller/me", headers=headers)
+    assert response.status_code == 200
+    # seller principal
+    assert len(queries) == 1
+
+    queries.clear()
+    response = await client.get("/seller/shipments", headers=headers)
+    assert response.status_code == 200
+    # shipments page, timelines, tags, the principal is cached
+    assert len(queries) == 3
+
+
+@pytest.mark.asyncio
+async def test_partner_endpoints_query_count(
+    client: AsyncClient, partner_token: str, session: AsyncSession, queries: list
+):
+    headers = {"Authorization": f"Bearer {partner_token}"}
+    await _add_shipment(session)
+
+    queries.clear()
+    response = await client.get("/partner/me", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["serviceable_zipcodes"] == example.DELIVERY_PARTNER["serviceable_zip_codes"]
+    # partner principal, then the partner and its serviceable locations
+    assert len(queries) == 3
+
+    queries.clear()
+    response = await client.get("/partner/shipments", headers=headers)
+    assert response.status_code == 200
+    # shipments page, timelines, tags, the principal is cached
+    assert len(queries) == 3
@@ -1,6 +1,11 @@
+import asyncio
+
 from httpx import AsyncClient
 import pytest
 
+from app.api.core.access_log import AccessLogMiddleware, drain_records
+from app.config import app_settings
+
 @pytest.mark.asyncio
 async def test_app(client: AsyncClient):
 
@@ -8,3 +13,63 @@ async def test_app(client: AsyncClient):
     print("[Response]:", response.json())
     assert response.status_code == 200
 
+
+@pytest.mark.asyncio
+async def test_access_log(client: AsyncClient, seller_token: str):
+    drain_records()
+
+    await client.get("/")
+    await client.get(
+        "/seller/shipments",
+        params={"status": "placed"},
+        headers={"Authorization": f"Bearer {seller_token}"},
+    )
+
+    root, shipments = drain_records()
+    assert root["method"] == "GET" and root["status"] == 200
+    assert root["queries"] == 0 and root["db_us"] == 0
+    # Logged by route template, without the query string
+    assert shipments["route"] == "/seller/shipments"
+    assert shipments["queries"] > 0 and 0 < shipments["db_us"] <= shipments["latency_us"]
+
+@pytest.mark.asyncio
+async def test_access_log_ends_with_the_response():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+        # Background tasks run once the response is sent
+        await asyncio.sleep(0.2)
+
+    async def send(message):
+        pass
+
+    drain_records()
+    await AccessLogMiddleware(app)({"type": "http", "method": "GET", "path": "/"}, None, send)
+
+    (record,) = drain_records()
+    assert record["status"] == 200 and record["latency_us"] < 100_000
+
+@pytest.mark.asyncio
+async def test_metrics(client: AsyncClient, monkeypatch):
+    await client.get("/")
+
+    # Not served until scrapers are given a token
+    response = await client.get("/metrics")
+    assert response.status_code == 404
+
+    monkeypatch.setattr(app_settings, "METRICS_TOKEN", "scraper")
+    response = await client.get("/metrics", headers={"Authorization": "Bearer wrong"})
+    assert response.status_code == 401
+
+    response = await client.get("/metrics", headers={"Authorization": "Bearer scraper"})
+    assert response.status_code == 200
+
+    lines = response.text.splitlines()
+    assert 'shippin_requests_total{route="read_root",status="200"}' in {
+        line.rsplit(" ", 1)[0] for line in lines
+    }
+    assert any(
+        line.startswith('shippin_request_duration_seconds_bucket{route="read_root",le="+Inf"}')
+        for line in lines
+    )
+    assert any(line.startswith("shippin_outbox_pending ") for line in lines)
@@ -0,0 +1,73 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from app.database.models import NotificationChannel, NotificationOutbox, NotificationStatus
+from app.worker import outbox
+
+
+class RecordingDispatcher:
+    """Dispatcher that records deliveries, the SMS provider is down"""
+
+    def __init__(self):
+        self.emails = []
+
+    async def deliver_emails(self, emails: list[dict], template_name: str):
+        self.emails.append((template_name, [email["recipients"] for email in emails]))
+
+    async def deliver_sms(self, to: str, body: str):
+        raise ConnectionError("SMS provider unavailable")
+
+
+@pytest.mark.asyncio
+async def test_drain_batches_emails_and_retries_failures(session: AsyncSession):
+    # Rows staged by other tests are not part of this one
+    for row in await session.scalars(select(NotificationOutbox)):
+        row.status = NotificationStatus.sent
+
+    session.add_all(
+        [
+            NotificationOutbox(
+                channel=NotificationChannel.email,
+                payload={
+                    "recipients": [f"customer{index}@xmailg.one"],
+                    "subject": "Shipment order received!",
+                    "context": {},
+                    "template_name": "mail_placed.html",
+                },
+            )
+            for index in range(3)
+        ]
+        + [
+            NotificationOutbox(
+                channel=NotificationChannel.sms,
+                payload={"to": "+10000000000", "body": "Arriving soon"},
+            )
+        ]
+    )
+    await session.commit()
+
+    dispatcher = RecordingDispatcher()
+    assert await outbox.drain_once(session, dispatcher) == 4
+
+    # One batch call for the emails sharing a template
+    assert len(dispatcher.emails) == 1
+    assert len(dispatcher.emails[0][1]) == 3
+
+    rows = (
+        await session.scalars(
+            select(NotificationOutbox).where(NotificationOutbox.attempts > 0)
+        )
+    ).all()
+    sent = [row for row in rows if row.status == NotificationStatus.sent]
+    retried = [row for row in rows if row.status == NotificationStatus.pending]
+    assert len(sent) == 3 and all(row.sent_at for row in sent)
+    assert len(retried) == 1
+    assert retried[0].last_error == "SMS provider unavailable"
+    assert retried[0].next_attempt_at > datetime.now()
+
+    # The failed SMS is not due again until its backoff has passed
+    assert await outbox.drain_once(session, dispatcher) == 0
+    assert await outbox.count_backlog(session) >= 1
@@ -0,0 +1,44 @@
+import httpx
+import pytest
+
+from app.services import providers
+from app.services.providers import ProviderError, ResendProvider, TwilioProvider
+
+
+def _client(*statuses: int, calls: list) -> httpx.AsyncClient:
+    """Client answering each request with the next status in line"""
+    responses = iter(statuses)
+
+    def handle(request: httpx.Request):
+        calls.append(request)
+        return httpx.Response(next(responses), headers={"Retry-After": "0"}, json={})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handle))
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_calls_are_retried():
+    calls = []
+    provider = ResendProvider(_client(429, 429, 200, 200, calls=calls))
+
+    emails = [{"from": "a@xmailg.one", "to": ["b@xmailg.one"], "subject": "Hi", "html": "Hi"}]
+    await provider.send_emails(emails * 150)
+
+    # 150 emails fit in two batch calls, each was rate limited once
+    assert len(calls) == 4
+    assert all(call.url.path == "/emails/batch" for call in calls)
+
+
+@pytest.mark.asyncio
+async def test_provider_errors_are_raised(monkeypatch):
+    monkeypatch.setattr(providers, "RATE_LIMIT_RETRIES", 1)
+    calls = []
+    provider = TwilioProvider(_client(429, 429, calls=calls))
+
+    with pytest.raises(ProviderError):
+        await provider.send_sms("+10000000000", "Arriving soon")
+    assert len(calls) == 2
+
+    provider = TwilioProvider(_client(500, calls=calls))
+    with pytest.raises(ProviderError):
+        await provider.send_sms("+10000000000", "Arriving soon")
@@ -0,0 +1,276 @@
+import re
+from datetime import datetime, timedelta
+from random import Random
+from uuid import uuid4
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel
+
+from app.database.models import (
+    DeliveryPartner,
+    Location,
+    Seller,
+    ServiceableLocation,
+    Shipment,
+    ShipmentEvent,
+    ShipmentStatus,
+    ShipmentTag,
+    Tag,
+    TagName,
+)
+from app.services.delivery_partner import DeliveryPartnerService
+from app.services.profiles import PARTNER_PROFILE
+from app.services.seller import SellerService
+from app.services import tag
+from app.services.partner_stats import PartnerStatsService
+from app.services.seller_stats import SellerStatsService
+from app.services.shipment import ShipmentService
+from app.services.shipment_event import ShipmentEventService
+
+# Tables that grow with traffic, a full scan of any of them on a hot path fails
+HOT_TABLES = {
+    "seller",
+    "delivery_partner",
+    "servicable_location",
+    "shipment",
+    "shipment_event",
+    "shipment_tag",
+    "reviews",
+    "seller_status_count",
+    "seller_daily_count",
+    "partner_stats",
+}
+
+SELLERS = 100
+PARTNERS = 100
+ZIPCODES = 200
+SHIPMENTS = 20_000
+
+engine = create_async_engine(url="sqlite+aiosqlite:///:memory:")
+plan_session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def _seed(session: AsyncSession) -> dict:
+    random = Random(7)
+    now = datetime.now()
+
+    sellers = [
+        {"id": uuid4(), "name": f"Seller {i}", "email": f"seller{i}@plan.io", "password_hash": "-", "zipcode": 10_000 + i}
+        for i in range(SELLERS)
+    ]
+    partners = [
+        {
+            "id": uuid4(),
+            "name": f"Partner {i}",
+            "email": f"partner{i}@plan.io",
+            "password_hash": "-",
+            "max_handling_capacity": SHIPMENTS,
+            "active_shipment_count": SHIPMENTS // PARTNERS,
+        }
+        for i in range(PARTNERS)
+    ]
+    zipcodes = [20_000 + i for i in range(ZIPCODES)]
+    tags = [{"id": uuid4(), "name": name} for name in TagName]
+
+    shipments, events, shipment_tags = [], [], []
+    for i in range(SHIPMENTS):
+        shipment_id = uuid4()
+        created_at = now - timedelta(minutes=i)
+        status = random.choice(list(ShipmentStatus))
+        shipments.append(
+            {
+                "id": shipment_id,
+                "created_at": created_at,
+                "customer_email": "customer@plan.io",
+                "content": "Parcel",
+                "weight": 1.0,
+                "destination": random.choice(zipcodes),
+                "estimated_delivery": created_at + timedelta(days=3),
+                "status": status,
+                "last_event_at": created_at,
+                "seller_id": sellers[i % SELLERS]["id"],
+                "delivery_partner_id": partners[i % PARTNERS]["id"],
+            }
+        )
+        for event_status in {ShipmentStatus.placed, status}:
+            events.append(
+                {"id": uuid4(), "created_at": created_at, "location": 0, "status": event_status, "shipment_id": shipment_id}
+            )
+        shipment_tags.append({"shipment_id": shipment_id, "tag_id": tags[i % len(tags)]["id"]})
+
+    await session.execute(insert(Seller), sellers)
+    await session.execute(insert(DeliveryPartner), partners)
+    await session.execute(insert(Location), [{"zip_code": zipcode} for zipcode in zipcodes])
+    await session.execute(
+        insert(ServiceableLocation),
+        [
+            {"delivery_partner_id": partner["id"], "zip_code": zipcode}
+            for i, partner in enumerate(partners)
+            for zipcode in zipcodes[i % ZIPCODES :: PARTNERS]
+        ],
+    )
+    await session.execute(insert(Tag), tags)
+    await session.execute(insert(Shipment), shipments)
+    await session.execute(insert(ShipmentEvent), events)
+    await session.execute(insert(ShipmentTag), shipment_tags)
+    await session.commit()
+
+    return {"seller": sellers[0], "partner": partners[0], "shipment": shipments[0], "zipcode": zipcodes[0]}
+
+
+@pytest_asyncio.fixture(scope="module")
+async def dataset():
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    async with plan_session() as session:
+        data = await _seed(session)
+
+    # Planner statistics, as autovacuum would keep them in production
+    async with engine.begin() as conn:
+        await conn.exec_driver_sql("ANALYZE")
+
+    yield data
+
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def session(dataset):
+    async with plan_session() as session:
+        yield session
+
+
+@pytest.fixture
+def captured():
+    """Statements and parameters executed by the service under test"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE")):
+            statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+
+async def _assert_indexed(statements: list):
+    assert statements, "no queries were captured"
+
+    async with engine.connect() as conn:
+        for statement, parameters in statements:
+            plan = (
+                await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            ).all()
+            for row in plan:
+                # Full table or full index scans, aliased tables get a _1 suffix
+                scan = re.match(r"SCAN (\w+?)(?:_\d+)?\b", row[-1])
+                if scan and scan.group(1) in HOT_TABLES:
+                    plan_text = "\n".join(row[-1] for row in plan)
+                    raise AssertionError(
+                        f"Sequential scan of {scan.group(1)}:\n{statement}\n{plan_text}"
+                    )
+
+
+def _shipment_service(session: AsyncSession) -> ShipmentService:
+    return ShipmentService(
+        session,
+        DeliveryPartnerService(session, None),
+        ShipmentEventService(session, None),
+    )
+
+
+@pytest.mark.asyncio
+async def test_login_lookup_plans(session: AsyncSession, dataset: dict, captured: list):
+    await SellerService(session, None)._get_by_email(dataset["seller"]["email"])
+    await DeliveryPartnerService(session, None)._get_by_email(dataset["partner"]["email"])
+    await _assert_indexed(captured)
+
+
+@pytest.mark.asyncio
+async def test_principal_plans(session: AsyncSession, dataset: dict, captured: list):
+    await session.get(Seller, dataset["seller"]["id"])
+    await session.get(DeliveryPartner, dataset["partner"]["id"], options=PARTNER_PROFILE)
+    await _assert_indexed(captured)
+
+
+@pytest.mark.asyncio
+async def test_partner_assignment_plans(session: AsyncSession, dataset: dict, captured: list):
+    service = DeliveryPartnerService(session, None)
+    await service.get_available_partner(dataset["zipcode"])
+    await service.reserve_capacity(dataset["zipcode"])
+    await service.reserve_capacity_bulk(dataset["zipcode"], 5)
+    await service.release_capacity(dataset["partner"]["id"])
+    await session.rollback()
+    await _assert_indexed(captured)
+
+
+@pytest.mark.asyncio
+async def test_shipment_detail_plans(session: AsyncSession, dataset: dict, captured: list):
+    await _shipment_service(session).get(dataset["shipment"]["id"])
+    await _assert_indexed(captured)
+
+
+@pytest.mark.asyncio
+async def test_shipment_listing_plans(session: AsyncSession, dataset: dict, captured: list):
+    service = _shipment_service(session)
+
+    _, cursor = await service.get_page(Shipment.seller_id == dataset["seller"]["id"], limit=20)
+    await service.get_page(Shipment.seller_id == dataset["seller"]["id"], limit=20, cursor=cursor)
+    await service.get_page(Shipment.delivery_partner_id == dataset["partner"]["id"], limit=20)
+    await service.get_page(
+        Shipment.seller_id == dataset["seller"]["id"],
+        Shipment.status == ShipmentStatus.in_transit,
+        limit=20,
+    )
+    await _assert_indexed(captured)
+
+
+@pytest.mark.asyncio
+async def test_stats_plans(session: AsyncSession, dataset: dict, captured: list):
+    await SellerStatsService(session).get(dataset["seller"]["id"], 30)
+    await PartnerStatsService(session).get(dataset["partner"]["id"])
+    await _assert_indexed(captured)
+
+
+@pytest.mark.asyncio
+async def test_tagged_shipments_plans(
+    session: AsyncSession, dataset: dict, captured: list, monkeypatch: pytest.MonkeyPatch
+):
+    # Tag ids cached by other tests belong to another database
+    monkeypatch.setattr(tag, "_tag_ids", {})
+    service = _shipment_service(session)
+
+    _, cursor = await service.get_tagged_page(
+        TagName.FRAGILE, Shipment.seller_id == dataset["seller"]["id"], limit=20
+    )
+    await service.get_tagged_page(
+        TagName.FRAGILE,
+        Shipment.delivery_partner_id == dataset["partner"]["id"],
+        Shipment.status == ShipmentStatus.in_transit,
+        limit=20,
+        cursor=cursor,
+    )
+    await service.count_by_tag(Shipment.seller_id == dataset["seller"]["id"])
+    await _assert_indexed(captured)
+
+
+@pytest.mark.asyncio
+async def test_tag_shipment_plans(
+    session: AsyncSession, dataset: dict, captured: list, monkeypatch: pytest.MonkeyPatch
+):
+    # Tag ids cached by other tests belong to another database
+    monkeypatch.setattr(tag, "_tag_ids", {})
+    service = _shipment_service(session)
+    id = dataset["shipment"]["id"]
+    await service._set_tag(TagName.RETURN, False, Shipment.id == id)
+    await service._set_tag(
+        TagName.RETURN, True, Shipment.id.in_([id]), Shipment.seller_id == dataset["seller"]["id"]
+    )
+    await session.rollback()
+    await _assert_indexed(captured)
@@ -0,0 +1,280 @@
+import asyncio
+import csv
+import json
+from datetime import date, datetime, timedelta
+from uuid import UUID, uuid4
+
+from fastapi import BackgroundTasks
+
+from httpx import AsyncClient
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import func, select
+
+from app.api.core.security import password_hashing_stats
+from app.database import redis
+from app.database.models import Location, Seller, Shipment
+from app.api.schemas.shipment import ShipmentScan
+from app.services import export
+from app.services.delivery_partner import DeliveryPartnerService
+from app.services.principal import Principal
+from app.services.shipment import ShipmentService
+from app.services.shipment_event import ShipmentEventService
+from app.tests import example
+from app.utils import decode_access_token
+
+base_url = "/seller/"
+
+
+@pytest.mark.asyncio
+async def test_get_seller_shipments_pages(
+    client: AsyncClient, seller_token: str, session: AsyncSession, make_partner
+):
+    headers = {"Authorization": f"Bearer {seller_token}"}
+    session.add(make_partner("Depot", 3, Location(zip_code=55001)))
+    await session.commit()
+
+    await client.post(
+        "/shipment/submit/batch",
+        json=[
+            {"content": "Apples", "weight": 1, "destination": 55001, "customer_email": "py@xmailg.one"}
+        ] * 3,
+        headers=headers,
+    )
+
+    response = await client.get(base_url + "shipments", params={"limit": 200}, headers=headers)
+    assert response.status_code == 200
+    assert "X-Next-Cursor" not in response.headers
+    everything = [shipment["id"] for shipment in response.json()]
+
+    paged, cursor = [], None
+    while True:
+        response = await client.get(
+            base_url + "shipments",
+            params={"limit": 2, **({"cursor": cursor} if cursor else {})},
+            headers=headers,
+        )
+        assert response.status_code == 200
+        assert len(response.json()) <= 2
+        paged += [shipment["id"] for shipment in response.json()]
+
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert len(everything) >= 3
+    assert paged == everything
+
+
+@pytest.mark.asyncio
+async def test_get_seller_shipments_invalid_cursor(client: AsyncClient, seller_token: str):
+    response = await client.get(
+        base_url + "shipments",
+        params={"cursor": "not-a-cursor"},
+        headers={"Authorization": f"Bearer {seller_token}"},
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_concurrent_logins_use_hashing_pool(client: AsyncClient):
+    completed = password_hashing_stats.completed
+
+    async def login(password: str):
+        return await client.post(
+            base_url + "login",
+            data={"username": example.SELLER["email"], "password": password},
+        )
+
+    responses = await asyncio.gather(
+        login(example.SELLER["password"]),
+        login(example.SELLER["password"]),
+        login("not the password"),
+    )
+
+    assert [response.status_code for response in responses] == [200, 200, 401]
+    assert password_hashing_stats.completed == completed + 3
+    assert password_hashing_stats.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_logout_invalidates_cached_principal(
+    client: AsyncClient, seller_token: str, queries: list
+):
+    response = await client.post(
+        base_url + "login",
+        data={"username": example.SELLER["email"], "password": example.SELLER["password"]},
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    await client.get(base_url + "me", headers=headers)
+    queries.clear()
+    await client.get(base_url + "me", headers=headers)
+    assert queries == []
+
+    await client.get(base_url + "logout", headers=headers)
+    assert (await client.get(base_url + "me", headers=headers)).status_code == 401
+
+    queries.clear()
+    response = await client.get(
+        base_url + "me", headers={"Authorization": f"Bearer {seller_token}"}
+    )
+    assert response.json()["email"] == example.SELLER["email"]
+    assert len(queries) == 1
+
+
+@pytest.mark.asyncio
+async def test_blacklist_expires_and_filters_locally(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(redis, "_revoked_synced", redis._revoked_synced)
+    await redis.sync_blacklist()
+
+    response = await client.post(
+        base_url + "login",
+        data={"username": example.SELLER["email"], "password": example.SELLER["password"]},
+    )
+    token = response.json()["access_token"]
+    await client.get(base_url + "logout", headers={"Authorization": f"Bearer {token}"})
+    jti = decode_access_token(token)["jti"]
+
+    assert 0 < await redis._token_blacklist.ttl(jti) <= 120 * 60
+    assert await redis.is_jti_blacklisted(jti)
+
+    lookups = []
+    monkeypatch.setattr(
+        redis._token_blacklist, "exists", lambda *keys: lookups.append(keys)
+    )
+    assert not await redis.is_jti_blacklisted(str(uuid4()))
+    assert lookups == []
+
+
+@pytest.mark.asyncio
+async def test_listener_survives_failing_handlers(monkeypatch):
+    monkeypatch.setattr(redis, "_revoked_synced", redis._revoked_synced)
+    received = []
+
+    def handle(message: str):
+        received.append(message)
+        if message == "bad":
+            raise ValueError(message)
+
+    monkeypatch.setitem(redis._channel_handlers, "test-listener", handle)
+    listener = asyncio.create_task(redis.listen())
+    try:
+        await asyncio.sleep(0.1)
+        assert redis._revoked_synced
+        await redis.publish("test-listener", "bad")
+        await redis.publish("test-listener", "good")
+        await asyncio.sleep(0.1)
+        assert received == ["bad", "good"]
+        assert not listener.done()
+    finally:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+    # Revocations are no longer received, the local blacklist can't be trusted
+    assert not redis._revoked_synced
+
+
+@pytest.mark.asyncio
+async def test_export_shipments(
+    client: AsyncClient, seller_token: str, session: AsyncSession, make_partner, monkeypatch
+):
+    headers = {"Authorization": f"Bearer {seller_token}"}
+    session.add(make_partner("Archive", 3, Location(zip_code=57001)))
+    await session.commit()
+    await client.post(
+        "/shipment/submit/batch",
+        json=[{**example.SHIPMENT, "destination": 57001}] * 3,
+        headers=headers,
+    )
+
+    # Several batches even for the few shipments of a seller
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 2)
+    shipments = await session.scalar(
+        select(func.count())
+        .select_from(Shipment)
+        .join(Seller)
+        .where(Seller.email == example.SELLER["email"])
+    )
+    assert shipments > 2
+
+    response = await client.get(
+        base_url+"shipments/export", headers={**headers, "Accept-Encoding": "identity"}
+    )
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    rows = list(csv.DictReader(response.text.splitlines()))
+    assert len(rows) == shipments
+    assert rows == sorted(rows, key=lambda row: (row["created_at"], row["id"]))
+
+    response = await client.get(
+        base_url+"shipments/export",
+        params={"format": "ndjson"},
+        headers={**headers, "Accept-Encoding": "gzip"},
+    )
+    assert response.headers["content-encoding"] == "gzip"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["id"] for line in lines] == [row["id"] for row in rows]
+    assert lines[0]["status"] == rows[0]["status"]
+
+    response = await client.get(
+        base_url+"shipments/export",
+        params={"since": (datetime.now() + timedelta(days=1)).isoformat()},
+        headers=headers,
+    )
+    assert response.text.splitlines() == [",".join(export._NAMES)]
+
+
+
+@pytest.mark.asyncio
+async def test_seller_stats(
+    client: AsyncClient, seller_token: str, session: AsyncSession, make_partner
+):
+    headers = {"Authorization": f"Bearer {seller_token}"}
+    partner = make_partner("Tally", 2, Location(zip_code=54001))
+    session.add(partner)
+    await session.commit()
+
+    def today(stats: dict) -> dict:
+        days = {day["day"]: day["counts"] for day in stats["daily"]}
+        return days.get(date.today().isoformat(), {"placed": 0, "cancelled": 0, "delivered": 0})
+
+    before = (await client.get(base_url+"stats", headers=headers)).json()
+
+    response = await client.post(
+        "/shipment/submit/batch",
+        json=[{**example.SHIPMENT, "destination": 54001}] * 2,
+        headers=headers,
+    )
+    placed, delivered = [result["id"] for result in response.json()]
+    await client.post("/shipment/cancel", json={"id": placed}, headers=headers)
+
+    # Delivered by the partner ahead of the estimated delivery
+    await redis.add_shipment_verification_code(UUID(delivered), 123456)
+    tasks = BackgroundTasks()
+    service = ShipmentService(
+        session, DeliveryPartnerService(session, tasks), ShipmentEventService(session, tasks)
+    )
+    results = await service.update_batch(
+        [ShipmentScan(id=delivered, location=54001, status="delivered", verification_code=123456)],
+        Principal(id=partner.id, name=partner.name, email=partner.email, email_verified=True),
+    )
+    assert "error" not in results[0]
+    await session.commit()
+
+    response = await client.get(base_url+"stats", headers=headers)
+    assert response.status_code == 200
+    after = response.json()
+    changes = {status: after["counts"][status] - before["counts"][status] for status in after["counts"]}
+    assert changes == {
+        "placed": 0,
+        "in transit": 0,
+        "out for delivery": 0,
+        "delivered": 1,
+        "cancelled": 1,
+    }
+    assert today(after)["placed"] - today(before)["placed"] == 2
+    assert today(after)["cancelled"] - today(before)["cancelled"] == 1
+    assert after["delivered"] - before["delivered"] == 1
+    assert after["delivered_on_time"] - before["delivered_on_time"] == 1
+    assert after["on_time_rate"] == after["delivered_on_time"] / after["delivered"]
@@ -1,7 +1,34 @@
 
 
+import asyncio
+from datetime import datetime
+from uuid import uuid4
+
 from httpx import AsyncClient
 import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import func, select
+
+from app.database.models import (
+    DeliveryPartner,
+    Location,
+    NotificationOutbox,
+    Seller,
+    SellerDailyCount,
+    SellerStatusCount,
+    Shipment,
+    ShipmentEvent,
+    ShipmentStatus,
+    Tag,
+    TagName,
+)
+from app.database.redis import (
+    add_shipment_verification_code,
+    get_shipment_verification_code,
+    listen,
+)
+from app.services import shipment_import, stream
+from app.services.tracking import invalidate_tracking
 from app.tests import example
 
 base_url = "/shipment/"
@@ -31,4 +58,565 @@ async def test_submit_shipment(client:AsyncClient, seller_token:str):
         params={"id":response.json()["id"]},
     )
 
-    assert response.status_code == 200
\ No newline at end of file
+    assert response.status_code == 200
+
+@pytest.mark.asyncio
+async def test_submit_shipment_batch(client:AsyncClient, seller_token:str, session:AsyncSession, make_partner):
+    session.add(make_partner("Hub", 2, Location(zip_code=44001)))
+    await session.commit()
+
+    response = await client.post(
+        base_url+"submit/batch",
+        json=[
+            {**example.SHIPMENT, "destination": 44001},
+            {**example.SHIPMENT, "destination": 44999},
+            {**example.SHIPMENT, "destination": 44001},
+            {**example.SHIPMENT, "destination": 44001},
+        ],
+        headers={"Authorization": f"Bearer {seller_token}"},
+    )
+
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["index"] for result in results] == [0, 1, 2, 3]
+    assert [result["id"] is not None for result in results] == [True, False, True, False]
+
+    response = await client.get(base_url, params={"id": results[2]["id"]})
+    assert response.status_code == 200
+    assert response.json()["timeline"][0]["status"] == "placed"
+
+
+@pytest.mark.asyncio
+async def test_cancel_shipment(client:AsyncClient, seller_token:str, session:AsyncSession, make_partner):
+    headers = {"Authorization": f"Bearer {seller_token}"}
+    partner = make_partner("Corner", 1, Location(zip_code=66001))
+    session.add(partner)
+    await session.commit()
+
+    response = await client.post(
+        base_url+"submit",
+        json={**example.SHIPMENT, "destination": 66001},
+        headers=headers,
+    )
+    assert response.status_code == 201
+    assert response.json()["status"] == "placed"
+    id = response.json()["id"]
+
+    response = await client.post(base_url+"cancel", json={"id": id}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["status"] == "cancelled"
+
+    response = await client.get("/seller/shipments", params={"status": "cancelled"}, headers=headers)
+    assert id in [shipment["id"] for shipment in response.json()]
+    assert all(shipment["status"] == "cancelled" for shipment in response.json())
+
+    await session.refresh(partner)
+    assert partner.active_shipment_count == 0
+
+
+@pytest.mark.asyncio
+async def test_tracking_is_cached(
+    client: AsyncClient, seller_token: str, session: AsyncSession, queries: list, make_partner
+):
+    headers = {"Authorization": f"Bearer {seller_token}"}
+    session.add(make_partner("Beacon", 1, Location(zip_code=67001)))
+    await session.commit()
+    response = await client.post(
+        base_url+"submit", json={**example.SHIPMENT, "destination": 67001}, headers=headers
+    )
+    id = response.json()["id"]
+
+    response = await client.get(base_url, params={"id": id})
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    # Revalidation is answered from Redis alone
+    queries.clear()
+    response = await client.get(base_url, params={"id": id}, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert queries == []
+
+    response = await client.get(base_url+"track", params={"id": id})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    # A new event invalidates the cached responses
+    await client.post(base_url+"cancel", json={"id": id}, headers=headers)
+    queries.clear()
+    response = await client.get(base_url, params={"id": id}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["status"] == "cancelled"
+    assert response.headers["ETag"] != etag
+    loaded = len(queries)
+
+    # Concurrent misses load the shipment once
+    await invalidate_tracking(id)
+    queries.clear()
+    responses = await asyncio.gather(
+        *(client.get(base_url, params={"id": id}) for _ in range(5))
+    )
+    assert {response.status_code for response in responses} == {200}
+    assert len(queries) == loaded
+
+
+@pytest.mark.asyncio
+async def test_estimated_delivery_update_invalidates_tracking(
+    client: AsyncClient, partner_token: str, session: AsyncSession
+):
+    partner = await session.scalar(
+        select(DeliveryPartner).where(DeliveryPartner.email == example.DELIVERY_PARTNER["email"])
+    )
+    seller = await session.scalar(select(Seller).where(Seller.email == example.SELLER["email"]))
+    shipment = Shipment(
+        **example.SHIPMENT,
+        estimated_delivery=datetime(2030, 1, 1),
+        seller_id=seller.id,
+        delivery_partner_id=partner.id,
+    )
+    session.add(shipment)
+    await session.commit()
+
+    response = await client.get(base_url, params={"id": shipment.id})
+    etag = response.headers["ETag"]
+
+    # Only the estimate changes, no event is recorded
+    response = await client.patch(
+        base_url+"update",
+        params={"id": shipment.id},
+        json={"estimated_delivery": "2030-01-02T00:00:00"},
+        headers={"Authorization": f"Bearer {partner_token}"},
+    )
+    assert response.status_code == 200
+
+    response = await client.get(base_url, params={"id": shipment.id}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["estimated_delivery"] == "2030-01-02T00:00:00"
+
+
+@pytest.mark.asyncio
+async def test_update_shipment_rejects_invalid_transitions(
+    client: AsyncClient, partner_token: str, session: AsyncSession
+):
+    headers = {"Authorization": f"Bearer {partner_token}"}
+    partner = await session.scalar(
+        select(DeliveryPartner).where(DeliveryPartner.email == example.DELIVERY_PARTNER["email"])
+    )
+    seller = await session.scalar(select(Seller).where(Seller.email == example.SELLER["email"]))
+    shipment = Shipment(
+        **example.SHIPMENT,
+        estimated_delivery=datetime(2030, 1, 1),
+        seller_id=seller.id,
+        delivery_partner_id=partner.id,
+    )
+    session.add(shipment)
+    await session.commit()
+    await add_shipment_verification_code(shipment.id, 654321)
+
+    async def update(json: dict):
+        return await client.patch(
+            base_url+"update", params={"id": shipment.id}, json=json, headers=headers
+        )
+
+    # Cancelling is the seller's, it releases the partner's capacity
+    response = await update({"status": "cancelled"})
+    assert response.status_code == 400
+
+    response = await update({"location": 11001, "status": "delivered", "verification_code": 654321})
+    assert response.status_code == 200
+
+    # Finished shipments stay finished
+    response = await update({"location": 11002, "status": "in transit"})
+    assert response.status_code == 400
+    response = await client.get(base_url, params={"id": shipment.id})
+    assert response.json()["status"] == "delivered"
+
+
+@pytest.mark.asyncio
+async def test_update_shipment_with_offset_estimate(
+    client: AsyncClient, partner_token: str, session: AsyncSession
+):
+    partner = await session.scalar(
+        select(DeliveryPartner).where(DeliveryPartner.email == example.DELIVERY_PARTNER["email"])
+    )
+    seller = await session.scalar(select(Seller).where(Seller.email == example.SELLER["email"]))
+    shipment = Shipment(
+        **example.SHIPMENT,
+        estimated_delivery=datetime(2030, 1, 1),
+        seller_id=seller.id,
+        delivery_partner_id=partner.id,
+    )
+    session.add(shipment)
+    await session.commit()
+    await add_shipment_verification_code(shipment.id, 246810)
+
+    # Delivered with a new estimate, compared with the delivery time in the stats
+    response = await client.patch(
+        base_url+"update",
+        params={"id": shipment.id},
+        json={
+            "location": 11001,
+            "status": "delivered",
+            "verification_code": 246810,
+            "estimated_delivery": "2030-01-02T05:30:00+05:30",
+        },
+        headers={"Authorization": f"Bearer {partner_token}"},
+    )
+    assert response.status_code == 200
+
+    response = await client.get(base_url, params={"id": shipment.id})
+    assert response.json()["estimated_delivery"] == "2030-01-02T00:00:00"
+
+
+@pytest.mark.asyncio
+async def test_tag_shipments(
+    client: AsyncClient,
+    seller_token: str,
+    partner_token: str,
+    session: AsyncSession,
+    queries: list,
+    make_partner,
+):
+    headers = {"Authorization": f"Bearer {seller_token}"}
+    session.add(make_partner("Ledger", 2, Location(zip_code=63001)))
+    session.add_all(
+        [
+            Tag(name=TagName.FRAGILE, instruction="Handle with care"),
+            Tag(name=TagName.EXPRESS, instruction="Deliver first"),
+        ]
+    )
+    await session.commit()
+    ids = []
+    for _ in range(2):
+        response = await client.post(
+            base_url+"submit", json={**example.SHIPMENT, "destination": 63001}, headers=headers
+        )
+        ids.append(response.json()["id"])
+
+    response = await client.get(base_url+"tag", params={"id": ids[1], "tag": "fragile"})
+    assert response.status_code == 200
+
+    # The tag id is cached, tagging is a single statement before the
+    # shipment is read back
+    queries.clear()
+    response = await client.get(base_url+"tag", params={"id": ids[0], "tag": "fragile"})
+    assert response.status_code == 200
+    assert [tag["name"] for tag in response.json()["tags"]] == ["fragile"]
+    assert [statement.split()[0] for statement in queries].count("SELECT") == len(queries) - 1
+
+    response = await client.get(base_url+"tag", params={"id": ids[0], "tag": "fragile"})
+    assert response.status_code == 200
+    assert response.json()["id"] == ids[0]
+
+    response = await client.get(base_url, params={"id": ids[0]})
+    assert [tag["name"] for tag in response.json()["tags"]] == ["fragile"]
+
+    response = await client.get(base_url+"tag", params={"id": str(uuid4()), "tag": "fragile"})
+    assert response.status_code == 404
+
+    response = await client.delete(base_url+"tag", params={"id": ids[0], "tag": "fragile"})
+    assert response.status_code == 200
+    assert response.json()["tags"] == []
+    response = await client.delete(base_url+"tag", params={"id": ids[0], "tag": "fragile"})
+    assert response.status_code == 404
+
+    response = await client.get(base_url, params={"id": ids[0]})
+    assert response.json()["tags"] == []
+
+    # Shipments of other sellers are left alone
+    batch = {"ids": [*ids, str(uuid4())], "tag": "express"}
+    response = await client.post(base_url+"tag/batch", json=batch, headers=headers)
+    assert response.json() == {"updated": 2}
+    response = await client.post(base_url+"tag/batch", json=batch, headers=headers)
+    assert response.json() == {"updated": 0}
+
+    response = await client.get(base_url, params={"id": ids[1]})
+    assert sorted(tag["name"] for tag in response.json()["tags"]) == ["express", "fragile"]
+
+    # Newest first, a page at a time
+    response = await client.get(
+        base_url+"tagged", params={"tag_name": "express", "limit": 1}, headers=headers
+    )
+    assert [shipment["id"] for shipment in response.json()] == [ids[1]]
+    response = await client.get(
+        base_url+"tagged",
+        params={"tag_name": "express", "limit": 1, "cursor": response.headers["X-Next-Cursor"]},
+        headers=headers,
+    )
+    assert [shipment["id"] for shipment in response.json()] == [ids[0]]
+    assert "X-Next-Cursor" not in response.headers
+
+    response = await client.get(
+        base_url+"tagged", params={"tag_name": "express", "status": "cancelled"}, headers=headers
+    )
+    assert response.json() == []
+
+    # Only the caller's shipments
+    response = await client.get(
+        base_url+"tagged",
+        params={"tag_name": "express"},
+        headers={"Authorization": f"Bearer {partner_token}"},
+    )
+    assert response.status_code == 200
+    assert ids[0] not in [shipment["id"] for shipment in response.json()]
+
+    response = await client.get(base_url+"tagged/counts", headers=headers)
+    assert response.json()["express"] == 2
+    assert response.json()["fragile"] == 1
+    assert response.json()["return"] == 0
+
+    response = await client.get(
+        base_url+"tagged/counts", params={"created_before": "2020-01-01T00:00:00"}, headers=headers
+    )
+    assert set(response.json().values()) == {0}
+
+    response = await client.post(
+        base_url+"tag/batch", json={**batch, "remove": True}, headers=headers
+    )
+    assert response.json() == {"updated": 2}
+
+
+@pytest.mark.asyncio
+async def test_stream_shipment_events(
+    client: AsyncClient, seller_token: str, session: AsyncSession, make_partner
+):
+    headers = {"Authorization": f"Bearer {seller_token}"}
+    session.add(make_partner("Relay", 1, Location(zip_code=68001)))
+    await session.commit()
+    response = await client.post(
+        base_url+"submit", json={**example.SHIPMENT, "destination": 68001}, headers=headers
+    )
+    id = response.json()["id"]
+
+    listener = asyncio.create_task(listen())
+    events = stream.sse_events(id)
+    try:
+        # Subscribes, then waits for the first event
+        waiting = asyncio.create_task(anext(events))
+        await asyncio.sleep(0.1)
+        assert stream.subscriptions() == 1
+
+        await client.post(base_url+"cancel", json={"id": id}, headers=headers)
+        event = await asyncio.wait_for(waiting, 2)
+        assert event.startswith("event: shipment\ndata: ")
+        assert '"status":"cancelled"' in event
+    finally:
+        await events.aclose()
+        listener.cancel()
+    assert stream.subscriptions() == 0
+    assert stream._followers == {}
+
+
+def test_stream_drops_oldest_events():
+    with stream.Subscription() as subscription:
+        subscription.follow("a")
+        for index in range(stream.STREAM_QUEUE_SIZE + 2):
+            stream._dispatch(f"a|{index}")
+        stream._dispatch("b|ignored")
+
+        assert len(subscription.events) == stream.STREAM_QUEUE_SIZE
+        assert subscription.events[0] == "2"
+
+
+@pytest.mark.asyncio
+async def test_update_shipment_batch(
+    client: AsyncClient, partner_token: str, session: AsyncSession, queries: list
+):
+    headers = {"Authorization": f"Bearer {partner_token}"}
+    partner = await session.scalar(
+        select(DeliveryPartner).where(DeliveryPartner.email == example.DELIVERY_PARTNER["email"])
+    )
+    seller = await session.scalar(select(Seller).where(Seller.email == example.SELLER["email"]))
+    other = DeliveryPartner(name="Other", email="other@xmailg.one", password_hash="-", max_handling_capacity=1)
+
+    def shipment(partner_id) -> Shipment:
+        return Shipment(
+            **example.SHIPMENT,
+            customer_phone="+15550001111",
+            estimated_delivery=datetime.now(),
+            last_event_at=datetime.now(),
+            last_location=11001,
+            seller_id=seller.id,
+            delivery_partner_id=partner_id,
+        )
+
+    session.add(other)
+    await session.flush()
+    shipments = [shipment(partner.id) for _ in range(33)]
+    foreign = shipment(other.id)
+    session.add_all([*shipments, foreign])
+    await session.commit()
+    first, second, third = shipments[:3]
+    await add_shipment_verification_code(third.id, 123456)
+
+    queries.clear()
+    response = await client.post(
+        base_url+"update/batch",
+        json=[
+            {"id": str(first.id), "location": 11002, "status": "in transit"},
+            {"id": str(second.id), "location": 11003, "status": "out for delivery"},
+            {"id": str(third.id), "location": 11004, "status": "delivered", "verification_code": 1},
+            {"id": str(third.id), "location": 11004, "status": "delivered", "verification_code": 123456},
+            {"id": str(third.id), "location": 11005},
+            {"id": str(first.id), "location": 11003, "status": "cancelled"},
+            {"id": str(foreign.id), "location": 11002},
+            {"id": "00000000-0000-0000-0000-000000000000", "location": 11002},
+            {"id": str(first.id), "location": 11005},
+        ],
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert [(result["status"], result["error"]) for result in response.json()] == [
+        ("in transit", None),
+        ("out for delivery", None),
+        (None, "Client is not authorized to perform the requested action"),
+        ("delivered", None),
+        (None, "Shipment can't be moved to the requested status"),
+        (None, "Shipment can't be moved to the requested status"),
+        (None, "Client is not authorized to perform the requested action"),
+        (None, "Entity not found in database"),
+        ("in transit", None),
+    ]
+    statements = len(queries)
+
+    for scanned in (first, second, third):
+        await session.refresh(scanned)
+    assert (first.status, first.last_location) == (ShipmentStatus.in_transit, 11005)
+    assert second.status == ShipmentStatus.out_for_delivery
+    assert third.status == ShipmentStatus.delivered
+    assert await session.scalar(
+        select(func.count()).select_from(ShipmentEvent).where(ShipmentEvent.shipment_id == first.id)
+    ) == 2
+    # One SMS with the code of the shipment out for delivery
+    assert await session.scalar(
+        select(func.count()).select_from(NotificationOutbox).where(
+            NotificationOutbox.payload["to"].as_string() == "+15550001111"
+        )
+    ) == 1
+
+    # A hub scan without a new status keeps the code the customer received
+    code = await get_shipment_verification_code(second.id)
+    response = await client.post(
+        base_url+"update/batch", json=[{"id": str(second.id), "location": 11004}], headers=headers
+    )
+    assert response.json()[0]["status"] == "out for delivery"
+    assert await get_shipment_verification_code(second.id) == code
+    assert await session.scalar(
+        select(func.count()).select_from(NotificationOutbox).where(
+            NotificationOutbox.payload["to"].as_string() == "+15550001111"
+        )
+    ) == 1
+
+    # The statements don't grow with the batch
+    queries.clear()
+    response = await client.post(
+        base_url+"update/batch",
+        json=[
+            {"id": str(scanned.id), "location": 11002, "status": status}
+            for scanned in shipments[3:]
+            for status in ("in transit", "out for delivery")
+        ],
+        headers=headers,
+    )
+    assert all(result["error"] is None for result in response.json())
+    assert len(queries) <= statements
+
+
+@pytest.mark.asyncio
+async def test_import_shipments(
+    client: AsyncClient, seller_token: str, session: AsyncSession, make_partner, monkeypatch
+):
+    headers = {"Authorization": f"Bearer {seller_token}"}
+    # Rows span several chunks
+    monkeypatch.setattr(shipment_import, "IMPORT_CHUNK_SIZE", 2)
+    session.add(make_partner("Freight", 3, Location(zip_code=69001)))
+    await session.commit()
+
+    async def imported(file: tuple) -> dict:
+        response = await client.post(base_url+"import", files={"file": file}, headers=headers)
+        assert response.status_code == 202
+        id = response.json()["id"]
+        for _ in range(100):
+            response = await client.get(base_url+"import", params={"id": id}, headers=headers)
+            if response.json()["status"] != "running":
+                return response.json()
+            await asyncio.sleep(0.05)
+
+    job = await imported(
+        (
+            "shipments.csv",
+            "content,weight,destination,customer_email,customer_phone\n"
+            "Books,2,69001,a@xmailg.one,\n"
+            "Lamp,30,69001,b@xmailg.one,\n"
+            "Chair,3,69001,not-an-email,\n"
+            "Plant,1.5,69001,c@xmailg.one,+15550002222\n"
+            "Desk,4,99999,d@xmailg.one,\n",
+        )
+    )
+    assert job["status"] == "completed"
+    assert (job["rows"], job["imported"], job["failed"]) == (5, 2, 3)
+    assert sorted((error["row"], error["error"].split(":")[0]) for error in job["errors"]) == [
+        (2, "weight"),
+        (3, "customer_email"),
+        (5, "No delivery partner is available for assignment"),
+    ]
+
+    job = await imported(
+        (
+            "shipments.ndjson",
+            '{"content": "Rug", "weight": 5, "destination": 69001, "customer_email": "e@xmailg.one"}\n'
+            "{broken\n"
+            '{"content": "Vase", "weight": 1, "destination": 69001, "customer_email": "f@xmailg.one"}\n',
+        )
+    )
+    # The partner had room for one more
+    assert (job["rows"], job["imported"], job["failed"]) == (3, 1, 2)
+    assert {error["row"] for error in job["errors"]} == {2, 3}
+
+    assert await session.scalar(
+        select(func.count()).select_from(Shipment).where(Shipment.destination == 69001)
+    ) == 3
+
+    # Past shipments keep their history, finished ones need no capacity.
+    # Timestamps with an offset are stored in UTC
+    job = await imported(
+        (
+            "history.csv",
+            "content,weight,destination,customer_email,status,created_at,estimated_delivery\n"
+            "Mug,1,69001,g@xmailg.one,delivered,2025-03-01T12:00:00+02:00,2025-03-04T10:00:00Z\n"
+            "Bowl,1,69001,h@xmailg.one,in transit,2025-03-02T10:00:00,\n",
+        )
+    )
+    assert (job["rows"], job["imported"], job["failed"]) == (2, 1, 1)
+    assert job["errors"] == [
+        {"row": 2, "error": "No delivery partner is available for assignment"}
+    ]
+    mug = await session.scalar(select(Shipment).where(Shipment.content == "Mug"))
+    assert (mug.status, mug.created_at, mug.estimated_delivery) == (
+        ShipmentStatus.delivered,
+        datetime(2025, 3, 1, 10),
+        datetime(2025, 3, 4, 10),
+    )
+    assert await session.scalar(
+        select(ShipmentEvent.description).where(ShipmentEvent.shipment_id == mug.id)
+    ) == "Imported as delivered"
+    assert await session.scalar(
+        select(DeliveryPartner.active_shipment_count).where(DeliveryPartner.name == "Freight")
+    ) == 3
+    # Counted as delivered now, but not as delivered on the day it was created
+    assert await session.scalar(
+        select(SellerStatusCount.count).where(
+            SellerStatusCount.seller_id == mug.seller_id,
+            SellerStatusCount.status == ShipmentStatus.delivered,
+        )
+    ) >= 1
+    assert await session.scalar(
+        select(func.count()).select_from(SellerDailyCount).where(
+            SellerDailyCount.seller_id == mug.seller_id,
+            SellerDailyCount.day == mug.created_at.date(),
+        )
+    ) == 0
+
+    response = await client.get(base_url+"import", params={"id": str(uuid4())}, headers=headers)
+    assert response.status_code == 404
+
@@ -1,6 +1,9 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime, timedelta, timezone
+from hashlib import blake2b
+from math import ceil, log
 from pathlib import Path
-from uuid import uuid4
+from uuid import UUID, uuid4
 
 from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
 import jwt
@@ -51,4 +54,46 @@ def decode_url_safe_token(token:str, salt: str | None = None, expiry: timedelta
             max_age=expiry.total_seconds() if expiry else None,
         )
     except (BadSignature,SignatureExpired):
-        return None
\ No newline at end of file
+        return None
+
+def encode_cursor(created_at: datetime, id: UUID) -> str:
+    return urlsafe_b64encode(f"{created_at.isoformat()}|{id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID] | None:
+    try:
+        created_at, id = urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), UUID(id)
+    except ValueError:
+        return None
+
+
+class BloomFilter:
+    """
+    Set membership with no false negatives. A miss means the item was never
+    added, a hit only means it probably was.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = ceil(-capacity * log(error_rate) / log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * log(2)))
+        self.count = 0
+        self._bits = bytearray(ceil(self.size / 8))
+
+    def _positions(self, item: str):
+        digest = blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for index in range(self.hashes):
+            yield (first + index * second) % self.size
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
@@ -0,0 +1,138 @@
+"""
+Sends the notifications staged in the notification_outbox table.
+
+Each API worker runs a drainer from its lifespan, it can also run on its own:
+
+    python -m app.worker.outbox
+
+Drainers claim pending rows with SKIP LOCKED so any number of them can run
+side by side, each row is sent by one of them.
+"""
+
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta
+from time import monotonic
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import func, select
+
+from app.database.models import NotificationChannel, NotificationOutbox, NotificationStatus
+from app.database.session import async_session
+from app.services.notification import NotificationDispatcher, get_dispatcher
+from app.services.providers import RESEND_BATCH_LIMIT
+
+# Rows claimed per transaction
+OUTBOX_BATCH_SIZE = 200
+# Provider calls in flight per drainer
+OUTBOX_SEND_CONCURRENCY = 10
+# Attempts before a notification is marked failed, retries back off exponentially
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_BACKOFF = timedelta(seconds=5)
+# Seconds to wait when nothing is due
+OUTBOX_POLL_INTERVAL = 1
+# Seconds between counts of the pending notifications
+OUTBOX_BACKLOG_INTERVAL = 15
+
+# Pending notifications as last counted, served at /metrics
+backlog = 0
+
+
+async def drain_once(session: AsyncSession, dispatcher: NotificationDispatcher) -> int:
+    """Claim, send and record one batch of due notifications, returns its size"""
+    rows = (
+        await session.scalars(
+            select(NotificationOutbox)
+            .where(
+                NotificationOutbox.status == NotificationStatus.pending,
+                NotificationOutbox.next_attempt_at <= datetime.now(),
+            )
+            .order_by(NotificationOutbox.next_attempt_at)
+            .limit(OUTBOX_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+    ).all()
+
+    if not rows:
+        return 0
+
+    # Emails sharing a template go out together through the batch API
+    emails = defaultdict(list)
+    deliveries = []
+    for row in rows:
+        if row.channel == NotificationChannel.email:
+            emails[row.payload["template_name"]].append(row)
+        else:
+            deliveries.append(([row], dispatcher.deliver_sms(**row.payload)))
+
+    for template_name, templated in emails.items():
+        for start in range(0, len(templated), RESEND_BATCH_LIMIT):
+            batch = templated[start : start + RESEND_BATCH_LIMIT]
+            deliveries.append(
+                (batch, dispatcher.deliver_emails([row.payload for row in batch], template_name))
+            )
+
+    limit = asyncio.Semaphore(OUTBOX_SEND_CONCURRENCY)
+
+    async def deliver(batch: list[NotificationOutbox], sending):
+        async with limit:
+            try:
+                await sending
+            except Exception as e:
+                _record(batch, error=e)
+            else:
+                _record(batch)
+
+    await asyncio.gather(*(deliver(batch, sending) for batch, sending in deliveries))
+    await session.commit()
+    return len(rows)
+
+
+def _record(rows: list[NotificationOutbox], error: Exception | None = None):
+    now = datetime.now()
+    for row in rows:
+        row.attempts += 1
+        if error is None:
+            row.status = NotificationStatus.sent
+            row.sent_at = now
+            row.last_error = None
+        elif row.attempts >= OUTBOX_MAX_ATTEMPTS:
+            row.status = NotificationStatus.failed
+            row.last_error = str(error)
+        else:
+            row.next_attempt_at = now + OUTBOX_RETRY_BACKOFF * 2 ** (row.attempts - 1)
+            row.last_error = str(error)
+
+
+async def count_backlog(session: AsyncSession) -> int:
+    return await session.scalar(
+        select(func.count())
+        .select_from(NotificationOutbox)
+        .where(NotificationOutbox.status == NotificationStatus.pending)
+    )
+
+
+async def drain():
+    """Keep sending due notifications until cancelled"""
+    global backlog
+    dispatcher = get_dispatcher()
+    counted = None
+    while True:
+        try:
+            async with async_session() as session:
+                drained = await drain_once(session, dispatcher)
+                # Counted here rather than on each scrape
+                if counted is None or monotonic() - counted >= OUTBOX_BACKLOG_INTERVAL:
+                    backlog = await count_backlog(session)
+                    counted = monotonic()
+        except Exception as e:
+            print(f"[Outbox Drain Failed]: {e}")
+            drained = 0
+
+        # A full batch means more are probably due already
+        if drained < OUTBOX_BATCH_SIZE:
+            await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    asyncio.run(drain())
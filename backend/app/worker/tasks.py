@@ -1,22 +1,21 @@
 from asgiref.sync import async_to_sync
 from celery import Celery
-from fastapi_mail import ConnectionConfig, FastMail, MessageSchema, MessageType
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from pydantic import EmailStr
 from twilio.rest import Client
 
 from app.config import database_settings, notifications_settings
+from app.services.providers import SmtpProvider
 from app.utils import TEMPLATE_DIR
 
-fast_mail = FastMail(
-    ConnectionConfig(
-        **notifications_settings.model_dump(
-            exclude=["TWILIO_SID", "TWILIO_AUTH_TOKEN", "TWILIO_NUMBER"]
-        ),
-        TEMPLATE_FOLDER=TEMPLATE_DIR,
-    )
+templates = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(['html', 'xml']),
 )
 
-send_message = async_to_sync(fast_mail.send_message)
+send_emails = async_to_sync(SmtpProvider().send_emails)
+
+mail_from = f"{notifications_settings.MAIL_FROM_NAME} <{notifications_settings.MAIL_FROM}>"
 
 twilio_client = Client(
     notifications_settings.TWILIO_SID,
@@ -33,7 +32,7 @@ app = Celery(
 
 @app.task
 def send_mail(recipients: list[str], subject: str, body: str):
-    send_message(MessageSchema(recipients=recipients, subject=subject, body=body))
+    send_emails([{"from": mail_from, "to": recipients, "subject": subject, "text": body}])
     return "Mail sent"
 
 
@@ -44,14 +43,15 @@ def send_templated_email(
     context: dict,
     template_name: str,
 ):
-    send_message(
-        message=MessageSchema(
-            recipients=recipients,
-            subject=subject,
-            template_body=context,
-            subtype=MessageType.html,
-        ),
-        template_name=template_name,
+    send_emails(
+        [
+            {
+                "from": mail_from,
+                "to": recipients,
+                "subject": subject,
+                "html": templates.get_template(template_name).render(**context),
+            }
+        ]
     )
 
 
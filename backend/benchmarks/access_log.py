@@ -0,0 +1,78 @@
+"""
+Overhead per request of the access log middleware, calling a minimal ASGI app
+directly, bare, behind AccessLogMiddleware and behind the previous
+BaseHTTPMiddleware that printed a line per request from a background task.
+
+Run from the backend directory:
+
+    python -m benchmarks.access_log
+"""
+
+import asyncio
+import contextlib
+import os
+from time import perf_counter
+
+from fastapi import BackgroundTasks, Request
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.api.core.access_log import AccessLogMiddleware, drain_records
+
+REQUESTS = 20_000
+SCOPE = {
+    "type": "http",
+    "method": "GET",
+    "path": "/shipment/",
+    "raw_path": b"/shipment/",
+    "query_string": b"",
+    "headers": [],
+}
+
+
+async def endpoint(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def print_log(request: Request, call_next):
+    start = perf_counter()
+    response = await call_next(request)
+    time_taken = round(perf_counter() - start, 2)
+    tasks = BackgroundTasks()
+    tasks.add_task(
+        print,
+        f"[APP_LOG]: {request.method} {request.url} - {response.status_code} - {time_taken}s",
+    )
+    response.background = tasks
+    return response
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def measure(app) -> float:
+    start = perf_counter()
+    for _ in range(REQUESTS):
+        await app(dict(SCOPE), receive, send)
+    return (perf_counter() - start) / REQUESTS
+
+
+async def main():
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        bare = await measure(endpoint)
+        logged = await measure(AccessLogMiddleware(endpoint))
+        printed = await measure(BaseHTTPMiddleware(endpoint, dispatch=print_log))
+    drain_records()
+
+    print(f"{'bare app':>22}: {bare * 1e6:7.2f} us/request")
+    for name, timing in [("access log", logged), ("print per request", printed)]:
+        print(f"{name:>22}: {(timing - bare) * 1e6:7.2f} us/request overhead")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+"""
+Partner assignment latency as delivery partner history grows.
+
+Run from the backend directory:
+
+    python -m benchmarks.assignment
+"""
+
+import asyncio
+from datetime import datetime
+from statistics import median
+from time import perf_counter
+from uuid import uuid4
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel
+
+from app.database.models import (
+    DeliveryPartner,
+    Location,
+    Seller,
+    ServiceableLocation,
+    Shipment,
+    ShipmentEvent,
+    ShipmentStatus,
+)
+from app.services.delivery_partner import DeliveryPartnerService
+
+ZIPCODE = 560001
+PARTNERS = 20
+HISTORY_SIZES = [0, 1_000, 10_000, 50_000]
+RUNS = 50
+
+
+async def seed(session: AsyncSession, history: int):
+    seller_id = uuid4()
+    partner_ids = [uuid4() for _ in range(PARTNERS)]
+
+    await session.execute(
+        insert(Seller),
+        [{"id": seller_id, "name": "Seller", "email": "seller@bench.io", "password_hash": "-"}],
+    )
+    await session.execute(insert(Location), [{"zip_code": ZIPCODE}])
+    await session.execute(
+        insert(DeliveryPartner),
+        [
+            {
+                "id": partner_id,
+                "name": f"Partner {index}",
+                "email": f"partner{index}@bench.io",
+                "password_hash": "-",
+                # Only the last partner has room left for new shipments
+                "max_handling_capacity": history // PARTNERS + (index == PARTNERS - 1),
+                "active_shipment_count": history // PARTNERS,
+            }
+            for index, partner_id in enumerate(partner_ids)
+        ],
+    )
+    await session.execute(
+        insert(ServiceableLocation),
+        [{"delivery_partner_id": id, "zip_code": ZIPCODE} for id in partner_ids],
+    )
+
+    shipments, events = [], []
+    for index in range(history):
+        shipment_id = uuid4()
+        shipments.append(
+            {
+                "id": shipment_id,
+                "customer_email": "customer@bench.io",
+                "content": "Parcel",
+                "weight": 1.0,
+                "destination": ZIPCODE,
+                "estimated_delivery": datetime.now(),
+                "seller_id": seller_id,
+                "delivery_partner_id": partner_ids[index % PARTNERS],
+            }
+        )
+        events.append(
+            {
+                "id": uuid4(),
+                "location": ZIPCODE,
+                "status": ShipmentStatus.placed,
+                "shipment_id": shipment_id,
+            }
+        )
+    if shipments:
+        await session.execute(insert(Shipment), shipments)
+        await session.execute(insert(ShipmentEvent), events)
+    await session.commit()
+
+
+async def measure(history: int) -> tuple[float, float]:
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    async_session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with async_session() as session:
+        await seed(session, history)
+
+    timings = []
+    for _ in range(RUNS):
+        async with async_session() as session:
+            service = DeliveryPartnerService(session, None)
+            start = perf_counter()
+            await service.reserve_capacity(ZIPCODE)
+            timings.append(perf_counter() - start)
+
+    await engine.dispose()
+    timings.sort()
+    return median(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+async def main():
+    print(f"{'history':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    for history in HISTORY_SIZES:
+        p50, p99 = await measure(history)
+        print(f"{history:>10} {p50 * 1000:>10.2f} {p99 * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
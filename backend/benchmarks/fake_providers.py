@@ -0,0 +1,61 @@
+"""
+Local stand-in for the Resend and Twilio APIs, to benchmark notification
+throughput offline. Every call takes LATENCY seconds, and calls beyond
+RATE_LIMIT in flight are answered 429 like the real providers do.
+
+Serve it on its own with:
+
+    uvicorn benchmarks.fake_providers:app --port 8765
+
+then point RESEND_API_URL and TWILIO_API_URL at http://127.0.0.1:8765.
+"""
+
+import asyncio
+
+from fastapi import FastAPI, Request, Response
+
+LATENCY = 0.05
+RATE_LIMIT = 16
+
+app = FastAPI()
+app.state.in_flight = 0
+app.state.emails = 0
+app.state.sms = 0
+app.state.rate_limited = 0
+
+
+async def _call(response: Response) -> bool:
+    if app.state.in_flight >= RATE_LIMIT:
+        app.state.rate_limited += 1
+        response.status_code = 429
+        response.headers["Retry-After"] = str(LATENCY)
+        return False
+
+    app.state.in_flight += 1
+    try:
+        await asyncio.sleep(LATENCY)
+    finally:
+        app.state.in_flight -= 1
+    return True
+
+
+@app.post("/emails")
+async def send_email(response: Response):
+    if await _call(response):
+        app.state.emails += 1
+    return {"id": "fake"}
+
+
+@app.post("/emails/batch")
+async def send_email_batch(request: Request, response: Response):
+    emails = await request.json()
+    if await _call(response):
+        app.state.emails += len(emails)
+    return {"data": [{"id": "fake"} for _ in emails]}
+
+
+@app.post("/2010-04-01/Accounts/{sid}/Messages.json")
+async def send_sms(sid: str, response: Response):
+    if await _call(response):
+        app.state.sms += 1
+    return {"sid": "fake"}
@@ -0,0 +1,119 @@
+"""
+Notification throughput against the fake providers in benchmarks.fake_providers.
+It compares the Resend SDK called from the threadpool, one email per call as
+background tasks used to, with the pooled async providers.
+
+Run from the backend directory:
+
+    python -m benchmarks.notification_throughput
+"""
+
+import os
+
+PORT = 8765
+URL = f"http://127.0.0.1:{PORT}"
+os.environ["RESEND_API_URL"] = URL
+os.environ["TWILIO_API_URL"] = URL
+
+import asyncio  # noqa: E402
+from time import perf_counter  # noqa: E402
+
+import resend  # noqa: E402
+import uvicorn  # noqa: E402
+from anyio.to_thread import run_sync  # noqa: E402
+
+from app.services.notification import EMAIL_FROM, NotificationDispatcher  # noqa: E402
+from benchmarks import fake_providers  # noqa: E402
+
+EMAILS = 1_000
+SMS = 300
+CONTEXT = {"id": "0", "seller": "Seller", "partner": "Partner", "domain": "localhost"}
+
+
+def _email(index: int) -> dict:
+    return {
+        "recipients": [f"customer{index}@bench.io"],
+        "subject": "Shipment order received!",
+        "context": CONTEXT,
+    }
+
+
+async def sdk_per_email(dispatcher: NotificationDispatcher):
+    resend.api_url = URL
+    resend.api_key = "fake"
+
+    def send(index: int):
+        try:
+            resend.Emails.send(
+                {
+                    "from": EMAIL_FROM,
+                    "to": [f"customer{index}@bench.io"],
+                    "subject": "Shipment order received!",
+                    "html": dispatcher.render("mail_placed.html", CONTEXT),
+                }
+            )
+        except Exception:
+            pass
+
+    await asyncio.gather(*(run_sync(send, index) for index in range(EMAILS)))
+
+
+async def provider_per_email(dispatcher: NotificationDispatcher):
+    await asyncio.gather(
+        *(
+            dispatcher.deliver_emails([_email(index)], "mail_placed.html")
+            for index in range(EMAILS)
+        )
+    )
+
+
+async def provider_batched(dispatcher: NotificationDispatcher):
+    await dispatcher.deliver_emails(
+        [_email(index) for index in range(EMAILS)], "mail_placed.html"
+    )
+
+
+async def provider_sms(dispatcher: NotificationDispatcher):
+    await asyncio.gather(
+        *(dispatcher.deliver_sms("+10000000000", "Arriving soon") for _ in range(SMS))
+    )
+
+
+async def main():
+    server = uvicorn.Server(
+        uvicorn.Config(fake_providers.app, port=PORT, log_level="warning")
+    )
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    dispatcher = NotificationDispatcher()
+    state = fake_providers.app.state
+
+    print(f"{'path':>24} {'sent':>6} {'429s':>6} {'per sec':>9}")
+    for name, run, count in [
+        ("sdk threadpool", sdk_per_email, "emails"),
+        ("provider per email", provider_per_email, "emails"),
+        ("provider batched", provider_batched, "emails"),
+        ("provider sms", provider_sms, "sms"),
+    ]:
+        sent, rate_limited = getattr(state, count), state.rate_limited
+        start = perf_counter()
+        try:
+            await run(dispatcher)
+        except Exception as e:
+            print(f"{name} failed: {e}")
+        elapsed = perf_counter() - start
+        sent = getattr(state, count) - sent
+        print(
+            f"{name:>24} {sent:>6} {state.rate_limited - rate_limited:>6}"
+            f" {sent / elapsed:>9.0f}"
+        )
+
+    await dispatcher.close()
+    server.should_exit = True
+    await serving
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
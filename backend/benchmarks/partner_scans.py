@@ -0,0 +1,114 @@
+"""
+Hub scan throughput, one PATCH /shipment/update per scan against one
+POST /shipment/update/batch, on SQLite in memory. Scans move shipments in
+transit, so Redis isn't needed.
+
+Run from the backend directory:
+
+    python -m benchmarks.partner_scans
+"""
+
+import asyncio
+from datetime import datetime
+from time import perf_counter
+from uuid import uuid4
+
+from fastapi import BackgroundTasks
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel
+
+from app.api.schemas.shipment import ShipmentScan, ShipmentUpdate
+from app.database.models import DeliveryPartner, Seller, Shipment, ShipmentStatus
+from app.services.delivery_partner import DeliveryPartnerService
+from app.services.principal import Principal
+from app.services.shipment import ShipmentService
+from app.services.shipment_event import ShipmentEventService
+
+SCANS = 1_000
+
+
+def service(session: AsyncSession) -> ShipmentService:
+    tasks = BackgroundTasks()
+    return ShipmentService(
+        session, DeliveryPartnerService(session, tasks), ShipmentEventService(session, tasks)
+    )
+
+
+async def main():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async_session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    seller_id, partner_id = uuid4(), uuid4()
+    partner = Principal(id=partner_id, name="Partner", email="partner@bench.io", email_verified=True)
+    ids = [uuid4() for _ in range(SCANS * 2)]
+    async with async_session() as session:
+        await session.execute(
+            insert(Seller),
+            [{"id": seller_id, "name": "Seller", "email": "seller@bench.io", "password_hash": "-"}],
+        )
+        await session.execute(
+            insert(DeliveryPartner),
+            [
+                {
+                    "id": partner_id,
+                    "name": "Partner",
+                    "email": "partner@bench.io",
+                    "password_hash": "-",
+                    "max_handling_capacity": SCANS * 2,
+                }
+            ],
+        )
+        await session.execute(
+            insert(Shipment),
+            [
+                {
+                    "id": id,
+                    "customer_email": "customer@bench.io",
+                    "content": "Parcel",
+                    "weight": 1.0,
+                    "destination": 560001,
+                    "estimated_delivery": datetime.now(),
+                    "status": ShipmentStatus.placed.name,
+                    "last_event_at": datetime.now(),
+                    "last_location": 560001,
+                    "seller_id": seller_id,
+                    "delivery_partner_id": partner_id,
+                }
+                for id in ids
+            ],
+        )
+        await session.commit()
+
+    start = perf_counter()
+    for id in ids[:SCANS]:
+        async with async_session() as session:
+            await service(session).update(
+                id, ShipmentUpdate(location=560002, status=ShipmentStatus.in_transit), partner
+            )
+            await session.commit()
+    single = perf_counter() - start
+
+    start = perf_counter()
+    async with async_session() as session:
+        results = await service(session).update_batch(
+            [
+                ShipmentScan(id=id, location=560002, status=ShipmentStatus.in_transit)
+                for id in ids[SCANS:]
+            ],
+            partner,
+        )
+        await session.commit()
+    batch = perf_counter() - start
+    assert all(result.get("error") is None for result in results)
+
+    print(f"{'scan per request':>18}: {SCANS / single:8.0f} scans/s")
+    print(f"{'batch of ' + str(SCANS):>18}: {SCANS / batch:8.0f} scans/s")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+"""
+Tracking page latency while sellers are logging in, with bcrypt run inline
+on the event loop and on the password hashing pool.
+
+Run from the backend directory:
+
+    python -m benchmarks.password_hashing
+"""
+
+import asyncio
+from datetime import datetime
+from statistics import median
+from time import perf_counter
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel
+
+from app.api.core import security
+from app.database.models import DeliveryPartner, Seller, Shipment, ShipmentEvent, ShipmentStatus
+from app.database.session import create_session
+from app.main import app
+from app.services import user
+
+ZIPCODE = 560001
+LOGIN_CLIENTS = 4
+TRACK_REQUESTS = 50
+SELLER = {"email": "seller@bench.io", "password": "benchmark"}
+
+
+async def inline_verify_password(password: str, password_hash: str) -> bool:
+    return security.password_context.verify(password, password_hash)
+
+
+async def seed(session: AsyncSession):
+    seller = Seller(
+        name="Seller",
+        email=SELLER["email"],
+        email_verified=True,
+        password_hash=security.password_context.hash(SELLER["password"]),
+    )
+    partner = DeliveryPartner(
+        name="Partner",
+        email="partner@bench.io",
+        password_hash="-",
+        max_handling_capacity=10,
+    )
+    shipment = Shipment(
+        customer_email="customer@bench.io",
+        content="Parcel",
+        weight=1.0,
+        destination=ZIPCODE,
+        estimated_delivery=datetime.now(),
+        seller_id=seller.id,
+        delivery_partner_id=partner.id,
+    )
+    event = ShipmentEvent(
+        created_at=datetime.now(),
+        location=ZIPCODE,
+        status=ShipmentStatus.placed,
+        shipment_id=shipment.id,
+    )
+    session.add_all([seller, partner, shipment, event])
+    await session.commit()
+    return shipment.id
+
+
+async def measure(client: AsyncClient, shipment_id) -> tuple[float, float]:
+    done = asyncio.Event()
+
+    async def login():
+        while not done.is_set():
+            await client.post(
+                "/seller/login",
+                data={"username": SELLER["email"], "password": SELLER["password"]},
+            )
+
+    logins = [asyncio.create_task(login()) for _ in range(LOGIN_CLIENTS)]
+
+    timings = []
+    for _ in range(TRACK_REQUESTS):
+        start = perf_counter()
+        await client.get("/shipment/track", params={"id": shipment_id})
+        timings.append(perf_counter() - start)
+
+    done.set()
+    await asyncio.gather(*logins)
+
+    timings.sort()
+    return median(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+async def main():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async_session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def session_override():
+        async with async_session() as session:
+            yield session
+            await session.commit()
+
+    async with async_session() as session:
+        shipment_id = await seed(session)
+    app.dependency_overrides[create_session] = session_override
+
+    async with AsyncClient(transport=ASGITransport(app), base_url="http://bench") as client:
+        print(f"{'bcrypt':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+
+        user.verify_password = inline_verify_password
+        p50, p99 = await measure(client, shipment_id)
+        print(f"{'inline':>10} {p50 * 1000:>10.2f} {p99 * 1000:>10.2f}")
+
+        user.verify_password = security.verify_password
+        p50, p99 = await measure(client, shipment_id)
+        print(f"{'pool':>10} {p50 * 1000:>10.2f} {p99 * 1000:>10.2f}")
+
+    stats = security.password_hashing_stats
+    print(
+        f"pool queue time: mean {stats.queue_seconds_total / max(stats.completed, 1) * 1000:.1f} ms,"
+        f" max {stats.queue_seconds_max * 1000:.1f} ms over {stats.completed} calls"
+    )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""
+Peak memory and time to first byte of the streamed shipment export as the
+number of exported shipments grows, on SQLite in memory.
+
+Run from the backend directory:
+
+    python -m benchmarks.shipment_export
+"""
+
+import asyncio
+import tracemalloc
+from datetime import datetime
+from time import perf_counter
+from uuid import uuid4
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel
+
+from app.database.models import DeliveryPartner, Seller, Shipment, ShipmentStatus
+from app.services.export import export_shipments
+
+SIZES = [10_000, 100_000]
+
+
+async def seed(session: AsyncSession, size: int) -> tuple:
+    seller_id, partner_id = uuid4(), uuid4()
+    await session.execute(
+        insert(Seller),
+        [{"id": seller_id, "name": "Seller", "email": f"{seller_id}@bench.io", "password_hash": "-"}],
+    )
+    await session.execute(
+        insert(DeliveryPartner),
+        [
+            {
+                "id": partner_id,
+                "name": "Partner",
+                "email": f"{partner_id}@bench.io",
+                "password_hash": "-",
+                "max_handling_capacity": size,
+            }
+        ],
+    )
+    for start in range(0, size, 10_000):
+        await session.execute(
+            insert(Shipment),
+            [
+                {
+                    "id": uuid4(),
+                    "created_at": datetime.now(),
+                    "customer_email": "customer@bench.io",
+                    "content": "Parcel",
+                    "weight": 1.0,
+                    "destination": 560001,
+                    "estimated_delivery": datetime.now(),
+                    "status": ShipmentStatus.in_transit.name,
+                    "last_event_at": datetime.now(),
+                    "last_location": 560001,
+                    "seller_id": seller_id,
+                    "delivery_partner_id": partner_id,
+                }
+                for _ in range(min(10_000, size - start))
+            ],
+        )
+    await session.commit()
+    return seller_id
+
+
+async def main():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async_session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    for size in SIZES:
+        async with async_session() as session:
+            seller_id = await seed(session, size)
+
+        for format in ("csv", "ndjson"):
+            tracemalloc.start()
+            start = perf_counter()
+            first_byte = None
+            sent = 0
+            async for chunk in export_shipments(
+                async_session, Shipment.seller_id == seller_id, format=format, gzip=True
+            ):
+                first_byte = first_byte or perf_counter() - start
+                sent += len(chunk)
+            elapsed = perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(
+                f"{size:>8} shipments {format:>6}: first byte {first_byte * 1000:6.2f} ms,"
+                f" {size / elapsed:7.0f} rows/s, peak {peak / 2**20:5.1f} MiB,"
+                f" {sent / 2**20:5.1f} MiB gzipped"
+            )
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""
+Import throughput in rows per second, reading, validating and inserting a
+CSV file the way an import job does, on SQLite in memory. Progress updates
+are left out so Redis isn't needed.
+
+Run from the backend directory:
+
+    python -m benchmarks.shipment_import
+"""
+
+import asyncio
+import os
+import tempfile
+from time import perf_counter
+from uuid import uuid4
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel
+
+from app.database.models import DeliveryPartner, Location, Seller, ServiceableLocation
+from app.services.principal import Principal
+from app.services.shipment_import import _insert, _read, _validate
+
+ROWS = 1_000_000
+ZIPCODE = 560001
+
+
+async def main():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async_session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    seller = Principal(id=uuid4(), name="Seller", email="seller@bench.io", email_verified=True)
+    partner_id = uuid4()
+    async with async_session() as session:
+        await session.execute(
+            insert(Seller),
+            [{"id": seller.id, "name": seller.name, "email": seller.email, "password_hash": "-"}],
+        )
+        await session.execute(insert(Location), [{"zip_code": ZIPCODE}])
+        await session.execute(
+            insert(DeliveryPartner),
+            [
+                {
+                    "id": partner_id,
+                    "name": "Partner",
+                    "email": "partner@bench.io",
+                    "password_hash": "-",
+                    "max_handling_capacity": ROWS,
+                }
+            ],
+        )
+        await session.execute(
+            insert(ServiceableLocation), [{"delivery_partner_id": partner_id, "zip_code": ZIPCODE}]
+        )
+        await session.commit()
+
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as file:
+        file.write("content,weight,destination,customer_email,customer_phone\n")
+        for index in range(ROWS):
+            file.write(f"Parcel {index},1.5,{ZIPCODE},customer{index}@bench.io,\n")
+
+    imported = failed = 0
+    start = perf_counter()
+    try:
+        with open(file.name, newline="") as csv_file:
+            rows = _read(csv_file, "csv")
+            while chunk := await asyncio.to_thread(_validate, rows):
+                _, shipments, errors = chunk
+                results = await _insert(shipments, seller, async_session)
+                failed += len(errors) + sum(1 for result in results if result.get("error"))
+                imported += len(results) - sum(1 for result in results if result.get("error"))
+    finally:
+        os.unlink(file.name)
+    elapsed = perf_counter() - start
+
+    print(f"{imported} imported, {failed} failed in {elapsed:.1f}s: {ROWS / elapsed:.0f} rows/s")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
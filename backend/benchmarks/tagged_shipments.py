@@ -0,0 +1,123 @@
+"""
+Latency of a page of GET /shipment/tagged and of the counts per tag, for tags
+carried by every shipment of a seller, by one in a hundred and by a handful,
+on SQLite in memory.
+
+Run from the backend directory:
+
+    python -m benchmarks.tagged_shipments
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from time import perf_counter
+from uuid import uuid4
+
+from fastapi import BackgroundTasks
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel
+
+from app.database.models import (
+    DeliveryPartner,
+    Seller,
+    Shipment,
+    ShipmentStatus,
+    ShipmentTag,
+    Tag,
+    TagName,
+)
+from app.services import tag
+from app.services.delivery_partner import DeliveryPartnerService
+from app.services.shipment import ShipmentService
+from app.services.shipment_event import ShipmentEventService
+
+SHIPMENTS = 200_000
+PAGES = 20
+# Tag -> every how many shipments carry it
+SPREAD = {TagName.EXPRESS: 1, TagName.FRAGILE: 100, TagName.HEAVY: SHIPMENTS // 10}
+
+
+async def main():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async_session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    seller_id, partner_id = uuid4(), uuid4()
+    tag_ids = {name: uuid4() for name in TagName}
+    now = datetime.now()
+    ids = [uuid4() for _ in range(SHIPMENTS)]
+    async with async_session() as session:
+        await session.execute(
+            insert(Seller),
+            [{"id": seller_id, "name": "Seller", "email": "seller@bench.io", "password_hash": "-"}],
+        )
+        await session.execute(
+            insert(DeliveryPartner),
+            [
+                {
+                    "id": partner_id,
+                    "name": "Partner",
+                    "email": "partner@bench.io",
+                    "password_hash": "-",
+                    "max_handling_capacity": SHIPMENTS,
+                }
+            ],
+        )
+        await session.execute(
+            insert(Tag), [{"id": id, "name": name} for name, id in tag_ids.items()]
+        )
+        await session.execute(
+            insert(Shipment),
+            [
+                {
+                    "id": id,
+                    "created_at": now - timedelta(seconds=index),
+                    "customer_email": "customer@bench.io",
+                    "content": "Parcel",
+                    "weight": 1.0,
+                    "destination": 560001,
+                    "estimated_delivery": now,
+                    "status": ShipmentStatus.placed,
+                    "seller_id": seller_id,
+                    "delivery_partner_id": partner_id,
+                }
+                for index, id in enumerate(ids)
+            ],
+        )
+        await session.execute(
+            insert(ShipmentTag),
+            [
+                {"shipment_id": id, "tag_id": tag_ids[name]}
+                for name, every in SPREAD.items()
+                for id in ids[::every]
+            ],
+        )
+        await session.commit()
+    async with engine.begin() as conn:
+        await conn.exec_driver_sql("ANALYZE")
+
+    tag._tag_ids.update(tag_ids)
+    async with async_session() as session:
+        tasks = BackgroundTasks()
+        service = ShipmentService(
+            session, DeliveryPartnerService(session, tasks), ShipmentEventService(session, tasks)
+        )
+        for name, every in SPREAD.items():
+            start = perf_counter()
+            for _ in range(PAGES):
+                await service.get_tagged_page(name, Shipment.seller_id == seller_id, limit=50)
+            elapsed = (perf_counter() - start) / PAGES
+            print(f"{name.value:>8} on {SHIPMENTS // every:>7} shipments: {elapsed * 1e3:7.2f} ms/page")
+
+        start = perf_counter()
+        await service.count_by_tag(Shipment.seller_id == seller_id)
+        print(f"{'counts':>8} per tag: {(perf_counter() - start) * 1e3:7.2f} ms")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
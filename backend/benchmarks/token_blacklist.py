@@ -0,0 +1,55 @@
+"""
+Cost of the revoked token check made on every authenticated request, asking
+Redis each time and with the local filter answering the misses.
+
+Needs the Redis server from the settings. Run from the backend directory:
+
+    python -m benchmarks.token_blacklist
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from statistics import median
+from time import perf_counter
+from uuid import uuid4
+
+from app.database import redis
+
+REVOKED = 10_000
+CHECKS = 2_000
+
+
+async def measure() -> tuple[float, float]:
+    timings = []
+    for _ in range(CHECKS):
+        jti = str(uuid4())
+        start = perf_counter()
+        await redis.is_jti_blacklisted(jti)
+        timings.append(perf_counter() - start)
+
+    timings.sort()
+    return median(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+async def main():
+    expires_at = int((datetime.now(timezone.utc) + timedelta(minutes=5)).timestamp())
+    async with redis._token_blacklist.pipeline(transaction=False) as pipeline:
+        for _ in range(REVOKED):
+            pipeline.set(str(uuid4()), "blacklisted", exat=expires_at)
+        await pipeline.execute()
+
+    print(f"{'check':>10} {'p50 (us)':>10} {'p99 (us)':>10}")
+
+    p50, p99 = await measure()
+    print(f"{'redis':>10} {p50 * 1e6:>10.1f} {p99 * 1e6:>10.1f}")
+
+    await redis.sync_blacklist()
+    p50, p99 = await measure()
+    print(f"{'filter':>10} {p50 * 1e6:>10.1f} {p99 * 1e6:>10.1f}")
+
+    false_positives = sum(str(uuid4()) in redis._revoked for _ in range(100_000))
+    print(f"filter false positives: {false_positives / 1000:.3f}%")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,53 @@
+"""
+Memory held by idle live tracking connections and the cost of handing an
+event to them, without Redis or sockets: each connection is a subscription
+with a task waiting for its next event, as the SSE and WebSocket streams do.
+
+Run from the backend directory:
+
+    python -m benchmarks.tracking_stream
+"""
+
+import asyncio
+import tracemalloc
+from time import perf_counter
+from uuid import uuid4
+
+from app.services import stream
+
+CONNECTIONS = 20_000
+EVENTS = 100_000
+
+
+async def main():
+    shipments = [str(uuid4()) for _ in range(CONNECTIONS)]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    subscriptions = []
+    waiting = []
+    for id in shipments:
+        subscription = stream.Subscription()
+        subscription.follow(id)
+        subscriptions.append(subscription)
+        waiting.append(asyncio.create_task(subscription.next()))
+    await asyncio.sleep(0)
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"{CONNECTIONS} idle connections: {held / CONNECTIONS:,.0f} bytes each")
+
+    event = '{"status": "in_transit", "location": 560001}'
+    start = perf_counter()
+    for index in range(EVENTS):
+        stream._dispatch(f"{shipments[index % CONNECTIONS]}|{event}")
+    elapsed = perf_counter() - start
+    print(f"{EVENTS} events dispatched: {elapsed / EVENTS * 1e6:.2f} us each")
+
+    for task in waiting:
+        task.cancel()
+    for subscription in subscriptions:
+        subscription.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
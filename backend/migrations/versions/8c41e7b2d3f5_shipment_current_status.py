@@ -0,0 +1,59 @@
+"""shipment_current_status
+
+Revision ID: 8c41e7b2d3f5
+Revises: 5d2a7f3e1b90
+Create Date: 2026-10-18 13:41:52.660127
+
+"""
+from typing import Sequence, Union
+
+import sqlmodel
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '8c41e7b2d3f5'
+down_revision: Union[str, Sequence[str], None] = '5d2a7f3e1b90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The shipmentstatus enum type already exists for shipment_event.status
+    shipment_status = postgresql.ENUM('placed', 'in_transit', 'out_for_delivery', 'delivered', 'cancelled', name='shipmentstatus', create_type=False)
+
+    op.add_column('shipment', sa.Column('status', shipment_status, nullable=True))
+    op.add_column('shipment', sa.Column('last_event_at', postgresql.TIMESTAMP(), nullable=True))
+    op.add_column('shipment', sa.Column('last_location', sa.Integer(), nullable=True))
+
+    # Backfill from the latest event of each shipment
+    op.execute(
+        """
+        UPDATE shipment
+        SET status = latest.status,
+            last_event_at = latest.created_at,
+            last_location = latest.location
+        FROM (
+            SELECT DISTINCT ON (shipment_id) shipment_id, status, created_at, location
+            FROM shipment_event
+            ORDER BY shipment_id, created_at DESC
+        ) AS latest
+        WHERE latest.shipment_id = shipment.id
+        """
+    )
+    op.execute("UPDATE shipment SET status = 'placed' WHERE status IS NULL")
+    op.alter_column('shipment', 'status', nullable=False)
+
+    op.create_index('ix_shipment_seller_id_status', 'shipment', ['seller_id', 'status'], unique=False)
+    op.create_index('ix_shipment_delivery_partner_id_status', 'shipment', ['delivery_partner_id', 'status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_shipment_delivery_partner_id_status', table_name='shipment')
+    op.drop_index('ix_shipment_seller_id_status', table_name='shipment')
+    op.drop_column('shipment', 'last_location')
+    op.drop_column('shipment', 'last_event_at')
+    op.drop_column('shipment', 'status')
@@ -0,0 +1,46 @@
+"""partner_active_shipment_count
+
+Revision ID: b81e4d0c9a27
+Revises: 3f9c2a1d7e64
+Create Date: 2026-10-18 11:03:17.582946
+
+"""
+from typing import Sequence, Union
+
+import sqlmodel
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b81e4d0c9a27'
+down_revision: Union[str, Sequence[str], None] = '3f9c2a1d7e64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('delivery_partner', sa.Column('active_shipment_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill with the shipments that have neither been delivered nor cancelled
+    op.execute(
+        """
+        UPDATE delivery_partner
+        SET active_shipment_count = (
+            SELECT count(*)
+            FROM shipment
+            WHERE shipment.delivery_partner_id = delivery_partner.id
+            AND NOT EXISTS (
+                SELECT 1 FROM shipment_event
+                WHERE shipment_event.shipment_id = shipment.id
+                AND shipment_event.status IN ('delivered', 'cancelled')
+            )
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('delivery_partner', 'active_shipment_count')
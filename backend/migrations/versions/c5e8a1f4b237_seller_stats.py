@@ -0,0 +1,82 @@
+"""seller_stats
+
+Revision ID: c5e8a1f4b237
+Revises: a4f6c2e9d815
+Create Date: 2026-10-18 17:24:09.318652
+
+"""
+from typing import Sequence, Union
+
+import sqlmodel
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e8a1f4b237'
+down_revision: Union[str, Sequence[str], None] = 'a4f6c2e9d815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The shipmentstatus enum type already exists for shipment_event.status
+    shipment_status = postgresql.ENUM('placed', 'in_transit', 'out_for_delivery', 'delivered', 'cancelled', name='shipmentstatus', create_type=False)
+
+    op.create_table('seller_status_count',
+    sa.Column('seller_id', sa.Uuid(), nullable=False),
+    sa.Column('status', shipment_status, nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['seller_id'], ['seller.id'], ),
+    sa.PrimaryKeyConstraint('seller_id', 'status')
+    )
+    op.create_table('seller_daily_count',
+    sa.Column('seller_id', sa.Uuid(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('status', shipment_status, nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('on_time', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['seller_id'], ['seller.id'], ),
+    sa.PrimaryKeyConstraint('seller_id', 'day', 'status')
+    )
+
+    # Backfill, the counters are only ever incremented from here on
+    op.execute(
+        """
+        INSERT INTO seller_status_count (seller_id, status, count)
+        SELECT seller_id, status, count(*)
+        FROM shipment
+        GROUP BY seller_id, status
+        """
+    )
+    # Events moving a shipment to a new status, like SellerStatsService.record
+    # counts them. Imported shipments starting past placed are left out
+    op.execute(
+        """
+        INSERT INTO seller_daily_count (seller_id, day, status, count, on_time)
+        SELECT shipment.seller_id,
+               CAST(event.created_at AS DATE),
+               event.status,
+               count(*),
+               count(*) FILTER (
+                   WHERE event.status = 'delivered'
+                   AND event.created_at <= shipment.estimated_delivery
+               )
+        FROM (
+            SELECT shipment_id, status, created_at,
+                   lag(status) OVER (PARTITION BY shipment_id ORDER BY created_at) AS previous
+            FROM shipment_event
+        ) AS event
+        JOIN shipment ON shipment.id = event.shipment_id
+        WHERE event.previous IS DISTINCT FROM event.status
+        AND (event.previous IS NOT NULL OR event.status = 'placed')
+        GROUP BY shipment.seller_id, CAST(event.created_at AS DATE), event.status
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('seller_daily_count')
+    op.drop_table('seller_status_count')
@@ -0,0 +1,78 @@
+"""partner_stats
+
+Revision ID: d7b3f9e2a618
+Revises: c5e8a1f4b237
+Create Date: 2026-10-18 18:05:36.742190
+
+"""
+from typing import Sequence, Union
+
+import sqlmodel
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7b3f9e2a618'
+down_revision: Union[str, Sequence[str], None] = 'c5e8a1f4b237'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('partner_stats',
+    sa.Column('partner_id', sa.Uuid(), nullable=False),
+    sa.Column('review_count', sa.Integer(), nullable=False),
+    sa.Column('rating_total', sa.Integer(), nullable=False),
+    sa.Column('delivered', sa.Integer(), nullable=False),
+    sa.Column('delivered_on_time', sa.Integer(), nullable=False),
+    sa.Column('delivery_seconds', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['partner_id'], ['delivery_partner.id'], ),
+    sa.PrimaryKeyConstraint('partner_id')
+    )
+
+    # Backfill, the rollups are only ever incremented from here on. Deliveries
+    # are events moving a shipment to delivered from another status, like
+    # ShipmentEventService records them, imported ones start delivered.
+    op.execute(
+        """
+        INSERT INTO partner_stats (
+            partner_id, review_count, rating_total,
+            delivered, delivered_on_time, delivery_seconds
+        )
+        SELECT delivery_partner.id,
+               coalesce(review.count, 0),
+               coalesce(review.total, 0),
+               coalesce(delivery.count, 0),
+               coalesce(delivery.on_time, 0),
+               coalesce(delivery.seconds, 0)
+        FROM delivery_partner
+        LEFT JOIN (
+            SELECT shipment.delivery_partner_id, count(*) AS count, sum(reviews.rating) AS total
+            FROM reviews
+            JOIN shipment ON shipment.id = reviews.shipment_id
+            GROUP BY shipment.delivery_partner_id
+        ) AS review ON review.delivery_partner_id = delivery_partner.id
+        LEFT JOIN (
+            SELECT shipment.delivery_partner_id,
+                   count(*) AS count,
+                   count(*) FILTER (WHERE event.created_at <= shipment.estimated_delivery) AS on_time,
+                   sum(EXTRACT(EPOCH FROM event.created_at - shipment.created_at)) AS seconds
+            FROM (
+                SELECT shipment_id, status, created_at,
+                       lag(status) OVER (PARTITION BY shipment_id ORDER BY created_at) AS previous
+                FROM shipment_event
+            ) AS event
+            JOIN shipment ON shipment.id = event.shipment_id
+            WHERE event.status = 'delivered' AND event.previous <> 'delivered'
+            GROUP BY shipment.delivery_partner_id
+        ) AS delivery ON delivery.delivery_partner_id = delivery_partner.id
+        WHERE review.count IS NOT NULL OR delivery.count IS NOT NULL
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('partner_stats')